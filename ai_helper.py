@@ -1,37 +1,134 @@
 # ai_helper.py
 # https://platform.openai.com/docs/models
+# Requests go through a backend from llm_backends (OpenAI by default; see DUNGEONGPT_BACKEND).
 
-from openai import OpenAI
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
+from llm_backends import get_backend
+from response_cache import ResponseCache
 
 load_dotenv()  # This will load environment variables from the .env file
 
-# Create an OpenAI client instance
-# Ensure you've set your OpenAI API key
-client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),  # This is the default and can be omitted
-)
+# Optional on-disk response cache. Off unless enabled, e.g. with DUNGEONGPT_RESPONSE_CACHE=cache/responses
+response_cache = None
 
-# Send prompts with GPT4o and 4o-mini
-def send_prompt(prompt, model="gpt-4o-mini", max_tokens=1500, temperature=0.7,
-                role_description="You are a dungeon master. You will create content text only."):
-    # Make the chat completion request using the OpenAI client
-    response = client.chat.completions.create(
-        messages=[
+
+def enable_cache(directory="cache/responses", max_bytes=200 * 1024 * 1024, ttl=7 * 24 * 3600):
+    """Turn on the response cache for all calls that don't pass use_cache=False."""
+    global response_cache
+    response_cache = ResponseCache(directory, max_bytes=max_bytes, ttl=ttl)
+    return response_cache
+
+
+def disable_cache():
+    global response_cache
+    response_cache = None
+
+
+def cache_stats():
+    """Return the response cache's hit/miss counters, or None if the cache is off."""
+    return response_cache.stats() if response_cache else None
+
+
+if os.environ.get("DUNGEONGPT_RESPONSE_CACHE"):
+    enable_cache(os.environ["DUNGEONGPT_RESPONSE_CACHE"])
+
+
+def build_messages(prompt, role_description):
+    """Turn a prompt into a chat message list.
+
+    prompt is either a string (sent as one user message after the system role) or a list of
+    {"role", "content"} messages. A message list that does not start with a system message gets
+    role_description prepended.
+    """
+    if isinstance(prompt, str):
+        return [
             {"role": "system", "content": role_description},
             {"role": "user", "content": prompt},
-        ],
-        model=model,
-        max_tokens=max_tokens,
-        temperature=temperature,
-    )
+        ]
+    if prompt and prompt[0]["role"] == "system":
+        return list(prompt)
+    return [{"role": "system", "content": role_description}] + list(prompt)
+
+
+# Send prompts with GPT4o and 4o-mini.
+# response_format (e.g. a JSON schema) is passed to backends that support it and ignored by the rest.
+def send_prompt(prompt, model="gpt-4o-mini", max_tokens=1500, temperature=0.7,
+                role_description="You are a dungeon master. You will create content text only.",
+                on_usage=None, use_cache=True, backend=None, timeout=None, response_format=None):
+    messages = build_messages(prompt, role_description)
+    llm = get_backend(backend)
+
+    # Serve repeated requests from the response cache (cache hits cost no tokens, so on_usage is not called)
+    cache_key = None
+    if response_cache and use_cache:
+        extra = {"response_format": response_format} if response_format else {}
+        cache_key = ResponseCache.make_key(messages, model, temperature, max_tokens, backend=llm.name, **extra)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    # Make the chat completion request; on_usage receives prompt, cached and completion token counts
+    content = llm.complete(messages, model=model, max_tokens=max_tokens, temperature=temperature,
+                           on_usage=on_usage, timeout=timeout, response_format=response_format)
 
     # print("model used: ", model)
 
-    # Extract the generated text from the response
-    content = response.choices[0].message.content
+    if cache_key:
+        response_cache.put(cache_key, content, model=model)
 
     return content
 
+
+# Stream a completion, yielding text deltas as they arrive
+def stream_prompt(prompt, model="gpt-4o-mini", max_tokens=1500, temperature=0.7,
+                  role_description="You are a dungeon master. You will create content text only.",
+                  on_usage=None, use_cache=True, backend=None, timeout=None, response_format=None, cancel=None):
+    messages = build_messages(prompt, role_description)
+    llm = get_backend(backend)
+
+    # A cached response is replayed as a single delta
+    cache_key = None
+    if response_cache and use_cache:
+        extra = {"response_format": response_format} if response_format else {}
+        cache_key = ResponseCache.make_key(messages, model, temperature, max_tokens, backend=llm.name, **extra)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+    parts = []
+    for delta in llm.stream(messages, model=model, max_tokens=max_tokens, temperature=temperature,
+                            on_usage=on_usage, timeout=timeout, response_format=response_format, cancel=cancel):
+        parts.append(delta)
+        yield delta
+
+    # Only complete streams are cached
+    if cache_key:
+        response_cache.put(cache_key, "".join(parts), model=model)
+
+
+# Async version of stream_prompt for code running on an asyncio event loop (see campaign_server.py)
+async def astream_prompt(prompt, model="gpt-4o-mini", max_tokens=1500, temperature=0.7,
+                         role_description="You are a dungeon master. You will create content text only.",
+                         on_usage=None, use_cache=True, backend=None, timeout=None, response_format=None):
+    messages = build_messages(prompt, role_description)
+    llm = get_backend(backend)
+
+    cache_key = None
+    if response_cache and use_cache:
+        extra = {"response_format": response_format} if response_format else {}
+        cache_key = ResponseCache.make_key(messages, model, temperature, max_tokens, backend=llm.name, **extra)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+    parts = []
+    async for delta in llm.astream(messages, model=model, max_tokens=max_tokens, temperature=temperature,
+                                   on_usage=on_usage, timeout=timeout, response_format=response_format):
+        parts.append(delta)
+        yield delta
+
+    if cache_key:
+        response_cache.put(cache_key, "".join(parts), model=model)
@@ -0,0 +1,120 @@
+# asset_cache.py
+# One place to get resized images for the UI. Thumbnails are stored on disk keyed by
+# (path, mtime, size), so an image is decoded and resized once, not on every launch or redraw.
+# Decoding runs on the TaskRunner's worker threads; the Tk PhotoImage objects are created on the Tk
+# thread and kept in an in-memory LRU shared by every tab.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from task_runner import get_task_runner
+
+
+class AssetCache:
+    def __init__(self, task_runner, directory="cache/thumbnails", max_photos=256):
+        self.task_runner = task_runner
+        self.directory = directory
+        self.max_photos = max_photos
+
+        self._photos = OrderedDict()  # (path, mtime, size) -> PhotoImage, most recently used last
+        self._waiting = {}            # key -> callbacks waiting for a decode already in progress
+        self._disk_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(path, size):
+        """Cache key for an image at a given size, or None if the file doesn't exist."""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        return (os.path.abspath(path), mtime, tuple(size) if size else None)
+
+    def thumbnail_path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + ".png")
+
+    def get_photo(self, path, size, callback):
+        """Call callback(photo) on the Tk thread with the image resized to size (None = full size).
+
+        callback gets None if the image can't be loaded. If the image is already in memory the
+        callback runs immediately; otherwise it runs once a worker has decoded the image.
+        """
+        key = self.make_key(path, size)
+        if key is None:
+            callback(None)
+            return
+
+        photo = self._photos.get(key)
+        if photo is not None:
+            self._photos.move_to_end(key)
+            callback(photo)
+            return
+
+        # Several widgets often want the same picture; decode it once
+        if key in self._waiting:
+            self._waiting[key].append(callback)
+            return
+        self._waiting[key] = [callback]
+        self.task_runner.submit(
+            self.load_image, path, key,
+            on_done=lambda image: self._on_loaded(key, image),
+            on_error=lambda e: self._on_failed(key, path, e),
+        )
+
+    def load_image(self, path, key):
+        """Return a PIL image at the requested size, from the disk cache if possible (worker thread)."""
+        from PIL import Image
+
+        size = key[2]
+        if size is None:
+            image = Image.open(path)
+            image.load()
+            return image
+
+        thumb_path = self.thumbnail_path(key)
+        if os.path.exists(thumb_path):
+            try:
+                image = Image.open(thumb_path)
+                image.load()
+                return image
+            except Exception:
+                pass  # Damaged thumbnail; regenerate it below
+
+        image = Image.open(path)
+        image = image.resize(size)
+        with self._disk_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = thumb_path + ".tmp"
+            image.save(tmp_path, format="PNG")
+            os.replace(tmp_path, thumb_path)
+        return image
+
+    def _on_loaded(self, key, image):
+        from PIL import ImageTk
+
+        photo = ImageTk.PhotoImage(image)
+        self._photos[key] = photo
+        while len(self._photos) > self.max_photos:
+            self._photos.popitem(last=False)
+        for callback in self._waiting.pop(key, []):
+            callback(photo)
+
+    def _on_failed(self, key, path, e):
+        print(f"Error loading image {path}: {e}")
+        for callback in self._waiting.pop(key, []):
+            callback(None)
+
+    def clear_memory(self):
+        self._photos.clear()
+
+
+def get_asset_cache(widget):
+    """Return the AssetCache shared by every tab under widget's toplevel window."""
+    root = widget.winfo_toplevel()
+    cache = getattr(root, "_asset_cache", None)
+    if cache is None:
+        cache = AssetCache(get_task_runner(root))
+        root._asset_cache = cache
+    return cache
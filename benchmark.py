@@ -0,0 +1,300 @@
+# benchmark.py
+# Times the app's hot paths on synthetic campaigns, against the offline fake backend.
+# Campaigns (100 to 50,000 turns) and character folders (10 to 10,000 characters) are generated in
+# a temporary directory in the normal saves/ and characters/ formats. Each benchmark reports the
+# median wall time, peak traced memory and net allocated blocks, and results can be stored as a
+# baseline and compared against later to catch regressions.
+#
+#   python benchmark.py                              # quick sizes
+#   python benchmark.py --full                       # 100..50,000 turns, 10..10,000 characters
+#   python benchmark.py --save-baseline benchmark_baseline.json
+#   python benchmark.py --compare benchmark_baseline.json --tolerance 0.25
+#
+# The Tk benchmarks (party grid, full load_existing_game) are skipped when there is no display.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from campaign_engine import DEFAULT_SETTINGS, CampaignEngine
+from character_catalogue import CharacterCatalogue
+from character_sheet import ALIGNMENT_OPTIONS, CLASS_OPTIONS, PROFILE_PICS, RACE_OPTIONS, STAT_NAMES
+from chat_journal import journal_path
+from llm_backends import FakeBackend, register_backend
+from persistence import get_write_behind
+
+QUICK_TURNS = [100, 5000]
+QUICK_CHARACTERS = [10, 1000]
+FULL_TURNS = [100, 1000, 10000, 50000]
+FULL_CHARACTERS = [10, 100, 1000, 10000]
+
+WORDS = ("the", "party", "torch", "shadow", "ancient", "door", "creaks", "goblin", "whispers", "gold",
+         "tavern", "road", "storm", "ruins", "a", "of", "and", "beneath", "glimmers", "dragon", "sword",
+         "we", "search", "open", "cast", "spell", "north", "river", "merchant", "cave")
+
+
+# Synthetic data
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_characters(char_path, count, seed=0):
+    """Write count character files in the save_character format; returns their paths."""
+    rng = random.Random(seed)
+    os.makedirs(char_path, exist_ok=True)
+    paths = []
+    for i in range(count):
+        char_class = rng.choice(CLASS_OPTIONS)
+        character = {
+            "name": f"{sentence(rng, 2)[:-1].title()} {i}",
+            "gender": rng.choice(["Male", "Female"]),
+            "race": rng.choice(RACE_OPTIONS),
+            "class": char_class,
+            "level": rng.randint(1, 20),
+            "alignment": rng.choice(ALIGNMENT_OPTIONS),
+            "background": sentence(rng, 30),
+            "stats": {stat: rng.randint(3, 18) for stat in STAT_NAMES},
+            "profile_pic": rng.choice(PROFILE_PICS),
+        }
+        path = os.path.join(char_path, f"{character['name']}_Level_{character['level']}_{char_class}.json")
+        with open(path, "w") as f:
+            json.dump(character, f)
+        paths.append(path)
+    return paths
+
+
+def make_campaign(saves_dir, party_members, turns, seed=0):
+    """Write a save file plus its chat journal and _chat.json snapshot; returns the save file path."""
+    rng = random.Random(seed)
+    os.makedirs(saves_dir, exist_ok=True)
+    base = os.path.join(saves_dir, f"game_synthetic_{turns}")
+    chat_file = base + "_chat.json"
+    settings = dict(DEFAULT_SETTINGS, backend="bench")
+
+    entries = [{"id": i, "user": sentence(rng, 12), "response": sentence(rng, 120)} for i in range(1, turns + 1)]
+    with open(journal_path(chat_file), "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+    with open(chat_file, "w", encoding="utf-8") as f:
+        json.dump({"last_saved_index": turns, "conversation_history": entries}, f, indent=4)
+    with open(base + ".json", "w") as f:
+        json.dump({"party_members": party_members, "settings": settings, "chat_file": chat_file}, f, indent=4)
+    return base + ".json"
+
+
+# Measurement
+
+def measure(func, setup=None, repeat=5, number=1):
+    """Median seconds per call over repeat runs, then one traced run for peak memory and net blocks.
+
+    setup() is called before every run (untimed) and its result is passed to func.
+    """
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):  # the code under test prints progress
+        for _ in range(repeat):
+            arg = setup() if setup else None
+            t0 = time.perf_counter()
+            for _ in range(number):
+                func(arg)
+            times.append((time.perf_counter() - t0) / number)
+
+        arg = setup() if setup else None
+        blocks_before = sys.getallocatedblocks()
+        tracemalloc.start()
+        try:
+            func(arg)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        blocks = sys.getallocatedblocks() - blocks_before
+    return {"ms": statistics.median(times) * 1000, "peak_kb": peak / 1024, "net_blocks": blocks}
+
+
+class BenchmarkSuite:
+    def __init__(self, workdir, turns, characters, repeat=5):
+        self.workdir = workdir
+        self.turns = turns
+        self.characters = characters
+        self.repeat = repeat
+        self.results = {}  # "name[size]" -> measurement
+        register_backend("bench", FakeBackend(reply_words=120))
+
+    def record(self, name, size, result):
+        key = f"{name}[{size}]"
+        self.results[key] = result
+        print(f"  {key:<48} {result['ms']:10.3f} ms  {result['peak_kb']:10.1f} KiB peak  "
+              f"{result['net_blocks']:+8d} blocks")
+
+    def run(self):
+        party_dir = os.path.join(self.workdir, "party")
+        party = make_characters(party_dir, 4, seed=1)
+        for turns in self.turns:
+            print(f"Campaign with {turns} turns")
+            save_file = make_campaign(os.path.join(self.workdir, "saves"), party, turns)
+            self.bench_campaign(save_file, f"turns={turns}")
+        for count in self.characters:
+            print(f"Character folder with {count} characters")
+            char_path = os.path.join(self.workdir, f"characters_{count}")
+            make_characters(char_path, count)
+            self.bench_characters(char_path, f"characters={count}")
+        self.bench_tk()
+        return self.results
+
+    def bench_campaign(self, save_file, size):
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine = CampaignEngine.from_save_file(save_file)
+        entries = list(engine.conversation_history)
+
+        self.record("load_existing_game (read)", size, measure(
+            lambda _: CampaignEngine.from_save_file(save_file), repeat=self.repeat))
+        self.record("load_conversation", size, measure(
+            lambda _: engine.load_conversation(entries), repeat=self.repeat))
+        self.record("prepare_prompt", size, measure(
+            lambda _: engine.prepare_prompt("I search the room for traps."), repeat=self.repeat, number=50))
+        self.record("get_recent_history", size, measure(
+            lambda _: engine.get_recent_history(), repeat=self.repeat, number=50))
+
+        def add_turn(_):
+            engine.record_turn("I open the door.", "The door creaks open.")
+            engine.save_chat_history()
+        self.record("save_chat_history", size, measure(add_turn, repeat=self.repeat, number=20))
+
+        self.record("play_turn (fake backend)", size, measure(
+            lambda _: engine.play_turn("We press on."), repeat=self.repeat))
+        engine.close()
+
+    def bench_characters(self, char_path, size):
+        index_file = os.path.join(self.workdir, "character_index.json")
+
+        def cold_catalogue():
+            get_write_behind().flush()
+            if os.path.exists(index_file):
+                os.remove(index_file)
+            return CharacterCatalogue(char_path, index_file=index_file)
+        self.record("load_characters_to_grid (cold)", size, measure(
+            lambda catalogue: catalogue.refresh(), setup=cold_catalogue, repeat=self.repeat))
+        def warm_catalogue():
+            get_write_behind().flush()  # The index is written in the background
+            return CharacterCatalogue(char_path, index_file=index_file)
+        self.record("load_characters_to_grid (warm)", size, measure(
+            lambda catalogue: catalogue.refresh(), setup=warm_catalogue, repeat=self.repeat))
+
+    def bench_tk(self):
+        """The Tk paths, end to end. Skipped without a display."""
+        try:
+            import tkinter as tk
+            root = tk.Tk()
+        except Exception as e:
+            print(f"Skipping Tk benchmarks: {e}")
+            return
+        root.withdraw()
+
+        # The chat tab indexes campaigns for search and logs turn metrics; keep both out of the user's cache/
+        os.environ["DUNGEONGPT_SEARCH_INDEX"] = os.path.join(self.workdir, "search", "history.db")
+        os.environ["DUNGEONGPT_METRICS_FILE"] = os.path.join(self.workdir, "metrics", "turns.jsonl")
+        from main import DungeonGPT
+        from party_selection import PartySelectionUI
+
+        def pump_until(condition, timeout=120):
+            deadline = time.perf_counter() + timeout
+            while not condition() and time.perf_counter() < deadline:
+                root.update()
+                time.sleep(0.001)
+
+        for count in self.characters:
+            char_path = os.path.join(self.workdir, f"characters_{count}")
+
+            def build_grid(_):
+                frame = tk.Frame(root)
+                ui = PartySelectionUI(frame, char_path=char_path)
+                pump_until(lambda: len(ui.search_text) >= count)
+                root.update_idletasks()
+                frame.destroy()
+            self.record("PartySelectionUI grid (Tk)", f"characters={count}", measure(build_grid, repeat=self.repeat))
+
+        app = DungeonGPT(root)
+
+        def close_game():
+            """Untimed: wait for the chat tab's background indexing, then close the game and its engine."""
+            if app.chat_interface_ui is not None:
+                app.chat_interface_ui.engine.index_turns()  # Waits for the indexing already under way
+                app.close_engine(app.close_chat_interface())
+                root.update()
+
+        for turns in self.turns:
+            save_file = os.path.join(self.workdir, "saves", f"game_synthetic_{turns}.json")
+
+            def load_game(_):
+                app.open_saved_game(app.read_saved_game(save_file))
+                root.update_idletasks()
+            self.record("load_existing_game (Tk)", f"turns={turns}",
+                        measure(load_game, setup=close_game, repeat=self.repeat))
+        close_game()
+        get_write_behind().flush()
+        root.destroy()
+
+
+# Differences below these are treated as noise, however large in relative terms
+MIN_DIFFERENCE = {"ms": 0.5, "peak_kb": 64}
+
+
+def compare(results, baseline, tolerance):
+    """Print regressions against a baseline; returns the number found."""
+    regressions = 0
+    for key, result in sorted(results.items()):
+        base = baseline.get(key)
+        if not base:
+            continue
+        for metric, min_difference in MIN_DIFFERENCE.items():
+            if (base[metric] > 0 and result[metric] > base[metric] * (1 + tolerance)
+                    and result[metric] - base[metric] >= min_difference):
+                regressions += 1
+                print(f"REGRESSION {key} {metric}: {result[metric]:.3f} vs baseline {base[metric]:.3f} "
+                      f"(+{result[metric] / base[metric] - 1:.0%})")
+    if not regressions:
+        print(f"No regressions beyond {tolerance:.0%} of the baseline")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark DungeonGPT's hot paths on synthetic campaigns.")
+    parser.add_argument("--full", action="store_true", help="run every size (up to 50,000 turns and 10,000 characters)")
+    parser.add_argument("--turns", type=int, nargs="+", help="campaign sizes to generate")
+    parser.add_argument("--characters", type=int, nargs="+", help="character folder sizes to generate")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark (the median is reported)")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--save-baseline", metavar="FILE", help="store the results as the baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare against a stored baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a regression (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    turns = args.turns or (FULL_TURNS if args.full else QUICK_TURNS)
+    characters = args.characters or (FULL_CHARACTERS if args.full else QUICK_CHARACTERS)
+
+    with tempfile.TemporaryDirectory(prefix="dungeongpt_bench_") as workdir:
+        results = BenchmarkSuite(workdir, turns, characters, repeat=args.repeat).run()
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            print(f"Results written to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare(results, baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,507 @@
+# campaign_engine.py
+# The game session without the UI: the party, settings and history of one campaign, prompt
+# building, calling the Dungeon Master and persisting turns. ChatInterfaceUI drives an engine from
+# the Tk thread; run_campaign.py drives one from the command line with no display at all.
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from ai_helper import stream_prompt
+from llm_backends import StreamCancelled
+from campaign_store import campaign_id_for, get_store
+from chapter_memory import ChapterMemory
+from chat_journal import ChatJournal, iter_chat_history
+from history_index import HistoryIndex
+from persistence import CHECKPOINTS, get_write_behind, load_json, write_json
+from turn_metrics import LatencyStats, TurnTrace
+from turn_retrieval import render_retrieved, retrieve_turns
+from usage_ledger import Budget, UsageLedger, usage_path
+
+# The settings SettingsUI starts with
+DEFAULT_SETTINGS = {
+    "difficulty": "Medium",
+    "length": "Medium",
+    "permadeath": False,
+    "narrative_style": "Balanced",
+    "interaction_level": "Balanced",
+}
+
+# What happens to a message sent while the previous turn is still being answered:
+#   replace - cancel the turn in flight (and anything queued) and play the new message instead
+#   append  - cancel the turn in flight and play its message and the new one together as one turn
+#   queue   - let the turn finish, then play the new message as the next turn
+SUBMIT_POLICIES = ("replace", "append", "queue")
+
+
+class TurnCancelled(Exception):
+    """Raised by CampaignEngine.stream_reply when the turn is cancelled; the partial reply is discarded."""
+
+
+def submit_policy(value=None):
+    """A submit policy, defaulting to DUNGEONGPT_SUBMIT_POLICY and then "replace"."""
+    policy = (value or os.environ.get("DUNGEONGPT_SUBMIT_POLICY") or "replace").strip().lower()
+    if policy not in SUBMIT_POLICIES:
+        raise ValueError(f"Unknown submit policy {policy!r}, expected one of {', '.join(SUBMIT_POLICIES)}")
+    return policy
+
+
+def coalesce_messages(policy, in_flight, queued, message):
+    """Apply a submit policy to a message sent while in_flight is being answered.
+
+    Returns (message to play now or None, messages still queued, whether to cancel the turn in flight).
+    """
+    if policy == "queue":
+        return None, queued + [message], False
+    if policy == "append":
+        return "\n".join([in_flight] + queued + [message]), [], True
+    return message, [], True
+
+
+def load_party_data(party_members):
+    """Load the character sheets for a list of character file paths, skipping unreadable ones."""
+    store = get_store()
+    party_data = []
+    for character_file in party_members:
+        try:
+            character = store.get_character(os.path.basename(character_file)) if store else None
+            if character is None:
+                with open(character_file, "r") as f:
+                    character = json.load(f)
+            party_data.append(character)
+        except Exception as e:
+            print(f"Error loading character: {e}")
+    return party_data
+
+
+def read_save_file(save_file):
+    """Return (party_members, settings, chat_file) from the campaign store or a save file."""
+    store = get_store()
+    campaign = store.get_campaign(campaign_id_for(save_file)) if store else None
+    if campaign is not None:
+        return campaign
+    save_data = load_json(save_file)
+    return save_data.get("party_members", []), save_data.get("settings", {}), save_data.get("chat_file", None)
+
+
+def iter_campaign_history(chat_file):
+    """Yield a campaign's turns from the campaign store if it holds the campaign, else from its chat files."""
+    store = get_store()
+    campaign_id = campaign_id_for(chat_file)
+    if store is not None and store.get_campaign(campaign_id) is not None:
+        return store.iter_turns(campaign_id)
+    return iter_chat_history(chat_file)
+
+
+def register_campaign(save_file, save_data):
+    """Add a new save to the campaign store, if one is enabled."""
+    store = get_store()
+    if store is not None:
+        store.put_campaign(campaign_id_for(save_file), save_data.get("party_members", []),
+                           save_data.get("settings", {}), save_data.get("chat_file"))
+
+
+def create_save_file(party_members, settings, saves_dir="saves"):
+    """Write a new save file in the format SettingsUI.save_game uses and return its path."""
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    base_filename = os.path.join(saves_dir, f"game_{timestamp}")
+    suffix = 1
+    while os.path.exists(f"{base_filename}.json"):  # Several headless runs can start in the same second
+        suffix += 1
+        base_filename = os.path.join(saves_dir, f"game_{timestamp}_{suffix}")
+
+    save_file = f"{base_filename}.json"
+    save_data = {
+        "party_members": list(party_members),
+        "settings": dict(settings),
+        "chat_file": f"{base_filename}_chat.json",
+    }
+    write_json(save_file, save_data, checkpoints=CHECKPOINTS)
+    register_campaign(save_file, save_data)
+    return save_file
+
+
+class CampaignEngine:
+    HISTORY_TOKENS = 15000  # Token budget for recent turns in the prompt
+    NON_PROMPT_SETTINGS = ("backend", "turn_budget", "campaign_budget")  # App settings the Dungeon Master doesn't need to see
+    MODEL = "gpt-4o"
+    MAX_TOKENS = 16384
+    TEMPERATURE = 0.7
+    UNSUMMARISED_CHAPTERS = 2  # Chapters the window may reach back past its budget while summaries catch up
+    RETRIEVAL_TOKENS = 1000  # Token budget for relevant older turns pulled back into the prompt
+    RETRIEVAL_TURNS = 4      # ...and at most this many of them
+
+    def __init__(self, party_members, settings, chat_file, backend=None):
+        self.party_members = party_members  # List of selected character file paths
+        self.settings = settings
+        self.backend = backend or settings.get("backend")  # LLM backend for this session (None = default)
+        self.chat_file = chat_file
+        self.campaign_id = campaign_id_for(chat_file) if chat_file else None
+        self.party_data = load_party_data(party_members)
+
+        self.conversation_history = []  # Stores all messages as {id, user, response}
+        self.history_index = HistoryIndex(model=self.MODEL)  # Token costs and chat messages per turn
+        self.system_prompt = self.build_system_prompt()  # Settings and party never change during a session
+        self._system_tokens = None  # Token count of the system prompt, counted on first use
+        self.ledger = UsageLedger(usage_path(chat_file) if chat_file else None)  # Tokens and cost of every call
+        self.budget = Budget.from_settings(settings)
+        self.history_tokens = self.HISTORY_TOKENS  # History window of the last planned turn
+        self.memory = ChapterMemory(chat_file, backend=self.backend,  # Summaries of turns older than the history window
+                                    on_usage=lambda usage: self.ledger.record(usage, "summary"))
+        self.message_counter = 1  # Tracks the current message ID
+        self._save_lock = threading.Lock()  # Background saves must not interleave
+        self.journal = None  # Append-only chat journal, opened on first save
+        self.store = get_store()  # With the campaign store enabled, turns are saved there instead
+        self.stored_turn_id = None  # ID of the last turn in the store, read on first save
+        self.search_index = None  # HistorySearch that saved turns are added to and older turns retrieved from
+        self.prompt_tokens_total = 0  # Prompt-cache accounting for this session
+        self.cached_tokens_total = 0
+        self.metrics = None  # MetricsLog that finished turn traces are written to, if any
+        self.latency = LatencyStats()  # Per-stage latencies over this session
+
+    @classmethod
+    def from_save_file(cls, save_file, backend=None):
+        """Open a saved game, including its chat history."""
+        party_members, settings, chat_file = read_save_file(save_file)
+        engine = cls(party_members, settings, chat_file, backend=backend)
+        if chat_file:
+            engine.load_conversation(iter_campaign_history(chat_file))
+        return engine
+
+    def build_system_prompt(self):
+        """Render the DM role, game settings and party sheets.
+
+        This block is identical on every turn of a session (keys are sorted, nothing time-dependent),
+        so it forms a stable prefix that the provider's prompt cache can reuse.
+        """
+        lines = [
+            "You are an expert dungeon master.",
+            "",
+            "Game Settings:",
+            json.dumps({k: v for k, v in self.settings.items() if k not in self.NON_PROMPT_SETTINGS},
+                       sort_keys=True, indent=2),
+            "",
+            "Party Members:",
+        ]
+        for character in self.party_data:
+            lines.append(
+                f"- {character['name']} (Level {character['level']} {character.get('race', '')} "
+                f"{character['class']}, {character.get('alignment', 'Unknown alignment')})"
+            )
+            if character.get("background"):
+                lines.append(f"  Background: {character['background']}")
+            stats = character.get("stats", {})
+            if stats:
+                lines.append("  Stats: " + ", ".join(f"{name} {value}" for name, value in stats.items()))
+        return "\n".join(lines)
+
+    def prepare_prompt(self, user_message, history_tokens=None):
+        """Prepare the chat messages for OpenAI.
+
+        Layout: the stable system block, the story-so-far summaries, the recent history as real
+        user/assistant turns, older turns relevant to the message (with a search index), then the
+        new player message. The retrieved turns change every turn, so they come after the history to
+        keep the cacheable prefix intact.
+        """
+        # The history window starts at the oldest unsummarised turn, which only moves forward a whole
+        # chapter at a time, so the history prefix also stays stable between most turns. It reaches back
+        # at most UNSUMMARISED_CHAPTERS chapters past the token budget: if summaries fall further behind
+        # (or fail), the budgeted window is used as is while they catch up in the background. A window
+        # cut by the turn budget is always applied as is.
+        entries = self.history_index.entries
+        history_tokens = history_tokens or self.HISTORY_TOKENS
+        start = self.history_index.window_start(history_tokens)
+        if history_tokens >= self.HISTORY_TOKENS:
+            unsummarised = self.memory.first_unsummarised(entries)
+            if start - unsummarised <= self.UNSUMMARISED_CHAPTERS * self.memory.chapter_turns:
+                start = min(start, unsummarised)
+
+        messages = [{"role": "system", "content": self.system_prompt}]
+
+        # Summaries of everything older than the window
+        story = self.memory.render()
+        if story:
+            messages.append({"role": "system", "content": story.strip()})
+
+        messages.extend(self.history_index.messages_from(start))
+
+        if self.search_index is not None and self.campaign_id:
+            retrieved = retrieve_turns(self.search_index, self.campaign_id, self.history_index, user_message, start,
+                                       self.RETRIEVAL_TOKENS, self.RETRIEVAL_TURNS)
+            if retrieved:
+                messages.append({"role": "system", "content": render_retrieved(retrieved)})
+
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    def plan_turn(self, user_message):
+        """Pick the model, history window and reply cap for the next turn within the budgets."""
+        count_tokens = self.history_index.count_tokens
+        if self._system_tokens is None:
+            self._system_tokens = count_tokens(self.system_prompt)
+        fixed_tokens = self._system_tokens + count_tokens(self.memory.render()) + count_tokens(user_message)
+        if self.search_index is not None:
+            fixed_tokens += self.RETRIEVAL_TOKENS
+        history_tokens = min(self.HISTORY_TOKENS, self.history_index.token_prefix[-1])
+        plan = self.budget.plan(self.ledger, self.MODEL, history_tokens, self.MAX_TOKENS, fixed_tokens)
+        if plan.history_tokens < history_tokens:
+            self.history_tokens = plan.history_tokens
+        else:
+            plan = plan._replace(history_tokens=self.HISTORY_TOKENS)
+            self.history_tokens = self.HISTORY_TOKENS
+        for note in plan.notes:
+            print(f"Budget: {note}")
+        return plan
+
+    def prepare_turn(self, user_message):
+        """Plan the turn and build its prompt; returns (prompt, plan)."""
+        plan = self.plan_turn(user_message)
+        return self.prepare_prompt(user_message, plan.history_tokens), plan
+
+    def get_recent_history(self, max_tokens=15000):
+        """Return the most recent messages that fit within the token limit."""
+        return self.history_index.recent(max_tokens)
+
+    def stream_reply(self, prompt, on_delta=None, trace=None, plan=None, cancel_event=None):
+        """Stream the Dungeon Master's reply (blocking), calling on_delta(text) for each delta.
+
+        Returns the full text and the token usage. With a TurnTrace, the time to the first token and
+        the generation time after it are recorded. A TurnPlan picks the model and reply cap.
+
+        Setting cancel_event (an llm_backends.CancelToken) aborts the HTTP response at once, even
+        while waiting for the first byte, and TurnCancelled is raised. The tokens already spent are
+        still added to the ledger (estimated if the backend had not reported them yet).
+        """
+        if cancel_event is not None and cancel_event.is_set():
+            raise TurnCancelled()  # Cancelled before the request was sent
+        model = plan.model if plan else self.MODEL
+        parts = []
+        usage = {}
+        requested = time.perf_counter()
+        first_token = None
+        stream = stream_prompt(
+            prompt,
+            model=model,
+            max_tokens=plan.max_tokens if plan else self.MAX_TOKENS,
+            temperature=self.TEMPERATURE,
+            on_usage=usage.update,
+            backend=self.backend,
+            cancel=cancel_event,
+        )
+        cancelled = False
+        try:
+            for delta in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    cancelled = True
+                    break
+                if first_token is None:
+                    first_token = time.perf_counter()
+                    if trace:
+                        trace.add("ttft", first_token - requested)
+                parts.append(delta)
+                if on_delta:
+                    on_delta(delta)
+        except StreamCancelled:
+            cancelled = True
+        finally:
+            stream.close()  # A no-op once the stream is complete
+        if trace:
+            if first_token is not None:
+                trace.add("generation", time.perf_counter() - first_token)
+        if cancelled:
+            if not usage:
+                usage = self.estimate_usage(prompt, "".join(parts), model)
+            self.ledger.record(usage, "cancelled")
+            if trace:
+                trace.usage = usage
+            raise TurnCancelled()
+        if trace:
+            trace.usage = usage
+        return "".join(parts), usage
+
+    def estimate_usage(self, prompt, partial_reply, model):
+        """Usage for a request aborted before the backend reported its token counts."""
+        messages = [{"content": prompt}] if isinstance(prompt, str) else prompt
+        count = self.history_index.count_tokens
+        return {
+            "model": model,
+            "prompt_tokens": sum(count(message["content"]) for message in messages),
+            "cached_tokens": 0,
+            "completion_tokens": count(partial_reply),
+        }
+
+    def record_turn(self, message, response, usage=None):
+        """Add a completed turn to the history and return its entry."""
+        entry = {
+            "id": self.message_counter,
+            "user": message,
+            "response": response.strip()  # After receiving the DM response
+        }
+        if usage:
+            entry["usage"] = dict(usage, cost=round(self.record_usage(usage), 6))
+        self.conversation_history.append(entry)
+        self.history_index.append(entry)
+
+        # Increment for next go around
+        self.message_counter += 1
+        return entry
+
+    def record_usage(self, usage):
+        """Add a turn's usage to the ledger and track the prompt cache hit rate; returns the turn's cost."""
+        cost = self.ledger.record(usage, "turn")
+        self.prompt_tokens_total += usage.get("prompt_tokens", 0)
+        self.cached_tokens_total += usage.get("cached_tokens", 0)
+        if self.prompt_tokens_total:
+            hit_rate = self.cached_tokens_total / self.prompt_tokens_total
+            print(f"Prompt tokens: {usage.get('prompt_tokens', 0)} (cached: {usage.get('cached_tokens', 0)}), "
+                  f"session cache hit rate: {hit_rate:.0%}, turn cost ${cost:.4f}, campaign ${self.ledger.cost:.2f}")
+        return cost
+
+    def play_turn(self, message, on_delta=None):
+        """Run one whole turn synchronously: prompt, reply, record, save and summarise. Returns the entry."""
+        trace = TurnTrace(self.chat_file, self.message_counter)
+        with trace.span("prompt"):
+            prompt, plan = self.prepare_turn(message)
+        response, usage = self.stream_reply(prompt, on_delta, trace, plan)
+        entry = self.record_turn(message, response, usage)
+        with trace.span("save"):
+            self.save_chat_history()
+        self.finish_trace(trace)
+        self.update_memory()
+        return entry
+
+    def finish_trace(self, trace, status="ok"):
+        """Add a finished turn's trace to the session stats and the metrics log; returns the record."""
+        record = trace.finish(status)
+        self.latency.add(record)
+        if self.metrics:
+            self.metrics.write(record)
+        return record
+
+    def pending_chapter(self):
+        """The turns of the next chapter to summarise, or None if none is due."""
+        return self.memory.next_chapter(self.history_index.entries,
+                                        self.history_index.window_start(self.history_tokens))
+
+    def update_memory(self):
+        """Summarise every chapter that is due (blocking)."""
+        turns = self.pending_chapter()
+        while turns:
+            self.memory.set_chapters(self.memory.summarise(turns))
+            self.save_memory()
+            turns = self.pending_chapter()
+
+    def save_memory(self):
+        """Persist the summaries and the usage of the calls that made them."""
+        self.memory.save()
+        self.save_usage()
+
+    def save_usage(self):
+        try:
+            self.ledger.save()
+        except Exception as e:
+            print(f"Error saving usage ledger: {e}")
+
+    def load_conversation(self, conversation_history_in):
+        """Load a conversation history (a list of entries, or an old-style chat document)."""
+        # Extract the conversation history list
+        if isinstance(conversation_history_in, dict):
+            conversation_history = conversation_history_in.get("conversation_history", [])
+        else:
+            conversation_history = conversation_history_in
+
+        # Resume the session where it left off so new turns get fresh IDs
+        self.conversation_history = []
+        for entry in conversation_history:
+            if not isinstance(entry, dict):
+                print(f"Skipping entry in conversation history: {entry}")
+                continue
+            self.conversation_history.append(entry)
+        self.history_index = HistoryIndex(model=self.MODEL)
+        self.history_index.extend(self.conversation_history)
+        if self.conversation_history:
+            self.message_counter = max(entry.get("id", 0) for entry in self.conversation_history) + 1
+
+    def save_chat_history(self, file_path=None):
+        """Append new turns to the chat journal (or the campaign store). Safe to call from a worker thread."""
+        with self._save_lock:
+            if self.store is not None:
+                self._save_to_store(file_path or self.chat_file)
+            else:
+                self._save_chat_history(file_path or self.chat_file)
+        self.save_usage()
+        if self.search_index is not None:
+            self.index_turns(campaign_id_for(file_path or self.chat_file))
+
+    def index_turns(self, campaign_id=None):
+        """Add turns the search index doesn't have yet (all of them, the first time a campaign is indexed)."""
+        campaign_id = campaign_id or self.campaign_id
+        if self.search_index is None or not campaign_id:
+            return
+        try:
+            _, indexed_id = self.search_index.source(campaign_id)
+            self.search_index.add_turns(campaign_id, self.new_turns(indexed_id))
+        except Exception as e:
+            print(f"Error indexing turns for search: {e}")
+
+    def new_turns(self, last_id):
+        """Turns after last_id, walking back from the newest turn."""
+        new_messages = []
+        for entry in reversed(self.conversation_history):
+            if entry["id"] <= last_id:
+                break
+            new_messages.append(entry)
+        return new_messages[::-1]
+
+    def _save_chat_history(self, file_path):
+        try:
+            # Open (and if needed migrate) the append-only journal for this chat file
+            if self.journal is None or self.journal.chat_file != file_path:
+                if self.journal is not None:
+                    self.journal.close()
+                self.journal = ChatJournal(file_path)
+
+            # Append only new messages
+            new_messages = self.new_turns(self.journal.last_id)
+            if not new_messages:
+                print("No new messages to save.")
+                return
+
+            for entry in new_messages:
+                self.journal.append(entry)
+
+            print(f"Chat history saved to {self.journal.path}")
+        except Exception as e:
+            print(f"Error saving chat history: {e}")
+
+    def _save_to_store(self, file_path):
+        try:
+            campaign_id = campaign_id_for(file_path)
+            if self.stored_turn_id is None:
+                if self.store.get_campaign(campaign_id) is None:
+                    self.store.put_campaign(campaign_id, self.party_members, self.settings, file_path)
+                self.stored_turn_id = self.store.last_turn_id(campaign_id)
+
+            new_messages = self.new_turns(self.stored_turn_id)
+            if not new_messages:
+                print("No new messages to save.")
+                return
+
+            for entry in new_messages:  # one transaction per turn
+                self.store.append_turn(campaign_id, entry)
+                self.stored_turn_id = entry["id"]
+
+            print(f"Chat history saved to {self.store.path} ({campaign_id})")
+        except Exception as e:
+            print(f"Error saving chat history: {e}")
+
+    def close(self):
+        """Flush the journal, refresh the chat snapshot and wait for queued writes."""
+        with self._save_lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+        self.save_usage()
+        get_write_behind().flush()
@@ -0,0 +1,422 @@
+# campaign_server.py
+# Hosts many campaigns from one process over a small local HTTP API. Everything runs on one asyncio
+# event loop: replies stream from the backends' shared async clients (one keep-alive pool per
+# backend for all sessions), so an in-flight turn costs a coroutine, not a thread. Sessions are
+# opened from their save files on first use and closed again after sitting idle, so idle campaigns
+# cost nothing.
+#
+#   python campaign_server.py --port 8765 --backend fake
+#
+# API (JSON bodies; turn replies stream as newline-delimited JSON):
+#   POST   /sessions                  {"save_file": ...} or {"party_members": [...], "settings": {...}}
+#   GET    /sessions                  open sessions
+#   GET    /sessions/<id>             party, settings and turn count
+#   GET    /sessions/<id>/history     ?start=0&limit=50
+#   POST   /sessions/<id>/turns       {"message": ..., "policy": ...} -> {"delta": ...} lines, then
+#                                     {"done": true, "entry": ...} or {"cancelled": true}
+#   POST   /sessions/<id>/cancel      cancel the session's turns in flight and queued
+#   DELETE /sessions/<id>             flush and close
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from contextlib import aclosing, suppress
+from urllib.parse import parse_qs, urlsplit
+
+from ai_helper import astream_prompt
+from campaign_engine import DEFAULT_SETTINGS, CampaignEngine, coalesce_messages, create_save_file, submit_policy
+from history_search import get_history_search
+
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Session:
+    """One open campaign. Turns in a session run one at a time, in order."""
+
+    def __init__(self, session_id, save_file, engine, max_turns=1):
+        self.session_id = session_id
+        self.save_file = save_file
+        self.engine = engine
+        self.turn_slots = asyncio.Semaphore(max_turns)  # per-session concurrency limit
+        self.active_turns = 0
+        self.turns = []  # {"message", "cancelled": asyncio.Event} for each turn in flight or queued, oldest first
+        self.summarising = False
+        self.last_used = time.monotonic()
+
+    def info(self):
+        engine = self.engine
+        return {
+            "session_id": self.session_id,
+            "save_file": self.save_file,
+            "party": [character.get("name") for character in engine.party_data],
+            "settings": engine.settings,
+            "turns": len(engine.conversation_history),
+            "busy": self.active_turns > 0,
+            "usage": engine.ledger.totals,
+        }
+
+
+class CampaignServer:
+    STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                   413: "Payload Too Large", 500: "Internal Server Error"}
+
+    def __init__(self, saves_dir="saves", backend=None, max_inflight=64, max_turns_per_session=1,
+                 idle_timeout=900, retrieval=True):
+        self.saves_dir = saves_dir
+        self.backend = backend                # overrides each game's backend setting if given
+        self.inflight = asyncio.Semaphore(max_inflight)  # LLM calls in flight across all sessions
+        self.max_turns_per_session = max_turns_per_session
+        self.idle_timeout = idle_timeout      # seconds before an idle session is closed
+        self.retrieval = retrieval            # index turns and pull relevant older turns into prompts
+        self.sessions = {}                    # session ID -> Session
+        self._opening = {}                    # session ID -> Task opening it
+
+        self.routes = [
+            ("POST", re.compile(r"^/sessions$"), self.create_session),
+            ("GET", re.compile(r"^/sessions$"), self.list_sessions),
+            ("GET", re.compile(r"^/sessions/([\w.-]+)$"), self.get_session_info),
+            ("DELETE", re.compile(r"^/sessions/([\w.-]+)$"), self.close_session),
+            ("GET", re.compile(r"^/sessions/([\w.-]+)/history$"), self.get_history),
+            ("POST", re.compile(r"^/sessions/([\w.-]+)/turns$"), self.play_turn),
+            ("POST", re.compile(r"^/sessions/([\w.-]+)/cancel$"), self.cancel_turns),
+        ]
+
+    # Sessions
+
+    def save_file_for(self, session_id):
+        return os.path.join(self.saves_dir, f"{session_id}.json")
+
+    async def get_session(self, session_id):
+        """Return an open session, opening it from its save file if needed."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            if session_id not in self._opening:
+                self._opening[session_id] = asyncio.ensure_future(self.open_session(session_id))
+            try:
+                session = await asyncio.shield(self._opening[session_id])
+            finally:
+                self._opening.pop(session_id, None)
+        session.last_used = time.monotonic()
+        return session
+
+    async def open_session(self, session_id):
+        save_file = self.save_file_for(session_id)
+        if not os.path.exists(save_file):
+            raise HTTPError(404, f"No saved game '{session_id}'")
+        # Reading the chat history is blocking file I/O
+        engine = await asyncio.to_thread(CampaignEngine.from_save_file, save_file, self.backend)
+        if self.retrieval:
+            engine.search_index = get_history_search()
+            await asyncio.to_thread(engine.index_turns)
+        session = Session(session_id, save_file, engine, self.max_turns_per_session)
+        self.sessions[session_id] = session
+        return session
+
+    async def evict_idle_sessions(self):
+        """Close sessions that have been idle for idle_timeout seconds (they reopen on demand)."""
+        while True:
+            await asyncio.sleep(min(60, self.idle_timeout))
+            cutoff = time.monotonic() - self.idle_timeout
+            for session_id, session in list(self.sessions.items()):
+                if session.last_used < cutoff and not session.active_turns and not session.summarising:
+                    del self.sessions[session_id]
+                    await asyncio.to_thread(session.engine.close)
+
+    def schedule_memory(self, session):
+        """Summarise due chapters on a worker thread, one job per session at a time."""
+        if session.summarising or not session.engine.pending_chapter():
+            return
+        session.summarising = True
+
+        async def summarise():
+            try:
+                await asyncio.to_thread(session.engine.update_memory)
+            except Exception as e:
+                print(f"Error summarising chapter for {session.session_id}: {e}")
+            finally:
+                session.summarising = False
+
+        asyncio.ensure_future(summarise())
+
+    # Handlers
+
+    async def create_session(self, request, writer):
+        body = request["json"]
+        if body.get("save_file"):
+            session_id = os.path.splitext(os.path.basename(body["save_file"]))[0]
+            if os.path.abspath(self.save_file_for(session_id)) != os.path.abspath(body["save_file"]):
+                raise HTTPError(400, f"Saved games must be in {self.saves_dir}")
+        elif body.get("party_members"):
+            settings = dict(DEFAULT_SETTINGS)
+            settings.update(body.get("settings") or {})
+            save_file = await asyncio.to_thread(create_save_file, body["party_members"], settings, self.saves_dir)
+            session_id = os.path.splitext(os.path.basename(save_file))[0]
+        else:
+            raise HTTPError(400, "Send either save_file or party_members")
+        session = await self.get_session(session_id)
+        await self.send_json(writer, 201, session.info())
+
+    async def list_sessions(self, request, writer):
+        await self.send_json(writer, 200, {"sessions": [session.info() for session in self.sessions.values()]})
+
+    async def get_session_info(self, request, writer, session_id):
+        session = await self.get_session(session_id)
+        await self.send_json(writer, 200, session.info())
+
+    async def close_session(self, request, writer, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            raise HTTPError(404, f"Session '{session_id}' is not open")
+        await asyncio.to_thread(session.engine.close)
+        await self.send_json(writer, 200, {"closed": session_id})
+
+    async def get_history(self, request, writer, session_id):
+        session = await self.get_session(session_id)
+        try:
+            start = int(request["query"].get("start", ["0"])[0])
+            limit = int(request["query"].get("limit", ["50"])[0])
+        except ValueError:
+            raise HTTPError(400, "start and limit must be integers")
+        if start < 0 or limit < 0:
+            raise HTTPError(400, "start and limit must not be negative")
+        history = session.engine.conversation_history
+        await self.send_json(writer, 200, {"total": len(history), "start": start,
+                                           "entries": history[start:start + limit]})
+
+    async def play_turn(self, request, writer, session_id):
+        """Stream one Dungeon Master reply as NDJSON; the turn is recorded once the reply is complete.
+
+        A turn sent while others are in flight or queued is handled by its submit policy (see
+        campaign_engine.SUBMIT_POLICIES): "queue" waits its turn, "replace" and "append" cancel them.
+        """
+        message = str(request["json"].get("message", "")).strip()
+        if not message:
+            raise HTTPError(400, "message is required")
+        try:
+            policy = submit_policy(request["json"].get("policy"))
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        session = await self.get_session(session_id)
+        engine = session.engine
+
+        if session.turns and policy != "queue":
+            message, _, _ = coalesce_messages(policy, session.turns[0]["message"],
+                                              [turn["message"] for turn in session.turns[1:]], message)
+            for turn in session.turns:
+                turn["cancelled"].set()
+        turn = {"message": message, "cancelled": asyncio.Event()}
+        session.turns.append(turn)
+
+        await self.start_stream(writer)
+        session.active_turns += 1
+        try:
+            async with session.turn_slots:
+                completed = False
+                if not turn["cancelled"].is_set():
+                    # Building the prompt queries the search index, so it runs off the event loop
+                    prompt, plan = await asyncio.to_thread(engine.prepare_turn, message)
+                    parts = []
+                    usage = {}
+                    async with self.inflight:
+                        stream = astream_prompt(prompt, model=plan.model, max_tokens=plan.max_tokens,
+                                                temperature=engine.TEMPERATURE, on_usage=usage.update,
+                                                backend=engine.backend)
+
+                        # If the client goes away or the turn is cancelled the stream is closed, which
+                        # aborts the request
+                        async def relay():
+                            async with aclosing(stream):
+                                async for delta in stream:
+                                    parts.append(delta)
+                                    await self.send_chunk(writer, {"delta": delta})
+
+                        completed = await self.until_cancelled(relay(), turn["cancelled"])
+                    if not completed:
+                        engine.ledger.record(usage or engine.estimate_usage(prompt, "".join(parts), plan.model),
+                                             "cancelled")
+
+                if completed:
+                    # Only complete replies are recorded
+                    entry = engine.record_turn(message, "".join(parts), usage)
+                    await asyncio.to_thread(engine.save_chat_history)
+            if completed:
+                self.schedule_memory(session)
+                await self.send_chunk(writer, {"done": True, "entry": entry})
+            else:
+                await self.send_chunk(writer, {"cancelled": True})
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            await self.send_chunk(writer, {"error": f"Error fetching response: {e}"})
+        finally:
+            session.turns.remove(turn)
+            session.active_turns -= 1
+            session.last_used = time.monotonic()
+        await self.end_stream(writer)
+
+    async def until_cancelled(self, coro, cancelled):
+        """Run coro until it finishes (True) or the cancelled event is set first (False, coro is cancelled)."""
+        task = asyncio.ensure_future(coro)
+        waiter = asyncio.ensure_future(cancelled.wait())
+        try:
+            await asyncio.wait((task, waiter), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+            if not task.done():
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        if task.cancelled():
+            return False
+        task.result()  # Raise whatever the turn failed with
+        return True
+
+    async def cancel_turns(self, request, writer, session_id):
+        """Cancel every turn of a session that is in flight or queued; their streams end with {"cancelled": true}."""
+        session = await self.get_session(session_id)
+        for turn in session.turns:
+            turn["cancelled"].set()
+        await self.send_json(writer, 200, {"cancelled": len(session.turns)})
+
+    # HTTP
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one keep-alive connection."""
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except ValueError as e:  # Malformed request line, Content-Length or URL
+                    await self.send_json(writer, 400, {"error": f"Malformed request: {e}"})
+                    break
+                except HTTPError as e:  # The body wasn't read, so the connection can't be reused
+                    await self.send_json(writer, e.status, {"error": str(e)})
+                    break
+                if request is None:
+                    break
+                await self.dispatch(request, writer)
+                if request["headers"].get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0) or 0)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, f"Request body is larger than {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        return {"method": method.upper(), "path": url.path.rstrip("/") or "/", "query": parse_qs(url.query),
+                "headers": headers, "body": body}
+
+    async def dispatch(self, request, writer):
+        try:
+            path_matched = False
+            for method, pattern, handler in self.routes:
+                match = pattern.match(request["path"])
+                if not match:
+                    continue
+                path_matched = True
+                if method != request["method"]:
+                    continue
+                try:
+                    request["json"] = json.loads(request["body"] or b"{}")
+                except ValueError:
+                    raise HTTPError(400, "Body must be JSON")
+                if not isinstance(request["json"], dict):
+                    raise HTTPError(400, "Body must be a JSON object")
+                await handler(request, writer, *match.groups())
+                return
+            raise HTTPError(405 if path_matched else 404, f"No route for {request['method']} {request['path']}")
+        except HTTPError as e:
+            await self.send_json(writer, e.status, {"error": str(e)})
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            print(f"Error handling {request['method']} {request['path']}: {e}")
+            await self.send_json(writer, 500, {"error": str(e)})
+
+    def status_line(self, status):
+        return f"HTTP/1.1 {status} {self.STATUS_TEXT.get(status, '')}\r\n"
+
+    async def send_json(self, writer, status, data):
+        body = json.dumps(data).encode("utf-8")
+        writer.write((self.status_line(status) + "Content-Type: application/json\r\n"
+                      f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def start_stream(self, writer):
+        writer.write((self.status_line(200) + "Content-Type: application/x-ndjson\r\n"
+                      "Transfer-Encoding: chunked\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+    async def send_chunk(self, writer, data):
+        line = (json.dumps(data) + "\n").encode("utf-8")
+        writer.write(f"{len(line):x}\r\n".encode("latin-1") + line + b"\r\n")
+        await writer.drain()
+
+    async def end_stream(self, writer):
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        evictor = asyncio.ensure_future(self.evict_idle_sessions())
+        print(f"Campaign server listening on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            evictor.cancel()
+            for session in self.sessions.values():
+                session.engine.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host many DungeonGPT campaigns over a local HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--saves-dir", default="saves")
+    parser.add_argument("--backend", help="LLM backend for every session (default: each game's setting)")
+    parser.add_argument("--max-inflight", type=int, default=64, help="LLM calls in flight across all sessions")
+    parser.add_argument("--idle-timeout", type=float, default=900, help="seconds before an idle session is closed")
+    parser.add_argument("--no-retrieval", action="store_true",
+                        help="don't index turns or pull relevant older turns into prompts")
+    args = parser.parse_args(argv)
+
+    async def run():
+        server = CampaignServer(args.saves_dir, backend=args.backend, max_inflight=args.max_inflight,
+                                idle_timeout=args.idle_timeout, retrieval=not args.no_retrieval)
+        await server.serve(args.host, args.port)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+# campaign_store.py
+# Optional single-file SQLite store for characters, campaigns and chat turns, enabled by pointing
+# DUNGEONGPT_STORE at a database file. The database runs in WAL mode, so the app, run_campaign.py
+# and campaign_server.py can read it from several processes while one of them writes. Each thread
+# gets its own connection, and every turn is inserted in its own transaction.
+#
+# Character IDs are the character file names and campaign IDs are the save file names without
+# ".json", the same identifiers the JSON layout uses, so the two can be converted either way:
+#
+#   python campaign_store.py import --db dungeongpt.db     # characters/ and saves/ -> database
+#   python campaign_store.py export --db dungeongpt.db     # database -> characters/ and saves/
+#   python campaign_store.py stats --db dungeongpt.db
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from chat_journal import ChatJournal, iter_chat_history
+from persistence import CHECKPOINTS, atomic_write, write_json
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS characters (
+    id TEXT PRIMARY KEY,           -- character file name
+    name TEXT,
+    gender TEXT,
+    race TEXT,
+    class TEXT,
+    level INTEGER,
+    alignment TEXT,
+    profile_pic TEXT,
+    data TEXT NOT NULL,            -- the whole sheet as JSON
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS characters_by_name ON characters (name COLLATE NOCASE, level);
+CREATE INDEX IF NOT EXISTS characters_by_class ON characters (class, level);
+CREATE INDEX IF NOT EXISTS characters_by_updated ON characters (updated);
+
+CREATE TABLE IF NOT EXISTS campaigns (
+    id TEXT PRIMARY KEY,           -- save file name without .json
+    party TEXT NOT NULL,           -- JSON list of character file paths
+    settings TEXT NOT NULL,        -- JSON
+    chat_file TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS campaigns_by_updated ON campaigns (updated);
+
+CREATE TABLE IF NOT EXISTS turns (
+    campaign_id TEXT NOT NULL REFERENCES campaigns (id) ON DELETE CASCADE,
+    turn_id INTEGER NOT NULL,
+    user TEXT NOT NULL,
+    response TEXT NOT NULL,
+    extra TEXT,                    -- any other entry fields (usage, ...) as JSON
+    created REAL NOT NULL,
+    PRIMARY KEY (campaign_id, turn_id)
+) WITHOUT ROWID;
+"""
+
+SUMMARY_COLUMNS = ("name", "gender", "race", "class", "level", "alignment", "profile_pic")
+TURN_FIELDS = ("id", "user", "response")
+
+
+def campaign_id_for(path):
+    """Campaign ID for a save or chat file, e.g. saves/game_x_chat.json -> game_x."""
+    base = os.path.splitext(os.path.basename(path))[0]
+    return base[:-len("_chat")] if base.endswith("_chat") else base
+
+
+def as_level(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class CampaignStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        """This thread's connection (sqlite3 connections must not be shared between threads)."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")  # With WAL, a commit is durable once checkpointed
+            db.execute("PRAGMA foreign_keys=ON")
+            self._local.db = db
+        return db
+
+    def transaction(self):
+        return _Transaction(self.connection())
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    # Characters
+
+    def put_character(self, char_id, character, db=None):
+        """Insert or replace a character sheet."""
+        row = (char_id, character.get("name"), character.get("gender"), character.get("race"),
+               character.get("class"), as_level(character.get("level")), character.get("alignment"),
+               character.get("profile_pic"), json.dumps(character), time.time())
+        sql = "INSERT OR REPLACE INTO characters VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        if db is not None:
+            db.execute(sql, row)
+        else:
+            with self.transaction() as db:
+                db.execute(sql, row)
+
+    def get_character(self, char_id):
+        row = self.connection().execute("SELECT data FROM characters WHERE id = ?", (char_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def list_characters(self, char_class=None, updated_since=None):
+        """Summary fields (plus id and updated) of every character, ordered by name then level."""
+        sql = "SELECT id, updated, " + ", ".join(SUMMARY_COLUMNS) + " FROM characters"
+        clauses, params = [], []
+        if char_class:
+            clauses.append("class = ?")
+            params.append(char_class)
+        if updated_since is not None:
+            clauses.append("updated > ?")
+            params.append(updated_since)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY name COLLATE NOCASE, level"
+        return [dict(row) for row in self.connection().execute(sql, params)]
+
+    def iter_characters(self):
+        """Yield (id, sheet) for every character."""
+        for char_id, data in self.connection().execute("SELECT id, data FROM characters"):
+            yield char_id, json.loads(data)
+
+    def delete_character(self, char_id):
+        with self.transaction() as db:
+            db.execute("DELETE FROM characters WHERE id = ?", (char_id,))
+
+    # Campaigns
+
+    def put_campaign(self, campaign_id, party_members, settings, chat_file=None, db=None):
+        now = time.time()
+        sql = ("INSERT INTO campaigns VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET "
+               "party = excluded.party, settings = excluded.settings, chat_file = excluded.chat_file, "
+               "updated = excluded.updated")
+        row = (campaign_id, json.dumps(list(party_members)), json.dumps(settings), chat_file, now, now)
+        if db is not None:
+            db.execute(sql, row)
+        else:
+            with self.transaction() as db:
+                db.execute(sql, row)
+
+    def get_campaign(self, campaign_id):
+        """(party_members, settings, chat_file) for a campaign, or None."""
+        row = self.connection().execute("SELECT party, settings, chat_file FROM campaigns WHERE id = ?",
+                                        (campaign_id,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row["party"]), json.loads(row["settings"]), row["chat_file"]
+
+    def list_campaigns(self, limit=None):
+        """Campaigns, most recently played first, with their turn counts."""
+        sql = ("SELECT c.id, c.chat_file, c.created, c.updated, "
+               "(SELECT COUNT(*) FROM turns t WHERE t.campaign_id = c.id) AS turns "
+               "FROM campaigns c ORDER BY c.updated DESC")
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self.connection().execute(sql)]
+
+    def delete_campaign(self, campaign_id):
+        with self.transaction() as db:
+            db.execute("DELETE FROM campaigns WHERE id = ?", (campaign_id,))
+
+    # Turns
+
+    def append_turn(self, campaign_id, entry, db=None):
+        """Insert one turn (in its own transaction unless db is given). Stored IDs are ignored."""
+        extra = {key: value for key, value in entry.items() if key not in TURN_FIELDS}
+        row = (campaign_id, entry["id"], entry.get("user", ""), entry.get("response", ""),
+               json.dumps(extra) if extra else None, time.time())
+        if db is not None:
+            db.execute("INSERT OR IGNORE INTO turns VALUES (?, ?, ?, ?, ?, ?)", row)
+            return
+        with self.transaction() as db:
+            db.execute("INSERT OR IGNORE INTO turns VALUES (?, ?, ?, ?, ?, ?)", row)
+            db.execute("UPDATE campaigns SET updated = ? WHERE id = ?", (row[-1], campaign_id))
+
+    def last_turn_id(self, campaign_id):
+        row = self.connection().execute("SELECT MAX(turn_id) FROM turns WHERE campaign_id = ?",
+                                        (campaign_id,)).fetchone()
+        return row[0] or 0
+
+    def iter_turns(self, campaign_id, after_id=0):
+        """Yield a campaign's turns in order as conversation entries."""
+        cursor = self.connection().execute(
+            "SELECT turn_id, user, response, extra FROM turns WHERE campaign_id = ? AND turn_id > ? "
+            "ORDER BY turn_id", (campaign_id, after_id))
+        for turn_id, user, response, extra in cursor:
+            entry = {"id": turn_id, "user": user, "response": response}
+            if extra:
+                entry.update(json.loads(extra))
+            yield entry
+
+    def stats(self):
+        db = self.connection()
+        return {table: db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("characters", "campaigns", "turns")}
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT (or ROLLBACK on error), taking the write lock up front."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The store named by DUNGEONGPT_STORE, or None when the JSON files are used.
+
+    A new database is filled from characters/ and saves/ the first time it is opened.
+    """
+    global _store
+    path = os.environ.get("DUNGEONGPT_STORE")
+    if not path:
+        return None
+    with _store_lock:
+        if _store is None or _store.path != path:
+            is_new = not os.path.exists(path)
+            _store = CampaignStore(path)
+            if is_new:
+                counts = import_json(_store)
+                print(f"Created {path}: imported {counts['characters']} characters, "
+                      f"{counts['campaigns']} campaigns and {counts['turns']} turns")
+        return _store
+
+
+# Conversion to and from the JSON layout
+
+def is_save_file(name):
+    base, ext = os.path.splitext(name)
+    return ext == ".json" and not base.endswith(("_chat", "_summaries", "_usage"))
+
+
+def import_json(store, char_path="characters", saves_dir="saves"):
+    """Copy character files, save files and their chat histories into the store; returns counts.
+
+    Importing again is safe: characters and campaigns are replaced and already stored turns skipped.
+    """
+    counts = {"characters": 0, "campaigns": 0, "turns": 0}
+    if os.path.isdir(char_path):
+        with store.transaction() as db:
+            for dir_entry in os.scandir(char_path):
+                if not dir_entry.name.endswith(".json") or dir_entry.name.startswith("."):
+                    continue
+                try:
+                    with open(dir_entry.path, "r", encoding="utf-8") as f:
+                        character = json.load(f)
+                except Exception as e:
+                    print(f"Skipping character {dir_entry.name}: {e}")
+                    continue
+                store.put_character(dir_entry.name, character, db=db)
+                counts["characters"] += 1
+
+    if os.path.isdir(saves_dir):
+        for dir_entry in os.scandir(saves_dir):
+            if not is_save_file(dir_entry.name):
+                continue
+            try:
+                with open(dir_entry.path, "r", encoding="utf-8") as f:
+                    save_data = json.load(f)
+            except Exception as e:
+                print(f"Skipping save {dir_entry.name}: {e}")
+                continue
+            campaign_id = campaign_id_for(dir_entry.name)
+            chat_file = save_data.get("chat_file")
+            with store.transaction() as db:  # one transaction per campaign
+                store.put_campaign(campaign_id, save_data.get("party_members", []), save_data.get("settings", {}),
+                                   chat_file, db=db)
+                if chat_file:
+                    for entry in iter_chat_history(chat_file):
+                        store.append_turn(campaign_id, entry, db=db)
+                        counts["turns"] += 1
+            counts["campaigns"] += 1
+    return counts
+
+
+def export_json(store, char_path="characters", saves_dir="saves"):
+    """Write the store back out as character files, save files and chat journals; returns counts.
+
+    Chat files are placed in saves_dir, and existing chat journals are extended with the turns
+    they are missing.
+    """
+    counts = {"characters": 0, "campaigns": 0, "turns": 0}
+    os.makedirs(char_path, exist_ok=True)
+    for char_id, character in store.iter_characters():
+        atomic_write(os.path.join(char_path, char_id), json.dumps(character, indent=4))
+        counts["characters"] += 1
+
+    os.makedirs(saves_dir, exist_ok=True)
+    for campaign in store.list_campaigns():
+        party_members, settings, chat_file = store.get_campaign(campaign["id"])
+        chat_file = os.path.join(saves_dir, os.path.basename(chat_file or f"{campaign['id']}_chat.json"))
+        write_json(os.path.join(saves_dir, f"{campaign['id']}.json"),
+                   {"party_members": party_members, "settings": settings, "chat_file": chat_file},
+                   checkpoints=CHECKPOINTS)
+        journal = ChatJournal(chat_file)
+        try:
+            for entry in store.iter_turns(campaign["id"], after_id=journal.last_id):
+                journal.append(entry)
+                counts["turns"] += 1
+        finally:
+            journal.close()
+        counts["campaigns"] += 1
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert between the JSON files and the SQLite campaign store.")
+    parser.add_argument("command", choices=["import", "export", "stats"])
+    parser.add_argument("--db", default=os.environ.get("DUNGEONGPT_STORE", "dungeongpt.db"),
+                        help="database file (default: $DUNGEONGPT_STORE or dungeongpt.db)")
+    parser.add_argument("--characters", default="characters", help="character folder (default: characters)")
+    parser.add_argument("--saves", default="saves", help="saves folder (default: saves)")
+    args = parser.parse_args(argv)
+
+    store = CampaignStore(args.db)
+    if args.command == "import":
+        counts = import_json(store, args.characters, args.saves)
+    elif args.command == "export":
+        counts = export_json(store, args.characters, args.saves)
+    else:
+        counts = store.stats()
+    print(", ".join(f"{count} {name}" for name, count in counts.items()))
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
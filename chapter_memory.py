@@ -0,0 +1,121 @@
+# chapter_memory.py
+# Long-term memory for a campaign. Turns that scroll out of the prompt's history window are
+# summarised in chapters by a cheap model, and old chapters are merged into broader summaries so
+# the "story so far" section of the prompt stays bounded however long the campaign runs.
+# Summaries are saved next to the chat file so they are not recomputed when a game is loaded.
+
+import os
+from bisect import bisect_right
+
+from ai_helper import send_prompt
+from history_index import render_entry
+from persistence import CHECKPOINTS, load_json, write_json
+
+
+def summary_path(chat_file):
+    """Return the summaries path for a chat file, e.g. saves/game_x_chat.json -> saves/game_x_chat_summaries.json."""
+    base, _ = os.path.splitext(chat_file)
+    return base + "_summaries.json"
+
+
+class ChapterMemory:
+    def __init__(self, chat_file, chapter_turns=20, max_chapters=8, merge_count=4, model="gpt-4o-mini",
+                 backend=None, on_usage=None):
+        self.path = summary_path(chat_file) if chat_file else None
+        self.chapter_turns = chapter_turns  # turns per chapter summary
+        self.max_chapters = max_chapters    # once exceeded, the oldest summaries are merged
+        self.merge_count = merge_count      # how many summaries are merged at a time
+        self.model = model
+        self.backend = backend
+        self.on_usage = on_usage  # Receives the token usage of every summary call
+
+        # Each chapter is {"start_id", "end_id", "level", "summary"}; level 0 summarises turns,
+        # higher levels summarise earlier summaries
+        self.chapters = []
+        self.busy = False  # only one summarisation job runs at a time
+        self.load()
+
+    @property
+    def summarised_through(self):
+        """ID of the last turn covered by a summary (0 if none)."""
+        return self.chapters[-1]["end_id"] if self.chapters else 0
+
+    def load(self):
+        if self.path and (os.path.exists(self.path) or os.path.exists(self.path + ".ckpt1")):
+            try:
+                self.chapters = load_json(self.path).get("chapters", [])
+            except Exception as e:
+                print(f"Error loading chapter summaries: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        write_json(self.path, {"chapters": self.chapters}, checkpoints=CHECKPOINTS)
+
+    def first_unsummarised(self, entries):
+        """Index in entries of the oldest turn not yet covered by a summary."""
+        return bisect_right(entries, self.summarised_through, key=lambda entry: entry["id"])
+
+    def next_chapter(self, entries, window_start):
+        """Return the turns for the next chapter if enough have left the history window, else None."""
+        if self.busy:
+            return None
+        first = self.first_unsummarised(entries)
+        if window_start - first < self.chapter_turns:
+            return None
+        return entries[first:first + self.chapter_turns]
+
+    def summarise(self, turns):
+        """Summarise turns into a new chapter and merge old chapters (runs on a worker thread).
+
+        Returns the new list of chapters; apply it with set_chapters() on the Tk thread.
+        """
+        transcript = "\n".join(render_entry(entry) for entry in turns)
+        summary = send_prompt(
+            "Summarise this part of a D&D campaign in one or two paragraphs. Keep the names of people, "
+            "places and items, unresolved quests and anything the party promised or was promised.\n\n"
+            f"{transcript}",
+            model=self.model,
+            max_tokens=500,
+            temperature=0.3,
+            backend=self.backend,
+            on_usage=self.on_usage,
+        )
+        chapters = self.chapters + [{
+            "start_id": turns[0]["id"],
+            "end_id": turns[-1]["id"],
+            "level": 0,
+            "summary": summary.strip(),
+        }]
+
+        # Merge the oldest summaries until the list is back within bounds
+        while len(chapters) > self.max_chapters:
+            group = chapters[:self.merge_count]
+            merged = send_prompt(
+                "Combine these consecutive summaries of a D&D campaign into one summary of at most "
+                "two paragraphs. Keep the names and open threads that still matter.\n\n"
+                + "\n\n".join(chapter["summary"] for chapter in group),
+                model=self.model,
+                max_tokens=500,
+                temperature=0.3,
+                backend=self.backend,
+                on_usage=self.on_usage,
+            )
+            chapters = [{
+                "start_id": group[0]["start_id"],
+                "end_id": group[-1]["end_id"],
+                "level": max(chapter["level"] for chapter in group) + 1,
+                "summary": merged.strip(),
+            }] + chapters[self.merge_count:]
+
+        return chapters
+
+    def set_chapters(self, chapters):
+        self.chapters = chapters
+        self.busy = False
+
+    def render(self):
+        """Return the "story so far" section of the prompt (ending in a blank line), or an empty string."""
+        if not self.chapters:
+            return ""
+        return "Story So Far:\n" + "\n\n".join(chapter["summary"] for chapter in self.chapters) + "\n\n"
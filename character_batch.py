@@ -0,0 +1,129 @@
+# character_batch.py
+# Generates many characters at once for one-shot events. Requests are spread over a bounded thread
+# pool and paced by a rate limiter, so N characters take about N / max_workers round trips rather
+# than N. Each valid character is written straight into characters/ as soon as it arrives.
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from character_sheet import CLASS_OPTIONS, RACE_OPTIONS, generate_character, make_character, write_character_file
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` requests per `per` seconds, with bursts of up to `burst`."""
+
+    def __init__(self, rate, per=60.0, burst=None):
+        self.interval = per / rate
+        self.capacity = burst or 1
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cancel_event=None):
+        """Block until a request may be sent. Returns False once cancel_event is set."""
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) * self.interval
+            if cancel_event is not None:
+                if cancel_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+class BatchGenerator:
+    """Generate `count` characters concurrently and save each one to char_path.
+
+    classes is the class mix: the jobs cycle through it, so ["Fighter", "Wizard"] gives half of each.
+    Levels are drawn uniformly from level_range. on_progress(done, total, saved, failed) is called
+    from worker threads after every job. The batch runs on its own thread pool, never on the app's
+    shared TaskRunner workers.
+    """
+
+    def __init__(self, count, classes=None, level_range=(1, 5), races=None, char_path="characters/",
+                 max_workers=8, requests_per_minute=60, model="gpt-4o", backend=None, on_progress=None):
+        self.count = count
+        self.classes = list(classes or CLASS_OPTIONS)
+        self.level_range = (min(level_range), max(level_range))
+        self.races = list(races or RACE_OPTIONS)
+        self.char_path = char_path
+        self.max_workers = max_workers
+        self.model = model
+        self.backend = backend
+        self.on_progress = on_progress
+
+        self.limiter = RateLimiter(requests_per_minute, burst=max_workers)
+        self.cancel_event = threading.Event()
+
+        self.saved = []   # paths of the characters written so far
+        self.errors = []  # (job index, error message)
+        self.done = 0
+        self._on_done = None
+        self._lock = threading.Lock()
+
+    def jobs(self):
+        """The (class, level) of each character, with the class mix spread evenly."""
+        return [(self.classes[i % len(self.classes)], random.randint(*self.level_range))
+                for i in range(self.count)]
+
+    def cancel(self):
+        """Stop sending new requests; requests already in flight still finish."""
+        self.cancel_event.set()
+
+    def start(self, on_done=None):
+        """Start generating and return at once. on_done(saved paths) is called from a batch thread at the end."""
+        self._on_done = on_done
+        if not self.count:
+            if on_done:
+                on_done(self.saved)
+            return
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="CharacterBatch")
+        for index, (char_class, level) in enumerate(self.jobs()):
+            pool.submit(self._run_job, index, char_class, level)
+        pool.shutdown(wait=False)  # Its threads exit once the queued jobs are done
+
+    def run(self):
+        """Generate the batch (blocking) and return the saved file paths."""
+        finished = threading.Event()
+        self.start(on_done=lambda saved: finished.set())
+        finished.wait()
+        return self.saved
+
+    def _run_job(self, index, char_class, level):
+        try:
+            if not self.limiter.acquire(self.cancel_event):
+                raise RuntimeError("cancelled")
+            path = self.generate_one(char_class, level)
+        except Exception as e:
+            with self._lock:
+                self.errors.append((index, str(e)))
+                self.done += 1
+                last = self.done == self.count
+        else:
+            with self._lock:
+                self.saved.append(path)
+                self.done += 1
+                last = self.done == self.count
+        if self.on_progress:
+            self.on_progress(self.done, self.count, len(self.saved), len(self.errors))
+        if last and self._on_done:
+            self._on_done(self.saved)
+
+    def generate_one(self, char_class, level):
+        """Request one character, validate and repair it, and write it out. Returns the file path."""
+        # Identical prompts must still give different characters, so the response cache is bypassed
+        character_data = generate_character(char_class=char_class, level=level, races=self.races,
+                                            model=self.model, temperature=0.9, backend=self.backend,
+                                            use_cache=False)
+        character = make_character(character_data)
+        return write_character_file(character, self.char_path, overwrite=False)
@@ -0,0 +1,140 @@
+# character_catalogue.py
+# Index of the character files in characters/. Each character is identified by its file name, which
+# stays stable while the file is edited. The index (path, mtime, size and the summary fields shown
+# in the UI) is persisted, so a refresh only re-reads files that were added or changed.
+# With a campaign store, the catalogue is an indexed query of the store instead of a directory walk.
+
+import json
+import os
+import threading
+
+from persistence import get_write_behind, load_json
+
+SUMMARY_FIELDS = ("name", "gender", "race", "class", "level", "alignment", "profile_pic")
+
+
+class CharacterCatalogue:
+    def __init__(self, char_path="characters/", index_file="cache/character_index.json", store=None):
+        self.char_path = char_path
+        self.index_file = index_file
+        self.store = store  # CampaignStore to list characters from instead of char_path
+        self.entries = {}  # id -> {"id", "path", "mtime", "size", <summary fields>}; replaced, never mutated
+        self._lock = threading.Lock()
+        self._scanned = None  # Entries from the latest scan; the index is read by the first scan(), off the UI thread
+
+    def read_index(self):
+        """The persisted index as an id -> entry dict (empty if missing, stale or unreadable)."""
+        if not self.index_file or not os.path.exists(self.index_file):
+            return {}
+        try:
+            data = load_json(self.index_file, checkpoints=0)
+            if data.get("char_path") == os.path.abspath(self.char_path):
+                return {entry["id"]: entry for entry in data.get("entries", [])}
+        except Exception as e:
+            print(f"Error loading character index, rebuilding it: {e}")
+        return {}
+
+    def save_index(self, entries):
+        if not self.index_file:
+            return
+        # Serialised now, written in the background (a burst of refreshes is written once)
+        text = json.dumps({"char_path": os.path.abspath(self.char_path), "entries": list(entries.values())})
+        get_write_behind().submit(self.index_file, lambda: text)
+
+    def refresh(self):
+        """Sync the index with the directory (or store) and use the result. Returns (added, changed, removed)."""
+        entries, changes = self.scan()
+        self.entries = entries
+        return changes
+
+    def scan(self):
+        """Sync the index with the directory, re-reading only new or modified files.
+
+        Safe to run on a worker thread: a new dict is built and self.entries is left alone, so the UI
+        can keep reading it. Returns (entries, (added, changed, removed)); the caller swaps entries in
+        (on the Tk thread in the UI).
+        """
+        if self.store is not None:
+            return self.scan_store()
+        with self._lock:
+            if self._scanned is None:
+                self._scanned = self.read_index()
+            entries = dict(self._scanned)
+
+            added, changed = [], []
+            seen = set()
+            for dir_entry in os.scandir(self.char_path):
+                if not dir_entry.name.endswith(".json") or dir_entry.name.startswith("."):
+                    continue
+                char_id = dir_entry.name
+                seen.add(char_id)
+                stat = dir_entry.stat()
+
+                known = entries.get(char_id)
+                if known and known["mtime"] == stat.st_mtime and known["size"] == stat.st_size:
+                    continue
+
+                try:
+                    with open(dir_entry.path, "r", encoding="utf-8") as f:
+                        character = json.load(f)
+                except Exception as e:
+                    print(f"Error loading character from {dir_entry.name}: {e}")
+                    continue
+
+                entry = {"id": char_id, "path": dir_entry.path, "mtime": stat.st_mtime, "size": stat.st_size}
+                for field in SUMMARY_FIELDS:
+                    entry[field] = character.get(field)
+                entries[char_id] = entry
+                (changed if known else added).append(char_id)
+
+            removed = [char_id for char_id in entries if char_id not in seen]
+            for char_id in removed:
+                del entries[char_id]
+
+            if added or changed or removed:
+                self.save_index(entries)
+            self._scanned = entries
+            return entries, (added, changed, removed)
+
+    def scan_store(self):
+        """Sync the index with the campaign store; "mtime" is the row's last update. Returns like scan()."""
+        with self._lock:
+            entries = dict(self._scanned or {})
+            added, changed = [], []
+            seen = set()
+            for row in self.store.list_characters():
+                char_id = row["id"]
+                seen.add(char_id)
+                known = entries.get(char_id)
+                if known and known["mtime"] == row["updated"]:
+                    continue
+                entry = {"id": char_id, "path": os.path.join(self.char_path, char_id),
+                         "mtime": row["updated"], "size": 0}
+                for field in SUMMARY_FIELDS:
+                    entry[field] = row[field]
+                entries[char_id] = entry
+                (changed if known else added).append(char_id)
+
+            removed = [char_id for char_id in entries if char_id not in seen]
+            for char_id in removed:
+                del entries[char_id]
+            self._scanned = entries
+            return entries, (added, changed, removed)
+
+    def get(self, char_id):
+        return self.entries.get(char_id)
+
+    def sorted_ids(self):
+        """Character IDs ordered by name, then level."""
+        return sorted(self.entries, key=lambda char_id: (str(self.entries[char_id].get("name") or ""),
+                                                         str(self.entries[char_id].get("level") or ""), char_id))
+
+    def path(self, char_id):
+        return self.entries[char_id]["path"]
+
+    def load_character(self, char_id):
+        """Read the full character sheet."""
+        if self.store is not None:
+            return self.store.get_character(char_id)
+        with open(self.path(char_id), "r", encoding="utf-8") as f:
+            return json.load(f)
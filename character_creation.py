@@ -1,12 +1,16 @@
 import tkinter as tk
-import json
+import os
 from tkinter import ttk, messagebox
-from ai_helper import send_prompt
+from task_runner import get_task_runner
+from asset_cache import get_asset_cache
+from character_sheet import (GENDER_OPTIONS, RACE_OPTIONS, CLASS_OPTIONS, ALIGNMENT_OPTIONS, STAT_NAMES,
+                             PROFILE_PICS, generate_character, make_character, write_character_file)
 
 class CharacterCreatorUI:
     def __init__(self, parent, update_party_callback=None):
         self.parent = parent
         self.update_party_callback = update_party_callback
+        self.task_runner = get_task_runner(parent)
 
         # This will store all created characters in memory.
         # You could replace this with saving to a file, a DB, or an API call.
@@ -25,23 +29,21 @@ class CharacterCreatorUI:
         # 2. Character Gender
         ttk.Label(self.main_frame, text="Gender:").grid(row=1, column=0, sticky=tk.W, padx=5, pady=5)
         self.gender_var = tk.StringVar()
-        gender_options = ["Male", "Female"]
+        gender_options = GENDER_OPTIONS
         self.gender_dropdown = ttk.OptionMenu(self.main_frame, self.gender_var, gender_options[0], *gender_options)
         self.gender_dropdown.grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
 
         # 3. Character Race
         ttk.Label(self.main_frame, text="Race:").grid(row=2, column=0, sticky=tk.W, padx=5, pady=5)
         self.race_var = tk.StringVar()
-        # characterRaces = ["Human", "Dwarf", "Elf", "Halfling", "Dragonborn", "Gnome", "Half-Elf", "Half-Orc", "Tiefling"];
-        race_options = ["Human", "Elf", "Dwarf", "Halfling"]
+        race_options = RACE_OPTIONS
         self.race_dropdown = ttk.OptionMenu(self.main_frame, self.race_var, race_options[0], *race_options)
         self.race_dropdown.grid(row=2, column=1, padx=5, pady=5, sticky=tk.W)
 
         # 4. Character Class
         ttk.Label(self.main_frame, text="Class:").grid(row=3, column=0, sticky=tk.W, padx=5, pady=5)
         self.class_var = tk.StringVar()
-        # characterClasses = ["Barbarian", "Bard", "Cleric", "Druid", "Fighter", "Monk", "Paladin", "Ranger", "Rogue", "Sorcerer", "Warlock", "Wizard"]
-        class_options = ["Barbarian", "Fighter", "Rogue", "Wizard", "Paladin", "Cleric", "Ranger", "Monk", "Druid"]
+        class_options = CLASS_OPTIONS
         self.class_dropdown = ttk.OptionMenu(self.main_frame, self.class_var, class_options[0], *class_options)
         self.class_dropdown.grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
 
@@ -53,17 +55,7 @@ class CharacterCreatorUI:
         # 6. Alignment
         ttk.Label(self.main_frame, text="Alignment:").grid(row=5, column=0, sticky=tk.W, padx=5, pady=5)
         self.alignment_var = tk.StringVar()
-        alignment_options = [
-            "Lawful Good",
-            "Neutral Good",
-            "Chaotic Good",
-            "Lawful Neutral",
-            "True Neutral",
-            "Chaotic Neutral",
-            "Lawful Evil",
-            "Neutral Evil",
-            "Chaotic Evil",
-        ]
+        alignment_options = ALIGNMENT_OPTIONS
         self.alignment_dropdown = ttk.OptionMenu(self.main_frame, self.alignment_var, alignment_options[0], *alignment_options)
         self.alignment_dropdown.grid(row=5, column=1, padx=5, pady=5, sticky=tk.W)
 
@@ -77,14 +69,7 @@ class CharacterCreatorUI:
         stats_frame.grid(row=7, column=1, columnspan=2, padx=5, pady=10, sticky=tk.W)
 
         # Create dictionary to hold stat variables
-        self.stats_vars = {
-            "Strength": tk.IntVar(value=10),
-            "Dexterity": tk.IntVar(value=10),
-            "Constitution": tk.IntVar(value=10),
-            "Intelligence": tk.IntVar(value=10),
-            "Wisdom": tk.IntVar(value=10),
-            "Charisma": tk.IntVar(value=10),
-        }
+        self.stats_vars = {stat_name: tk.IntVar(value=10) for stat_name in STAT_NAMES}
 
         row_index = 0
         for stat_name, var in self.stats_vars.items():
@@ -97,12 +82,8 @@ class CharacterCreatorUI:
         pics_frame = ttk.LabelFrame(self.main_frame, text="Profile Picture")
         pics_frame.grid(row=8, column=0, columnspan=2, pady=10, sticky=tk.W)
 
-        # Paths
-        # Store them in a list  (include correct paths plus .png/.jpg )
-        path="pictures/"
-        profile_pics = [f"{path}barbarian.png", f"{path}wizard.png", f"{path}ranger.png",
-                        f"{path}fighter.png", f"{path}bard.png", f"{path}cleric.png", f"{path}druid.png",
-                        f"{path}paladin.png"]
+        # Paths (see character_sheet.PROFILE_PICS)
+        profile_pics = PROFILE_PICS
 
         # IMPORTANT: Store image objects in a list or dict so they're not garbage-collected
         self.profile_images = []
@@ -115,33 +96,26 @@ class CharacterCreatorUI:
         # row, col = 0, 0
         max_columns = 3  # Maximum number of columns in the grid
 
-        # Create a row of radio buttons, each with the corresponding image
+        # Create a row of radio buttons, each with the corresponding image.
+        # The images come from the shared asset cache and appear once they are decoded.
+        assets = get_asset_cache(parent)
         for i, pic_path in enumerate(profile_pics):
-            try:
-                # Load and possibly resize
-                img = tk.PhotoImage(file=pic_path)
-                # Example resizing if your images are big
-                # img = img.subsample(1, 1)
-            except Exception as e:
-                # If the image fails to load, we can fall back
-                messagebox.showwarning("Image Error", f"Could not load {pic_path}. {e}")
-                continue
-
-            self.profile_images.append(img)
-
             # Calculate row and column for the grid
             row = i // max_columns
             column = i % max_columns
 
             rad = ttk.Radiobutton(
                 pics_frame,
-                image=self.profile_images[-1],
+                text=os.path.basename(pic_path),
                 variable=self.profile_pic_var,
                 value=pic_path
             )
             # rad.grid(row=0, column=i, padx=5, pady=5)
             rad.grid(row=row, column=column, padx=5, pady=5)
 
+            # Example resizing if your images are big: pass a (width, height) instead of None
+            assets.get_photo(pic_path, None, lambda img, rad=rad: self.set_profile_image(rad, img))
+
 
 
         # Buttons
@@ -157,10 +131,51 @@ class CharacterCreatorUI:
         gen_frame = ttk.Frame(self.main_frame)
         gen_frame.grid(row=10, column=1, columnspan=2, pady=10, sticky=tk.W)
 
-        auto_btn = ttk.Button(gen_frame, text="Auto Generate", command=self.auto_generate)
+        self.auto_btn = ttk.Button(gen_frame, text="Auto Generate", command=self.auto_generate)
         # auto_btn.pack(side=tk.LEFT, padx=5)
-        auto_btn.grid(row=0, column=0, padx=5, pady=5)
-
+        self.auto_btn.grid(row=0, column=0, padx=5, pady=5)
+
+        # In-progress indicator for auto generation
+        self.gen_status_label = ttk.Label(gen_frame, text="")
+        self.gen_status_label.grid(row=0, column=1, padx=5, pady=5)
+
+        # Batch generation: many characters straight into characters/
+        batch_frame = ttk.LabelFrame(self.main_frame, text="Batch Generate")
+        batch_frame.grid(row=11, column=0, columnspan=2, padx=5, pady=10, sticky=tk.W)
+
+        ttk.Label(batch_frame, text="Count:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
+        self.batch_count_var = tk.IntVar(value=10)
+        ttk.Spinbox(batch_frame, from_=1, to=200, textvariable=self.batch_count_var, width=5).grid(row=0, column=1, sticky=tk.W, padx=5, pady=5)
+
+        ttk.Label(batch_frame, text="Levels:").grid(row=0, column=2, sticky=tk.W, padx=5, pady=5)
+        self.batch_min_level_var = tk.IntVar(value=1)
+        self.batch_max_level_var = tk.IntVar(value=5)
+        ttk.Spinbox(batch_frame, from_=1, to=20, textvariable=self.batch_min_level_var, width=5).grid(row=0, column=3, padx=2, pady=5)
+        ttk.Label(batch_frame, text="to").grid(row=0, column=4)
+        ttk.Spinbox(batch_frame, from_=1, to=20, textvariable=self.batch_max_level_var, width=5).grid(row=0, column=5, padx=2, pady=5)
+
+        ttk.Label(batch_frame, text="Classes:").grid(row=1, column=0, sticky=tk.W, padx=5, pady=5)
+        self.batch_classes_var = tk.StringVar()
+        ttk.Entry(batch_frame, textvariable=self.batch_classes_var, width=30).grid(row=1, column=1, columnspan=5, sticky=tk.W, padx=5, pady=5)
+        ttk.Label(batch_frame, text="(comma-separated; blank for any)").grid(row=2, column=1, columnspan=5, sticky=tk.W, padx=5)
+
+        self.batch_btn = ttk.Button(batch_frame, text="Generate Batch", command=self.batch_generate)
+        self.batch_btn.grid(row=3, column=0, padx=5, pady=5)
+        self.batch_cancel_btn = ttk.Button(batch_frame, text="Cancel", command=self.cancel_batch, state="disabled")
+        self.batch_cancel_btn.grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
+        self.batch_progress = ttk.Progressbar(batch_frame, length=200, mode="determinate")
+        self.batch_progress.grid(row=4, column=0, columnspan=6, padx=5, pady=5, sticky=tk.W)
+        self.batch_status_label = ttk.Label(batch_frame, text="")
+        self.batch_status_label.grid(row=5, column=0, columnspan=6, padx=5, pady=5, sticky=tk.W)
+        self.batch = None
+
+
+    def set_profile_image(self, rad, img):
+        """Show a decoded profile picture on its radio button."""
+        if img is None:
+            return  # Keep the file name as the label
+        self.profile_images.append(img)
+        rad.configure(image=img, text="")
 
     def save_character(self):
         """Collects all data from the form and adds it to 'created_characters' list."""
@@ -184,7 +199,7 @@ class CharacterCreatorUI:
             stat_name: var.get() for stat_name, var in self.stats_vars.items()
         }
 
-        new_character = {
+        new_character = make_character({
             "name": name,
             "gender": gender,
             "race": race,
@@ -193,8 +208,7 @@ class CharacterCreatorUI:
             "alignment": alignment,
             "background": background,
             "stats": stats,
-            "profile_pic": profile_pic
-        }
+        }, profile_pic=profile_pic)
 
         self.created_characters.append(new_character)
 
@@ -215,9 +229,16 @@ class CharacterCreatorUI:
 
         print(f"Saving character '{name}' to {char_path}")
 
-        with open(f"{char_path}{name}_Level_{level}_{char_class}.json", "w") as char_file:
-            json.dump(self.created_characters[len_cc - 1], char_file)   # check the [0] too. Maybe messing up?
+        # Written (and fsynced) on a worker thread
+        self.task_runner.submit(
+            write_character_file,
+            self.created_characters[len_cc - 1], char_path,   # check the [0] too. Maybe messing up?
+            on_done=lambda path: self.on_character_saved(name),
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to save character '{name}': {e}"),
+        )
 
+    def on_character_saved(self, name):
+        """Confirm the save and refresh the party tab (runs on the Tk thread)."""
         messagebox.showinfo("Success", f"Character '{name}' saved successfully!")
 
         # Update the party selection tab with the new character
@@ -229,67 +250,107 @@ class CharacterCreatorUI:
         self.clear_form()  # Clear existing form data
         print("Auto-generating character...")
 
-        # make API request
+        # make API request on a worker thread so the window stays responsive.
+        # The response is schema-constrained where possible and repaired locally (see character_sheet)
+        self.auto_btn.configure(state="disabled")
+        self.gen_status_label.configure(text="Generating...")
+        self.task_runner.submit(
+            generate_character, model="gpt-4o", max_tokens=16384, temperature=0.7,
+            on_done=self.on_character_generated,
+            on_error=self.on_generate_error,
+        )
+
+    def on_character_generated(self, character_data):
+        """Populate the form with a validated, repaired character (runs on the Tk thread)."""
+        self.auto_btn.configure(state="normal")
+        self.gen_status_label.configure(text="")
+        # print(character_data)
+
+        # Show a success message
+        messagebox.showinfo("Success", f"Character auto-generated successfully!" )
+
+
+        # Display auto-generated character in a pop-up text box
+        ### Good Debugging, but don't really need. ###
+        # top = tk.Toplevel(self.root)
+        # top.title("New Character")
+
+        # Use a Text widget
+        # text_area = tk.Text(top, width=60, height=20)
+        # text_area.pack(padx=10, pady=10)
+        # text_area.insert(tk.END, generated_character)
+        # text_area.insert(tk.END, f"\n\n -------  JSON Check  ------- \n\n")
+        # text_area.insert(tk.END, json.dumps(character_data, indent=4))
+
+        # Populate the form
+        self.populate_form(character_data)
+
+    def on_generate_error(self, e):
+        """Report a failed generation request (runs on the Tk thread)."""
+        self.auto_btn.configure(state="normal")
+        self.gen_status_label.configure(text="")
+        messagebox.showerror("Error", f"An error occurred while generating a character: {str(e)}")
+
+
+
+    def batch_generate(self):
+        """Generate a batch of characters in the background, saving each one to characters/."""
+        from character_batch import BatchGenerator
+
+        classes = [c.strip() for c in self.batch_classes_var.get().split(",") if c.strip()]
+        unknown = [c for c in classes if c.title() not in CLASS_OPTIONS]
+        if unknown:
+            messagebox.showwarning("Unknown Class", f"Unknown class: {', '.join(unknown)}")
+            return
         try:
+            count = self.batch_count_var.get()
+            levels = (self.batch_min_level_var.get(), self.batch_max_level_var.get())
+        except tk.TclError:
+            messagebox.showwarning("Invalid Batch", "Count and levels must be numbers.")
+            return
 
-            prompt = (
-                f"Please create a D&D character with the following characteristics: \n\n"
-                f"name\n"
-                f"gender (Only Male or Female)\n"
-                f"race\n"
-                f"class\n"
-                f"level\n"
-                f"alignment\n"
-                f"background\n"
-                f"stats (Strength, Dexterity, Constitution, Intelligence, Wisdom, and Charisma).\n\n"
-                f"Please respond in valid JSON format with no backticks."
-            )
-
-            # print(prompt)
-
-            generated_character = send_prompt(prompt, model="gpt-4o", max_tokens=16384, temperature=0.7,
-                                              role_description="You are a dungeon master. You will create original text only.")
-            # print(generated_character)
-
-            # Show a success message
-            messagebox.showinfo("Success", f"Character auto-generated successfully!" )
-
-            # Parse the JSON response
-            try:
-                character_data = json.loads(generated_character)
-            except json.JSONDecodeError as e:
-                messagebox.showerror("Error", f"Failed to parse JSON response: {str(e)}")
-                return
-
-            # Validate the JSON object (check for required fields)
-            required_fields = ["name", "gender", "race", "class", "level", "alignment", "background", "stats"]
-            for field in required_fields:
-                if field not in character_data:
-                    messagebox.showerror("Error", f"Missing required field in response: {field}")
-                    return
-
-
-            # Display auto-generated character in a pop-up text box
-            ### Good Debugging, but don't really need. ###
-            # top = tk.Toplevel(self.root)
-            # top.title("New Character")
-
-            # Use a Text widget
-            # text_area = tk.Text(top, width=60, height=20)
-            # text_area.pack(padx=10, pady=10)
-            # text_area.insert(tk.END, generated_character)
-            # text_area.insert(tk.END, f"\n\n -------  JSON Check  ------- \n\n")
-            # text_area.insert(tk.END, json.dumps(character_data, indent=4))
-
-            # Populate the form
-            self.populate_form(character_data)
-
-
-
+        self.batch = BatchGenerator(
+            count, classes=[c.title() for c in classes], level_range=levels,
+            on_progress=lambda *progress: self.task_runner.call_soon(self.on_batch_progress, *progress),
+        )
+        self.batch_btn.configure(state="disabled")
+        self.batch_cancel_btn.configure(state="normal")
+        self.batch_progress.configure(maximum=count, value=0)
+        self.batch_status_label.configure(text=f"Generating {count} characters...")
+        # The batch has its own thread pool, so the shared workers stay free for chat and disk work
+        try:
+            self.batch.start(on_done=lambda saved: self.task_runner.call_soon(self.on_batch_done, saved))
         except Exception as e:
-            messagebox.showerror("Error", f"An error occurred while generating a character: {str(e)}")
-
+            self.on_batch_error(e)
+
+    def cancel_batch(self):
+        if self.batch:
+            self.batch.cancel()
+            self.batch_status_label.configure(text="Cancelling...")
+
+    def on_batch_progress(self, done, total, saved, failed):
+        self.batch_progress.configure(value=done)
+        self.batch_status_label.configure(text=f"{done}/{total} done: {saved} saved, {failed} failed")
+
+    def on_batch_done(self, saved_paths):
+        """Report the batch and refresh the party tab once (runs on the Tk thread)."""
+        batch, self.batch = self.batch, None
+        self.batch_btn.configure(state="normal")
+        self.batch_cancel_btn.configure(state="disabled")
+        self.batch_status_label.configure(
+            text=f"Saved {len(saved_paths)} of {batch.count} characters ({len(batch.errors)} failed)")
+        for index, error in batch.errors[:5]:
+            print(f"Batch character {index + 1} failed: {error}")
+
+        if saved_paths and self.update_party_callback:
+            self.update_party_callback()
 
+    def on_batch_error(self, e):
+        self.batch = None
+        self.batch_btn.configure(state="normal")
+        self.batch_cancel_btn.configure(state="disabled")
+        self.batch_status_label.configure(text="")
+        messagebox.showerror("Error", f"An error occurred during batch generation: {str(e)}")
 
     def populate_form(self, character_data):
         """Populates the character creation form with the given character data."""
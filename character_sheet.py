@@ -0,0 +1,323 @@
+# character_sheet.py
+# The character sheet format shared by the creation form, batch generation and the party tab:
+# the allowed options, the generation prompt, and writing a sheet into characters/.
+# Generated characters are requested with a JSON schema where the backend supports one, then
+# validated and repaired locally; only fields that can't be repaired are asked for again.
+
+import difflib
+import itertools
+import json
+import os
+import re
+
+from campaign_store import get_store
+from persistence import atomic_write, create_unique
+
+GENDER_OPTIONS = ["Male", "Female"]
+# characterRaces = ["Human", "Dwarf", "Elf", "Halfling", "Dragonborn", "Gnome", "Half-Elf", "Half-Orc", "Tiefling"];
+RACE_OPTIONS = ["Human", "Elf", "Dwarf", "Halfling"]
+# characterClasses = ["Barbarian", "Bard", "Cleric", "Druid", "Fighter", "Monk", "Paladin", "Ranger", "Rogue", "Sorcerer", "Warlock", "Wizard"]
+CLASS_OPTIONS = ["Barbarian", "Fighter", "Rogue", "Wizard", "Paladin", "Cleric", "Ranger", "Monk", "Druid"]
+ALIGNMENT_OPTIONS = [
+    "Lawful Good",
+    "Neutral Good",
+    "Chaotic Good",
+    "Lawful Neutral",
+    "True Neutral",
+    "Chaotic Neutral",
+    "Lawful Evil",
+    "Neutral Evil",
+    "Chaotic Evil",
+]
+STAT_NAMES = ["Strength", "Dexterity", "Constitution", "Intelligence", "Wisdom", "Charisma"]
+
+PICTURE_PATH = "pictures/"
+PROFILE_PICS = [f"{PICTURE_PATH}barbarian.png", f"{PICTURE_PATH}wizard.png", f"{PICTURE_PATH}ranger.png",
+                f"{PICTURE_PATH}fighter.png", f"{PICTURE_PATH}bard.png", f"{PICTURE_PATH}cleric.png",
+                f"{PICTURE_PATH}druid.png", f"{PICTURE_PATH}paladin.png"]
+
+# Fields every saved character has, in the order save_character writes them
+CHARACTER_FIELDS = ["name", "gender", "race", "class", "level", "alignment", "background", "stats", "profile_pic"]
+REQUIRED_FIELDS = ["name", "gender", "race", "class", "level", "alignment", "background", "stats"]
+
+
+def build_character_prompt(char_class=None, level=None, races=None, avoid_names=None):
+    """Prompt asking for one character as JSON, optionally pinned to a class, level and set of races."""
+    prompt = (
+        f"Please create a D&D character with the following characteristics: \n\n"
+        f"name\n"
+        f"gender (Only Male or Female)\n"
+        f"race\n"
+        f"class\n"
+        f"level\n"
+        f"alignment\n"
+        f"background\n"
+        f"stats (Strength, Dexterity, Constitution, Intelligence, Wisdom, and Charisma).\n\n"
+    )
+
+    constraints = []
+    if char_class:
+        constraints.append(f"The class must be {char_class}.")
+    if level:
+        constraints.append(f"The level must be {level}.")
+    if races:
+        constraints.append(f"The race must be one of: {', '.join(races)}.")
+    if avoid_names:
+        constraints.append(f"Do not use any of these names: {', '.join(avoid_names)}.")
+    if constraints:
+        prompt += "\n".join(constraints) + "\n\n"
+
+    return prompt + "Please respond in valid JSON format with no backticks."
+
+
+def character_schema(fields=None, races=None, classes=None):
+    """JSON schema for a character (or just the given fields), restricted to the form's options."""
+    properties = {
+        "name": {"type": "string"},
+        "gender": {"type": "string", "enum": GENDER_OPTIONS},
+        "race": {"type": "string", "enum": list(races or RACE_OPTIONS)},
+        "class": {"type": "string", "enum": list(classes or CLASS_OPTIONS)},
+        "level": {"type": "integer", "description": "1 to 20"},
+        "alignment": {"type": "string", "enum": ALIGNMENT_OPTIONS},
+        "background": {"type": "string"},
+        "stats": {
+            "type": "object",
+            "properties": {stat: {"type": "integer", "description": "1 to 20"} for stat in STAT_NAMES},
+            "required": STAT_NAMES,
+            "additionalProperties": False,
+        },
+    }
+    fields = [field for field in REQUIRED_FIELDS if field in (fields or REQUIRED_FIELDS)]
+    return {
+        "type": "object",
+        "properties": {field: properties[field] for field in fields},
+        "required": fields,
+        "additionalProperties": False,
+    }
+
+
+def character_response_format(fields=None, races=None, classes=None):
+    """The response_format that makes a backend return JSON matching character_schema()."""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "character", "strict": True,
+                        "schema": character_schema(fields, races, classes)},
+    }
+
+
+def parse_character_response(text):
+    """Parse the JSON object in a response, tolerating code fences and text around it.
+
+    Returns a dict, or None if there is no JSON object to be found.
+    """
+    text = re.sub(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$", "", text or "")
+    for candidate in (text, text[text.find("{"):text.rfind("}") + 1]):
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
+
+
+def nearest_option(value, options):
+    """Map a free-text value onto the closest allowed option, or None if value is empty."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    by_lower = {option.lower(): option for option in options}
+    if value.lower() in by_lower:
+        return by_lower[value.lower()]
+    # "Neutral" -> "True Neutral", "High Elf" -> "Elf"
+    contained = [option for option in options if option.lower() in value.lower() or value.lower() in option.lower()]
+    if len(contained) == 1:
+        return contained[0]
+    matches = difflib.get_close_matches(value.title(), contained or options, n=1, cutoff=0)
+    return matches[0] if matches else None
+
+
+def to_score(value, low=1, high=20):
+    """Coerce 14, 14.0, "14" or "Level 14" to an int clamped to [low, high]; None if there is no number."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = int(round(value))
+    else:
+        match = re.search(r"-?\d+", str(value or ""))
+        if not match:
+            return None
+        number = int(match.group())
+    return max(low, min(high, number))
+
+
+# Alternative keys models use for the same field
+FIELD_ALIASES = {
+    "class": ("class", "character_class", "char_class", "characterclass"),
+    "stats": ("stats", "ability_scores", "abilities", "attributes"),
+}
+
+
+def repair_character(data, races=None, classes=None):
+    """Validate a generated character and repair what can be repaired locally.
+
+    Types are coerced, level and stats are clamped to 1-20, and gender, race, class and alignment
+    are mapped to the nearest allowed option. Returns (character, missing): the repaired fields and
+    the names of required fields that are absent or unusable.
+    """
+    if not isinstance(data, dict):
+        return {}, list(REQUIRED_FIELDS)
+    lowered = {str(key).strip().lower().replace(" ", "_"): value for key, value in data.items()}
+
+    def field(name):
+        for alias in FIELD_ALIASES.get(name, (name,)):
+            if lowered.get(alias) not in (None, ""):
+                return lowered[alias]
+        return None
+
+    character = {}
+    name = field("name")
+    if isinstance(name, str) and name.strip():
+        character["name"] = name.strip()
+    for key, options in (("gender", GENDER_OPTIONS), ("race", races or RACE_OPTIONS),
+                         ("class", classes or CLASS_OPTIONS), ("alignment", ALIGNMENT_OPTIONS)):
+        value = field(key)
+        if key == "gender" and isinstance(value, str) and value.strip()[:1].lower() in ("m", "f"):
+            value = "Male" if value.strip()[:1].lower() == "m" else "Female"
+        elif key == "alignment" and isinstance(value, str) and value.strip().lower() == "neutral":
+            value = "True Neutral"
+        option = nearest_option(value, options) if isinstance(value, (str, int, float)) else None
+        if option:
+            character[key] = option
+    level = to_score(field("level"))
+    if level is not None:
+        character["level"] = level
+
+    background = field("background")
+    if isinstance(background, list):
+        background = " ".join(str(item) for item in background)
+    elif isinstance(background, dict):
+        background = "; ".join(f"{key}: {value}" for key, value in background.items())
+    if isinstance(background, str) and background.strip():
+        character["background"] = background.strip()
+
+    # Stats keyed by full name or abbreviation ("STR", "dex"), in any case
+    stats_data = field("stats")
+    if isinstance(stats_data, dict):
+        stats = {}
+        for key, value in stats_data.items():
+            stat = next((s for s in STAT_NAMES if s[:3].lower() == str(key).strip()[:3].lower()), None)
+            score = to_score(value)
+            if stat and score is not None:
+                stats[stat] = score
+        if len(stats) == len(STAT_NAMES):
+            character["stats"] = {stat: stats[stat] for stat in STAT_NAMES}
+
+    character = {name: character[name] for name in REQUIRED_FIELDS if name in character}
+    missing = [name for name in REQUIRED_FIELDS if name not in character]
+    return character, missing
+
+
+def build_missing_fields_prompt(character, missing):
+    """Prompt asking only for the fields a generated character is missing."""
+    return (
+        f"Here is a partially complete D&D character:\n\n{json.dumps(character, indent=2)}\n\n"
+        f"Please provide only the missing fields for this character: {', '.join(missing)}.\n"
+        f"Stats are Strength, Dexterity, Constitution, Intelligence, Wisdom and Charisma, each from 1 to 20.\n\n"
+        f"Please respond in valid JSON format with no backticks, containing only those fields."
+    )
+
+
+def generate_character(char_class=None, level=None, races=None, model="gpt-4o", max_tokens=2000,
+                       temperature=0.7, backend=None, max_reasks=1, use_cache=False, on_usage=None):
+    """Ask the AI for a character and return it validated, repaired and complete.
+
+    The response is constrained by a JSON schema when the backend supports one. Fields that can't be
+    repaired locally are requested again on their own, up to max_reasks times; ValueError is raised
+    if any are still missing. Generation bypasses the response cache by default, so every call gives
+    a new character.
+    """
+    from ai_helper import send_prompt
+    from llm_backends import get_backend
+
+    llm = get_backend(backend)
+    races = list(races or RACE_OPTIONS)
+    classes = [char_class] if char_class else CLASS_OPTIONS
+    role_description = "You are a dungeon master. You will create original text only."
+
+    def ask(prompt, fields=None):
+        response_format = character_response_format(fields, races, classes) if llm.supports_json_schema else None
+        response = send_prompt(prompt, model=model, max_tokens=max_tokens, temperature=temperature,
+                               role_description=role_description, on_usage=on_usage, use_cache=use_cache,
+                               backend=llm, response_format=response_format)
+        return parse_character_response(response)
+
+    character, missing = repair_character(ask(build_character_prompt(char_class, level, races)), races, classes)
+    for _ in range(max_reasks):
+        if not missing:
+            break
+        print(f"Generated character is missing {', '.join(missing)}; asking for just those fields")
+        partial = ask(build_missing_fields_prompt(character, missing), missing) or {}
+        character, missing = repair_character({**character, **partial}, races, classes)
+
+    if missing:
+        raise ValueError(f"Missing required fields in response: {', '.join(missing)}")
+
+    # Requested constraints win over whatever the model chose
+    if char_class:
+        character["class"] = char_class
+    if level:
+        character["level"] = to_score(level)
+    return character
+
+
+def default_profile_pic(char_class):
+    """The picture for a class, or the first picture if there isn't one."""
+    pic = f"{PICTURE_PATH}{str(char_class).lower()}.png"
+    return pic if pic in PROFILE_PICS else PROFILE_PICS[0]
+
+
+def make_character(data, profile_pic=None):
+    """Return a sheet with exactly the fields save_character writes, in the same order."""
+    character = {field: data.get(field) for field in CHARACTER_FIELDS}
+    character["profile_pic"] = profile_pic or data.get("profile_pic") or default_profile_pic(data.get("class"))
+    return character
+
+
+def character_file_name(character):
+    """"<name>_Level_<level>_<class>.json", with characters that can't appear in a file name replaced."""
+    base = f"{character['name']}_Level_{character['level']}_{character['class']}"
+    return re.sub(r'[\\/:*?"<>|\x00-\x1f]', "_", base).strip(" .") + ".json"
+
+
+def write_character_file(character, char_path="characters/", overwrite=True):
+    """Write a character sheet into char_path and return the file path.
+
+    With overwrite=False an existing file is never replaced: "_2", "_3", ... is added to the name
+    instead. The new file is linked into place fully written, so concurrent writers can't pick the same
+    name and a crash never leaves a truncated sheet.
+    With the campaign store enabled the sheet is stored there too, under the file name.
+    """
+    os.makedirs(char_path, exist_ok=True)
+    file_name = character_file_name(character)
+    path = os.path.join(char_path, file_name)
+
+    if overwrite:
+        atomic_write(path, json.dumps(character))
+        store_character(path, character)
+        return path
+
+    stem = file_name[:-len(".json")]
+    candidates = itertools.chain([path], (os.path.join(char_path, f"{stem}_{suffix}.json")
+                                          for suffix in itertools.count(2)))
+    path = create_unique(candidates, json.dumps(character))
+    store_character(path, character)
+    return path
+
+
+def store_character(path, character):
+    store = get_store()
+    if store is not None:
+        store.put_character(os.path.basename(path), character)
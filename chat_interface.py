@@ -1,21 +1,41 @@
 import tkinter as tk
 from tkinter import ttk
-from ai_helper import send_prompt
-import json
-from PIL import Image, ImageTk  # For handling images other than PNG
+from task_runner import get_task_runner
+from asset_cache import get_asset_cache
+from campaign_engine import SUBMIT_POLICIES, CampaignEngine, TurnCancelled, coalesce_messages, submit_policy
+from turn_metrics import TurnTrace, get_metrics_log, format_hud
+from history_search import get_history_search
+from llm_backends import CancelToken
 import os
+from bisect import bisect_left
 
 class ChatInterfaceUI:
-    def __init__(self, parent_frame, party_members, settings, chat_file):
+    STREAM_FLUSH_MS = 16  # Streamed text is written to the chat log at most once per frame
+    RECENT_TURNS = 50          # Turns rendered when a game is loaded
+    PAGE_TURNS = 25            # Turns added per page when scrolling through older history
+    MAX_RENDERED_TURNS = 150   # Hard cap on turns held in the chat log widget
+
+    def __init__(self, parent_frame, party_members, settings, chat_file, open_campaign=None):
         self.parent_frame = parent_frame
+        self.open_campaign = open_campaign  # Callback to open another campaign at a turn: (campaign_id, turn_id)
         self.party_members = party_members  # List of selected character file paths
         self.settings = settings
         self.chat_file = chat_file
-        self.party_data = self.load_party_data()  # Preload party data
-
+        self.task_runner = get_task_runner(parent_frame)
+
+        # Party, history, prompt building and saving live in the UI-free engine
+        self.engine = CampaignEngine(party_members, settings, chat_file)
+        self.engine.metrics = get_metrics_log()  # Per-turn latency records (see turn_metrics)
+        self.search_index = get_history_search()  # Full-text index over every campaign's turns
+        self.engine.search_index = self.search_index
+        self.campaign_id = self.engine.campaign_id
+        self.backend = self.engine.backend
+        self.trace = None  # TurnTrace of the turn in flight
+        self.in_flight_message = None  # Player message of the turn in flight
+        self.cancel_event = None       # Set to abort the turn in flight
+        self.queued_messages = []      # Messages sent while a turn was in flight, under the "queue" policy
+        self.closed = False
 
-        self.conversation_history = []  # Stores all messages as {id, user, response}
-        self.message_counter = 1  # Tracks the current message ID
 
         # UI
         # Split the layout into two main areas
@@ -29,7 +49,11 @@ class ChatInterfaceUI:
         self.chat_log = tk.Text(self.left_frame, height=40, width=100, state="disabled", wrap="word")
         self.chat_log.grid(row=0, column=0, columnspan=2, padx=10, pady=10)
         self.scrollbar = ttk.Scrollbar(self.left_frame, command=self.chat_log.yview)
-        self.chat_log.configure(yscrollcommand=self.scrollbar.set)
+        self.chat_log.configure(yscrollcommand=self.on_chat_scroll)
+        self.chat_log.tag_configure("search_hit", background="#fff2a8")
+        self.rendered_start = 0  # Range of conversation_history currently in the chat log
+        self.rendered_end = 0
+        self.paging_scheduled = False
         self.scrollbar.grid(row=0, column=2, sticky="ns")
 
 
@@ -37,40 +61,89 @@ class ChatInterfaceUI:
         self.chat_input = tk.Entry(self.left_frame, width=50)
         self.chat_input.grid(row=1, column=0, padx=10, pady=10, sticky="ew")
 
-        # Send button
-        send_button = ttk.Button(self.left_frame, text="Send", command=self.send_message)
-        send_button.grid(row=1, column=1, padx=10, pady=10)
+        # Send and Cancel buttons. Input stays enabled while a turn is in flight; what a new message
+        # does then is decided by the submit policy (see campaign_engine.SUBMIT_POLICIES)
+        button_frame = ttk.Frame(self.left_frame)
+        button_frame.grid(row=1, column=1, padx=10, pady=10)
+        self.send_button = ttk.Button(button_frame, text="Send", command=self.send_message)
+        self.send_button.grid(row=0, column=0)
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", command=self.cancel_turn, state="disabled")
+        self.cancel_button.grid(row=0, column=1, padx=(5, 0))
+        self.submit_policy_var = tk.StringVar(value=submit_policy())
+        ttk.Label(button_frame, text="While replying:").grid(row=1, column=0, pady=(5, 0), sticky="e")
+        ttk.Combobox(button_frame, textvariable=self.submit_policy_var, values=SUBMIT_POLICIES, state="readonly",
+                     width=8).grid(row=1, column=1, padx=(5, 0), pady=(5, 0))
+
+        # In-progress indicator, shown while the Dungeon Master is replying (otherwise the campaign's usage)
+        self.status_label = ttk.Label(self.left_frame, text=self.usage_status())
+        self.status_label.grid(row=2, column=0, padx=10, sticky="w")
+        self.waiting = False
+
+        # Optional latency HUD: last turn's breakdown and p50/p95 over the session
+        self.hud_var = tk.BooleanVar(value=os.environ.get("DUNGEONGPT_HUD") == "1")
+        ttk.Checkbutton(self.left_frame, text="Latency HUD", variable=self.hud_var,
+                        command=self.toggle_hud).grid(row=2, column=1, padx=10, sticky="e")
+        self.hud_label = ttk.Label(self.left_frame, text="No turns yet", justify="left", font="TkFixedFont")
+        self.hud_label.grid(row=3, column=0, columnspan=2, padx=10, sticky="w")
+        self.toggle_hud()
+
+        # History search: this campaign, or every campaign in saves/
+        search_frame = ttk.Frame(self.left_frame)
+        search_frame.grid(row=4, column=0, columnspan=2, padx=10, pady=(5, 0), sticky="ew")
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=50)
+        search_entry.grid(row=0, column=0, sticky="ew")
+        search_entry.bind("<Return>", lambda event: self.search_history())
+        self.search_all_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(search_frame, text="All campaigns", variable=self.search_all_var).grid(row=0, column=1, padx=5)
+        ttk.Button(search_frame, text="Search History", command=self.search_history).grid(row=0, column=2)
+        self.search_results = tk.Listbox(self.left_frame, height=6, width=100)
+        self.search_results.grid(row=5, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
+        self.search_results.bind("<<ListboxSelect>>", self.on_search_result_selected)
+        self.search_results.grid_remove()
+        self.search_hits = []  # {"campaign", "turn_id", "snippet"} per row of search_results
+
+        # Streaming state for the reply currently being rendered
+        self.stream_buffer = []
+        self.stream_started = False
+        self.flush_scheduled = False
 
         # Display party members in the right frame
         self.display_party_members()
 
+    # The engine owns the session state; these read it for rendering
+
+    @property
+    def party_data(self):
+        return self.engine.party_data
+
+    @property
+    def conversation_history(self):
+        return self.engine.conversation_history
+
+    @property
+    def memory(self):
+        return self.engine.memory
+
     def display_party_members(self):
         """Display the selected party members in the top-right corner."""
         # print("party members:")
         # print(self.party_members)
+        assets = get_asset_cache(self.parent_frame)
 
-        for idx, character_file in enumerate(self.party_members):
+        for idx, character in enumerate(self.party_data):
             try:
-                # Load character data
-                with open(character_file, "r") as f:
-                    character = json.load(f)
-
                 # Create a frame for each character
                 char_frame = ttk.Frame(self.right_frame, relief="ridge", padding=5)
                 char_frame.grid(row=idx, column=0, padx=5, pady=5, sticky="nsew")
 
+                # Display picture (shared thumbnail cache, decoded in the background)
+                pic_label = ttk.Label(char_frame, text="No Image")
+                pic_label.grid(row=0, column=0, rowspan=2, padx=5, pady=5)
                 profile_pic_path = character.get("profile_pic")
-
-                # Display picture
-                if "profile_pic" in character and os.path.exists(character["profile_pic"]):
-                    img = Image.open(character["profile_pic"])
-                    img = img.resize((100, 100))  # Resize image  # ,  Image.ANTIALIAS
-                    photo = ImageTk.PhotoImage(img)
-                    pic_label = ttk.Label(char_frame, image=photo)
-                    pic_label.image = photo  # Keep reference to avoid garbage collection
-                    pic_label.grid(row=0, column=0, rowspan=2, padx=5, pady=5)
-                else:
-                    ttk.Label(char_frame, text="No Image").grid(row=0, column=0, rowspan=2)
+                if profile_pic_path and os.path.exists(profile_pic_path):
+                    assets.get_photo(profile_pic_path, (100, 100),
+                                     lambda photo, label=pic_label: self.set_party_picture(label, photo))
 
                 # Display name, level, and class
                 ttk.Label(char_frame, text=f"Name: {character['name']}").grid(row=0, column=1, sticky="w")
@@ -79,45 +152,15 @@ class ChatInterfaceUI:
             except Exception as e:
                 print(f"Error loading character: {e}")
 
-
-    def load_party_data(self):
-        """Load party member data into memory."""
-        party_data = []
-        for character_file in self.party_members:
-            try:
-                with open(character_file, "r") as f:
-                    character = json.load(f)
-                    party_data.append(character)
-            except Exception as e:
-                print(f"Error loading character: {e}")
-        return party_data
+    def set_party_picture(self, label, photo):
+        """Show a decoded portrait next to a party member."""
+        if photo is not None and not self.closed:
+            label.configure(image=photo, text="")
+            label.image = photo  # Keep reference to avoid garbage collection
 
     def prepare_prompt(self, user_message):
-        """Prepare the prompt for OpenAI."""
-        # Include settings and context if needed
-        context = f"Game Settings: {json.dumps(self.settings)}\n"
-        context += "Party Members:\n"
-        for character in self.party_data:
-            context += f"- {character['name']} (Level {character['level']}, {character['class']})\n"
-
-        # Get recent messages
-        recent_history = self.get_recent_history(max_tokens=15000)
-        history = "\n".join(
-            f"Player: {entry['user']}\nDungeon Master: {entry['response']}" for entry in recent_history
-        )
-
-        # Combine context, history, and the new user message
-        # context == game settings and party members
-        prompt = (
-            f"{context}\n"
-            f"Conversation History:\n{history}\n"
-            f"\nDungeon Master, please respond to the player's message:\n\n"
-            f"Player: {user_message}\nDM:"
-        )
-
-        # print("prompt:")
-        # print(prompt)
-        return prompt
+        """Prepare the chat messages for OpenAI (see CampaignEngine.prepare_prompt)."""
+        return self.engine.prepare_prompt(user_message)
 
     def display_response(self, response):
         """Display the response from the Dungeon Master."""
@@ -135,139 +178,457 @@ class ChatInterfaceUI:
 
     def get_recent_history(self, max_tokens=15000):
         """Return the most recent messages that fit within the token limit."""
-        history = []
-        token_count = 0 # characters rather than tokens
+        return self.engine.get_recent_history(max_tokens)
 
-        for entry in reversed(self.conversation_history):
-            # Approximate character count for this entry (can use len or eventually an actual tokenization library)
-            entry_tokens = len(entry["user"].split()) + len(entry["response"].split())
-            if token_count + entry_tokens > max_tokens:
-                break
-            history.insert(0, entry)  # Add to the start of the history
-            token_count += entry_tokens
+    def update_memory(self):
+        """Summarise the next chapter in the background once enough turns have left the window."""
+        turns = self.engine.pending_chapter()
+        if not turns:
+            return
+        self.memory.busy = True
+        self.task_runner.submit(self.memory.summarise, turns,
+                                on_done=self.on_chapter_summarised, on_error=self.on_summary_error)
 
-        return history
+    def on_chapter_summarised(self, chapters):
+        """Adopt the new summaries and persist them."""
+        self.memory.set_chapters(chapters)
+        self.task_runner.submit(self.engine.save_memory)
+        self.update_memory()  # A freshly loaded campaign may have several chapters to catch up on
+
+    def on_summary_error(self, e):
+        """Summaries are best-effort; the next turn will retry."""
+        self.memory.busy = False
+        print(f"Error summarising chapter: {e}")
 
 
     def send_message(self):
-        """Handle sending a message."""
+        """Handle sending a message. While a turn is in flight the submit policy decides what happens."""
         message = self.chat_input.get().strip()
         if not message:
             return
+        self.chat_input.delete(0, tk.END)
+
+        if self.waiting:
+            message, self.queued_messages, cancel = coalesce_messages(
+                self.submit_policy_var.get(), self.in_flight_message, self.queued_messages, message)
+            if cancel:
+                self.cancel_turn(restore_input=False)
+            if message is None:
+                self.status_label.configure(text=self.waiting_status())
+                return
+        self.start_turn(message)
 
-        # Append message to chat log
+    def start_turn(self, message):
+        """Show the player's message and stream the Dungeon Master's reply to it."""
+        # Jump back to the end if the player was paging through older turns
+        if self.rendered_end < len(self.conversation_history):
+            self.show_latest()
+
+        # Append message to chat log; this becomes the start of the new turn
         self.chat_log.configure(state="normal")
+        turn_mark = f"turn{len(self.conversation_history)}"
+        self.chat_log.mark_set(turn_mark, "end-1c")
+        self.chat_log.mark_gravity(turn_mark, "left")
         # self.chat_log.insert(tk.END, f"You: {message}\n")
         self.chat_log.insert(tk.END, "You:\n", "bold")
         self.chat_log.insert(tk.END, f"    {message}\n")
         self.chat_log.configure(state="disabled")
-        self.chat_input.delete(0, tk.END)
+        self.chat_log.see(tk.END)
+
+        # Trace each stage of the turn
+        self.trace = TurnTrace(self.chat_file, self.engine.message_counter)
+
+        # Build the prompt (which queries the search index) and stream the reply from OpenAI on a worker
+        # thread; deltas are rendered as they arrive. Callbacks from a cancelled turn are recognised by
+        # their cancel_event and ignored.
+        cancel_event = CancelToken()
+        self.in_flight_message = message
+        self.cancel_event = cancel_event
+        self.set_waiting(True)
+        self.stream_buffer = []
+        self.stream_started = False
+        self.flush_scheduled = False
+        self.task_runner.submit(
+            self.stream_response,
+            message,
+            self.trace,
+            cancel_event,
+            on_done=lambda result: self.on_response(message, *result, cancel_event=cancel_event),
+            on_error=lambda e: self.on_response_error(e, cancel_event=cancel_event),
+        )
 
-        # Prepare the prompt
-        prompt = self.prepare_prompt(message)
-
-        # Send the prompt to OpenAI and handle the response
-        try:
-            response = send_prompt(
-                prompt,
-                model="gpt-4o",
-                max_tokens=16384,
-                temperature=0.7,
-                role_description="You are an expert dungeon master."
-            )
-            # Parse and display the response
-            # print(response)  # debugging
-            self.display_response(response)
+    def stream_response(self, message, trace, cancel_event):
+        """Build the prompt and consume the response stream (worker thread); returns the full text and token usage."""
+        with trace.span("prompt"):
+            prompt, plan = self.engine.prepare_turn(message)
 
-            self.conversation_history.append({
-                "id": self.message_counter,
-                "user": message,
-                "response": response.strip()  # After receiving the DM response
-            })
-            print("message counter: ", self.message_counter)
+        def on_delta(delta):
+            if not cancel_event.is_set():
+                self.task_runner.call_soon(self.on_delta, delta, cancel_event)
 
-            # print(self.settings)
-            self.save_chat_history(self.chat_file)
+        return self.engine.stream_reply(prompt, on_delta=on_delta, trace=trace, plan=plan, cancel_event=cancel_event)
 
-            # Increment for next go around
-            self.message_counter += 1
+    def cancel_turn(self, restore_input=True):
+        """Abort the turn in flight and remove it from the chat log (runs on the Tk thread).
 
-        except Exception as e:
-            # Handle API errors
-            self.chat_log.configure(state="normal")
-            self.chat_log.insert(tk.END, f"System: Error fetching response: {e}\n")
-            self.chat_log.configure(state="disabled")
+        Setting the turn's CancelToken aborts the HTTP response right away, which frees the worker
+        even if it was waiting for data; nothing of the turn is recorded. With restore_input the cancelled (and any queued) messages go back into the
+        input field so they can be corrected and sent again.
+        """
+        if not self.waiting:
+            return
+        self.cancel_event.set()
+        trace, self.trace = self.trace, None
+        if trace:
+            self.task_runner.submit(self.engine.finish_trace, trace, "cancelled")
 
-    def save_chat_history(self, file_path="chat_history.json"):
-        """Save the chat history to a file with checkpoint tracking."""
-        try:
-            # Check if file exists already
-            if os.path.exists(file_path):
-                with open(file_path, "r") as f:
-                    existing_data = json.load(f)
-                last_saved_index = existing_data.get("last_saved_index", 0)
-                saved_history = existing_data.get("conversation_history", [])
-            else:
-                last_saved_index = 0
-                saved_history = []
-
-            # Append only new messages
-            new_messages = [
-                entry for entry in self.conversation_history
-                if entry["id"] > last_saved_index
-            ]
-
-            if not new_messages:
-                print("No new messages to save.")
+        # Discard the partial reply along with the player's message
+        turn_mark = f"turn{len(self.conversation_history)}"
+        self.chat_log.configure(state="normal")
+        self.chat_log.delete(turn_mark, "end-1c")
+        self.chat_log.configure(state="disabled")
+        self.chat_log.mark_unset(turn_mark)
+        self.stream_buffer = []
+        self.stream_started = False
+
+        if restore_input:
+            messages = [self.in_flight_message] + self.queued_messages + [self.chat_input.get().strip()]
+            self.chat_input.delete(0, tk.END)
+            self.chat_input.insert(0, " ".join(message for message in messages if message))
+            self.queued_messages = []
+        self.in_flight_message = None
+        self.cancel_event = None
+        self.set_waiting(False)
+
+    def close(self):
+        """Remove this game's chat interface: cancel the turn in flight and destroy the widgets.
+
+        The engine is left for the caller to close on a worker thread (closing waits for pending writes).
+        """
+        self.queued_messages = []
+        self.cancel_turn(restore_input=False)
+        self.closed = True
+        self.left_frame.destroy()
+        self.right_frame.destroy()
+
+    def on_delta(self, delta, cancel_event=None):
+        """Buffer a streamed delta; the widget is updated at most once per frame."""
+        if cancel_event is not self.cancel_event:
+            return  # From a cancelled turn
+        self.stream_buffer.append(delta)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.chat_log.after(self.STREAM_FLUSH_MS, self.flush_stream)
+
+    def flush_stream(self):
+        """Insert all buffered deltas into the chat log with a single insert."""
+        if self.trace:
+            with self.trace.span("render"):
+                self._flush_stream()
+        else:
+            self._flush_stream()
+
+    def _flush_stream(self):
+        self.flush_scheduled = False
+        text = "".join(self.stream_buffer)
+        self.stream_buffer = []
+
+        if not self.stream_started:
+            text = text.lstrip()
+            if not text:
                 return
+        text = text.replace("\n", "\n    ")  # Keep the reply indented like display_response
 
-            saved_history.extend(new_messages)
+        self.chat_log.configure(state="normal")
+        if not self.stream_started:
+            self.chat_log.insert(tk.END, "Dungeon Master:\n", "bold")
+            self.chat_log.insert(tk.END, "    ")
+            self.stream_started = True
+        self.chat_log.insert(tk.END, text)
+        self.chat_log.configure(state="disabled")
+        self.chat_log.see(tk.END)
+
+    def on_response(self, message, response, usage, cancel_event=None):
+        """Finish the streamed reply and record the turn (runs on the Tk thread)."""
+        if cancel_event is not self.cancel_event:
+            # Cancelled after the reply was complete: it is discarded, but it was paid for
+            if usage:
+                self.engine.ledger.record(usage, "cancelled")
+            return
+        trace, self.trace = self.trace, None
+        self.in_flight_message = None
+        self.cancel_event = None
+        self.set_waiting(False)
+        with trace.span("render"):
+            self._flush_stream()
+
+            # print(response)  # debugging
+            self.chat_log.configure(state="normal")
+            if not self.stream_started:
+                self.chat_log.insert(tk.END, "Dungeon Master:\n", "bold")
+            self.chat_log.insert(tk.END, "\n\n")  # End the reply and add a blank line
+            self.chat_log.configure(state="disabled")
 
-            # Update last_saved_index to the highest ID in saved messages
-            updated_last_saved_index = max(entry["id"] for entry in saved_history)
+        # Only the complete reply is committed to the history and persisted
+        entry = self.engine.record_turn(message, response, usage)
+        self.status_label.configure(text=self.usage_status())
+        self.rendered_end = len(self.conversation_history)
+        self.trim_top()
+        print("message counter: ", entry["id"])
+
+        # Write to disk in the background, then log the turn's trace
+        self.task_runner.submit(self.save_turn, trace, on_done=self.on_turn_traced)
+        self.update_memory()
+        self.start_queued_turn()
+
+    def start_queued_turn(self):
+        """Play the next message queued while the last turn was in flight."""
+        if self.queued_messages and not self.waiting:
+            self.start_turn(self.queued_messages.pop(0))
+
+    def save_turn(self, trace):
+        """Save the new turn and finish its trace (runs on a worker thread)."""
+        with trace.span("save"):
+            self.save_chat_history(self.chat_file)
+        return self.engine.finish_trace(trace)
 
-            # Update the checkpoint and save the full history
-            save_data = {
-                "last_saved_index": updated_last_saved_index,
-                "conversation_history": saved_history,
-            }
-            with open(file_path, "w") as f:
-                json.dump(save_data, f, indent=4)
+    def on_turn_traced(self, record):
+        """Show the finished turn in the latency HUD."""
+        if self.closed:
+            return
+        self.hud_label.configure(text=format_hud(record, self.engine.latency))
+
+    def toggle_hud(self):
+        if self.hud_var.get():
+            self.hud_label.grid()
+        else:
+            self.hud_label.grid_remove()
+
+    def on_response_error(self, e, cancel_event=None):
+        """Handle API errors."""
+        if cancel_event is not self.cancel_event or isinstance(e, TurnCancelled):
+            return  # A cancelled turn; cancel_turn already cleaned up
+        trace, self.trace = self.trace, None
+        self.in_flight_message = None
+        self.cancel_event = None
+        self.set_waiting(False)
+        self._flush_stream()
+        if trace:
+            self.task_runner.submit(self.engine.finish_trace, trace, "error")
+        self.chat_log.configure(state="normal")
+        if self.stream_started:
+            self.chat_log.insert(tk.END, "\n")
+        self.chat_log.insert(tk.END, f"System: Error fetching response: {e}\n")
+        self.chat_log.configure(state="disabled")
 
-            print(f"Chat history saved to {file_path}")
-        except Exception as e:
-            print(f"Error saving chat history: {e}")
+        # Don't play queued messages against a failing backend; hand them back to the player
+        if self.queued_messages:
+            self.chat_input.insert(tk.END, " ".join(self.queued_messages))
+            self.queued_messages = []
+
+    def set_waiting(self, waiting):
+        """Track whether a turn is in flight; only then can it be cancelled."""
+        self.waiting = waiting
+        self.cancel_button.configure(state="normal" if waiting else "disabled")
+        self.status_label.configure(text=self.waiting_status() if waiting else self.usage_status())
+
+    def waiting_status(self):
+        text = "The Dungeon Master is thinking..."
+        if self.queued_messages:
+            text += f" ({len(self.queued_messages)} queued)"
+        return text
+
+    def usage_status(self):
+        """What the campaign has cost so far, shown while no turn is in flight."""
+        ledger = self.engine.ledger
+        if not ledger.totals["calls"]:
+            return ""
+        text = f"Campaign usage: {ledger.summary()}"
+        if self.engine.budget.per_campaign:
+            text += f" of ${self.engine.budget.per_campaign:.2f} budget"
+        return text
 
+    def save_chat_history(self, file_path="chat_history.json"):
+        """Save the chat history to a file with checkpoint tracking."""
+        self.engine.save_chat_history(file_path)
 
     def load_conversation(self, conversation_history_in):
-        """Load a conversation history into the chat log."""
+        """Load a conversation history (a list of entries, or an old-style chat document) into the chat log."""
+        self.engine.load_conversation(conversation_history_in)
+        self.update_memory()
+        self.task_runner.submit(self.engine.index_turns)  # Catch the search index up for retrieval
+
+        # Only the most recent turns are rendered; older pages load as the player scrolls up
+        self.show_latest()
+
+    # Chat log windowing. The Text widget only ever holds conversation_history[rendered_start:rendered_end]
+    # (plus the turn in progress). A mark named "turn<index>" sits at the start of each rendered turn so
+    # pages can be added or dropped at either end.
+
+    def format_turn(self, entry):
+        """Return the insert() arguments (text, tags, text, tags, ...) for one turn."""
+        segments = []
+        user_message = entry.get("user", "")
+        if user_message:
+            segments += ["You:\n", "bold", f"    {user_message}\n", ()]
+        dm_response = entry.get("response", "")
+        if dm_response:
+            segments += ["Dungeon Master:\n", "bold", "    " + dm_response.replace("\n", "\n    ") + "\n\n", ()]
+        return segments
+
+    def render_turns(self, start, end, index):
+        """Insert turns start..end-1 at index ("1.0" or "end-1c") with one insert call, marking each turn."""
+        base = self.chat_log.index(index)
+        segments, offsets, offset = [], [], 0
+        for i in range(start, end):
+            try:
+                turn = self.format_turn(self.conversation_history[i])
+            except Exception as e:
+                print(f"Error parsing conversation entry: {self.conversation_history[i]}. Error: {e}")
+                turn = []
+            offsets.append(offset)
+            offset += sum(len(text) for text in turn[::2])
+            segments += turn
+        if segments:
+            self.chat_log.insert(base, *segments)
+        for i, turn_offset in zip(range(start, end), offsets):
+            self.chat_log.mark_set(f"turn{i}", f"{base} + {turn_offset} chars")
+            self.chat_log.mark_gravity(f"turn{i}", "left")
+
+        # When prepending, the following turn's mark stayed at the insert point; move it past the new text
+        if f"turn{end}" in self.chat_log.mark_names():
+            self.chat_log.mark_set(f"turn{end}", f"{base} + {offset} chars")
+
+    def show_latest(self):
+        """Render the most recent turns, replacing whatever is in the chat log."""
+        end = len(self.conversation_history)
+        self.show_turns(max(0, end - self.RECENT_TURNS), end)
+        self.chat_log.see(tk.END)
+
+    def show_turns(self, start, end):
+        """Render turns start..end-1, replacing whatever is in the chat log."""
+        for i in range(self.rendered_start, self.rendered_end + 1):
+            self.chat_log.mark_unset(f"turn{i}")
+        self.rendered_start, self.rendered_end = start, end
+
         self.chat_log.configure(state="normal")
         self.chat_log.delete("1.0", tk.END)  # Clear existing chat log
+        self.render_turns(self.rendered_start, self.rendered_end, "end-1c")
+        self.chat_log.configure(state="disabled")
 
-        # Extract the conversation history list
-        conversation_history = conversation_history_in.get("conversation_history", [])
-        # print(conversation_history)
+    def jump_to_turn(self, turn_id):
+        """Render the turns around turn_id, scroll to it and highlight it."""
+        index = bisect_left(self.conversation_history, turn_id, key=lambda entry: entry["id"])
+        if index >= len(self.conversation_history) or self.waiting:
+            return
+        self.show_turns(max(0, index - self.PAGE_TURNS), min(len(self.conversation_history), index + self.PAGE_TURNS))
+        end = f"turn{index + 1}" if index + 1 < self.rendered_end else "end-1c"
+        self.chat_log.tag_remove("search_hit", "1.0", tk.END)
+        self.chat_log.tag_add("search_hit", f"turn{index}", end)
+        self.chat_log.yview(f"turn{index}")
+
+    # History search
+
+    def search_history(self):
+        """Search the turns of this campaign (or all campaigns) on a worker thread."""
+        text = self.search_var.get().strip()
+        if not text:
+            self.search_results.grid_remove()
+            return
+        campaign = None if self.search_all_var.get() else self.campaign_id
+        self.task_runner.submit(self.run_search, text, campaign, on_done=self.show_search_results,
+                                on_error=lambda e: print(f"Error searching history: {e}"))
 
-        for entry in conversation_history:
-            if not isinstance(entry, dict):
-                print(f"Skipping entry in conversation history: {entry}")
-                continue
+    def run_search(self, text, campaign):
+        """Bring the index up to date, then query it (runs on a worker thread)."""
+        self.search_index.sync(campaign)
+        return self.search_index.search(text, campaign)
 
-            try:
-                # Display user message
-                user_message = entry.get("user", "")
-                if user_message:
-                    # print("user message: ", user_message)
-                    self.chat_log.insert(tk.END, f"Player: {user_message}\n")
-
-                # Display Dungeon Master's response
-                dm_response = entry.get("response", "")
-                if dm_response:
-                    # print("dm response: ", dm_response)
-                    self.chat_log.insert(tk.END, f"Dungeon Master:\n    {dm_response}\n")
-                    self.chat_log.insert(tk.END, "\n")  # Add a blank line
+    def show_search_results(self, hits):
+        if self.closed:
+            return
+        self.search_hits = hits
+        self.search_results.delete(0, tk.END)
+        if not hits:
+            self.search_results.insert(tk.END, "No matching turns")
+        for hit in hits:
+            where = f"Turn {hit['turn_id']}"
+            if hit["campaign"] != self.campaign_id:
+                where = f"{hit['campaign']}, {where}"
+            self.search_results.insert(tk.END, f"{where}: {hit['snippet']}")
+        self.search_results.grid()
+
+    def on_search_result_selected(self, event=None):
+        selection = self.search_results.curselection()
+        if not selection or selection[0] >= len(self.search_hits):
+            return
+        hit = self.search_hits[selection[0]]
+        if hit["campaign"] == self.campaign_id:
+            self.jump_to_turn(hit["turn_id"])
+        elif self.open_campaign:
+            self.open_campaign(hit["campaign"], hit["turn_id"])
+
+    def load_older_page(self):
+        """Prepend the previous page of turns, dropping turns at the bottom if over the cap."""
+        if self.rendered_start == 0:
+            return
+        start = max(0, self.rendered_start - self.PAGE_TURNS)
+        anchor = f"turn{self.rendered_start}"
 
-            except Exception as e:
-                print(f"Error parsing conversation entry: {entry}. Error: {e}")
+        self.chat_log.configure(state="normal")
+        self.render_turns(start, self.rendered_start, "1.0")
+        self.rendered_start = start
+
+        # Drop the newest turns, unless a reply is still arriving at the bottom
+        if not self.waiting:
+            excess = (self.rendered_end - self.rendered_start) - self.MAX_RENDERED_TURNS
+            if excess > 0:
+                new_end = self.rendered_end - excess
+                self.chat_log.delete(f"turn{new_end}", "end-1c")
+                for i in range(new_end, self.rendered_end):
+                    self.chat_log.mark_unset(f"turn{i}")
+                self.rendered_end = new_end
+        self.chat_log.configure(state="disabled")
+        self.chat_log.yview(anchor)  # Keep the turn the player was reading in place
 
+    def load_newer_page(self):
+        """Append the next page of turns, dropping turns at the top if over the cap."""
+        if self.rendered_end >= len(self.conversation_history):
+            return
+        end = min(len(self.conversation_history), self.rendered_end + self.PAGE_TURNS)
+        self.chat_log.configure(state="normal")
+        self.render_turns(self.rendered_end, end, "end-1c")
+        self.rendered_end = end
+        self.trim_top()
         self.chat_log.configure(state="disabled")
+
+    def trim_top(self):
+        """Drop the oldest rendered turns so the widget never holds more than MAX_RENDERED_TURNS."""
+        excess = (self.rendered_end - self.rendered_start) - self.MAX_RENDERED_TURNS
+        if excess <= 0:
+            return
+        new_start = self.rendered_start + excess
+        state = self.chat_log.cget("state")
+        self.chat_log.configure(state="normal")
+        self.chat_log.delete("1.0", f"turn{new_start}")
+        self.chat_log.configure(state=state)
+        for i in range(self.rendered_start, new_start):
+            self.chat_log.mark_unset(f"turn{i}")
+        self.rendered_start = new_start
+
+    def on_chat_scroll(self, first, last):
+        """Scrollbar callback; loads another page when the view reaches either end of what is rendered."""
+        self.scrollbar.set(first, last)
+        if self.paging_scheduled:
+            return
+        if float(first) <= 0.0 and self.rendered_start > 0:
+            self.paging_scheduled = True
+            self.chat_log.after_idle(self.run_paging, self.load_older_page)
+        elif float(last) >= 1.0 and self.rendered_end < len(self.conversation_history):
+            self.paging_scheduled = True
+            self.chat_log.after_idle(self.run_paging, self.load_newer_page)
+
+    def run_paging(self, load_page):
+        """Load a page requested by on_chat_scroll."""
+        self.paging_scheduled = False
+        load_page()
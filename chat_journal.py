@@ -0,0 +1,148 @@
+# chat_journal.py
+# Append-only chat storage. Each turn is one JSON line in "<base>_chat.jsonl", next to the
+# "<base>_chat.json" path stored in the save file. The old single-document _chat.json format is
+# still written periodically as a compacted snapshot, and is migrated automatically on first use.
+
+import json
+import os
+import time
+
+from persistence import commit_file, load_json
+
+
+def journal_path(chat_file):
+    """Return the journal path for a chat file, e.g. saves/game_x_chat.json -> saves/game_x_chat.jsonl."""
+    base, _ = os.path.splitext(chat_file)
+    return base + ".jsonl"
+
+
+def iter_chat_history(chat_file):
+    """Yield conversation entries one at a time without loading the whole file into memory."""
+    path = journal_path(chat_file)
+    if os.path.exists(path):
+        last_id = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Skipping damaged line in {path}")  # e.g. a write torn by a crash
+                    continue
+                if not isinstance(entry, dict) or entry.get("id", 0) <= last_id:
+                    continue
+                last_id = entry["id"]
+                yield entry
+    elif os.path.exists(chat_file):
+        # Old format: one JSON document, which has to be parsed in full
+        data = load_json(chat_file)
+        for entry in data.get("conversation_history", []):
+            if isinstance(entry, dict):
+                yield entry
+
+
+class ChatJournal:
+    def __init__(self, chat_file, fsync_every=5, fsync_interval=2.0, snapshot_every=100):
+        self.chat_file = chat_file
+        self.path = journal_path(chat_file)
+        self.fsync_every = fsync_every        # fsync after this many unsynced turns...
+        self.fsync_interval = fsync_interval  # ...or once this many seconds have passed
+        self.snapshot_every = snapshot_every  # rewrite the _chat.json snapshot every N turns
+
+        if not os.path.exists(self.path):
+            self.migrate()
+        self.repair_tail()
+
+        self.last_id = 0
+        for entry in iter_chat_history(chat_file):
+            self.last_id = entry["id"]
+
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._since_snapshot = 0
+
+    def migrate(self):
+        """Convert an existing _chat.json into a journal (done once, atomically)."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            if os.path.exists(self.chat_file):
+                for entry in iter_chat_history(self.chat_file):
+                    f.write(json.dumps(entry) + "\n")
+                print(f"Migrated {self.chat_file} to {self.path}")
+            f.flush()
+            os.fsync(f.fileno())
+        commit_file(tmp_path, self.path)
+
+    def repair_tail(self):
+        """Drop a partially written last line so new records start on a clean line."""
+        with open(self.path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+
+            # Walk back to the last complete line
+            pos = size
+            while pos > 0:
+                step = min(4096, pos)
+                f.seek(pos - step)
+                chunk = f.read(step)
+                newline = chunk.rfind(b"\n")
+                if newline != -1:
+                    pos = pos - step + newline + 1
+                    break
+                pos -= step
+            f.truncate(pos)
+            print(f"Truncated a partial record at the end of {self.path}")
+
+    def append(self, entry):
+        """Append one turn. Entries with an id that is already stored are ignored."""
+        if entry["id"] <= self.last_id:
+            return
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        self.last_id = entry["id"]
+
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every:
+            self.write_snapshot()
+
+    def sync(self):
+        """Force buffered turns to disk."""
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def write_snapshot(self):
+        """Rewrite the compacted _chat.json snapshot from the journal, streaming entry by entry."""
+        self.sync()
+        tmp_path = self.chat_file + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write('{\n    "last_saved_index": %d,\n    "conversation_history": [' % self.last_id)
+            separator = "\n"
+            for entry in iter_chat_history(self.chat_file):
+                f.write(separator + "        " + json.dumps(entry))
+                separator = ",\n"
+            f.write("\n    ]\n}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        commit_file(tmp_path, self.chat_file)
+        self._since_snapshot = 0
+
+    def close(self):
+        """Sync outstanding turns, refresh the snapshot and close the journal."""
+        if self._file.closed:
+            return
+        self.sync()
+        if self._since_snapshot:
+            self.write_snapshot()
+        self._file.close()
@@ -0,0 +1,69 @@
+# history_index.py
+# Incremental index over a session's conversation history used to build the context window.
+# Each turn's token cost is computed once; prefix sums let the window start for any budget be
+# found with a binary search, and the chat messages for each turn are built once.
+
+from bisect import bisect_left
+
+
+def get_token_counter(model):
+    """Return a function that counts tokens for model.
+
+    Uses tiktoken when it is installed, otherwise an estimate of about four characters per token,
+    which is close to what OpenAI's tokenizers produce for English prose.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return estimate_tokens
+
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("o200k_base")
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def estimate_tokens(text):
+    """Rough token count: ~4 characters per token, never less than the number of words."""
+    return max((len(text) + 3) // 4, len(text.split()))
+
+
+def render_entry(entry):
+    """Render one turn the way it appears in the prompt."""
+    return f"Player: {entry.get('user', '')}\nDungeon Master: {entry.get('response', '')}"
+
+
+class HistoryIndex:
+    def __init__(self, model="gpt-4o"):
+        self.count_tokens = get_token_counter(model)
+        self.entries = []
+        self.token_prefix = [0]   # token_prefix[i] == total cost of entries[:i]
+        self.messages = []        # user/assistant message pair for each entry, flattened
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, entry):
+        """Add a turn, computing its cost and chat messages once."""
+        self.entries.append(entry)
+        self.messages.append({"role": "user", "content": entry.get("user", "")})
+        self.messages.append({"role": "assistant", "content": entry.get("response", "")})
+        self.token_prefix.append(self.token_prefix[-1] + self.count_tokens(render_entry(entry)))
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+    def window_start(self, max_tokens):
+        """Index of the oldest entry such that entries[start:] cost at most max_tokens."""
+        total = self.token_prefix[-1]
+        return bisect_left(self.token_prefix, total - max_tokens)
+
+    def recent(self, max_tokens):
+        """Return the most recent entries that fit within the token limit."""
+        return self.entries[self.window_start(max_tokens):]
+
+    def messages_from(self, start):
+        """Return entries[start:] as alternating user/assistant chat messages."""
+        return self.messages[2 * start:]
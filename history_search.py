@@ -0,0 +1,220 @@
+# history_search.py
+# Full-text search over every turn of every campaign in saves/. Turns are indexed in an SQLite FTS5
+# table in cache/search/history.db. The index keeps, per campaign, how far into the chat journal it
+# has read (a byte offset) and the last turn ID it holds. Syncing only reads journal lines added
+# since then, and new turns are added as they are saved, so whole chat files are never loaded.
+# Queries are ranked with FTS5's built-in BM25.
+
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from campaign_store import campaign_id_for, get_store
+from chat_journal import iter_chat_history, journal_path
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS turns USING fts5 (
+    user, response, campaign UNINDEXED, turn_id UNINDEXED, tokenize = 'porter unicode61', prefix = '2 3'
+);
+CREATE TABLE IF NOT EXISTS sources (
+    campaign TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL DEFAULT 0,  -- bytes of the chat journal already indexed
+    last_id INTEGER NOT NULL DEFAULT 0  -- newest turn indexed
+);
+"""
+
+DEFAULT_INDEX_FILE = "cache/search/history.db"
+
+
+def to_match_query(text):
+    """Turn what the player typed into an FTS5 query, or None if there is nothing to search for.
+
+    "Quoted phrases" stay phrases, every other word must appear, and the last word also matches as
+    a prefix so results show up while typing.
+    """
+    phrases = [phrase.strip() for phrase in re.findall(r'"([^"]*)"', text) if phrase.strip()]
+    words = re.findall(r"\w+", re.sub(r'"[^"]*"?', " ", text))
+    terms = ['"' + " ".join(re.findall(r"\w+", phrase)) + '"' for phrase in phrases]
+    terms += [f'"{word}"' for word in words]
+    if not terms:
+        return None
+    if words:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+class JournalReader:
+    """Iterates over the complete journal lines after a byte offset; offset advances past each one read."""
+
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.offset = offset
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    return  # A turn still being written; picked up by the next sync
+                self.offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and "id" in entry:
+                    yield entry
+
+
+class HistorySearch:
+    def __init__(self, path=DEFAULT_INDEX_FILE, saves_dir="saves"):
+        self.path = path
+        self.saves_dir = saves_dir
+        self._local = threading.local()
+        self._write_lock = threading.Lock()  # One writer at a time within this process
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        """This thread's connection."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def source(self, campaign):
+        """(offset, last_id) for a campaign."""
+        row = self.connection().execute("SELECT offset, last_id FROM sources WHERE campaign = ?",
+                                        (campaign,)).fetchone()
+        return row or (0, 0)
+
+    def _insert(self, db, campaign, entries, last_id):
+        """Insert entries newer than last_id; returns the new last_id and how many were added."""
+        added = 0
+        for entry in entries:
+            if entry.get("id", 0) <= last_id:
+                continue
+            db.execute("INSERT INTO turns (user, response, campaign, turn_id) VALUES (?, ?, ?, ?)",
+                       (entry.get("user", ""), entry.get("response", ""), campaign, entry["id"]))
+            last_id = entry["id"]
+            added += 1
+        return last_id, added
+
+    def add_turns(self, campaign, entries):
+        """Index a campaign's newly recorded turns (turns already indexed are skipped)."""
+        with self._write_lock:
+            db = self.connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                offset, last_id = self.source(campaign)
+                new_last_id, _ = self._insert(db, campaign, entries, last_id)
+                if new_last_id != last_id:
+                    db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (campaign, offset, new_last_id))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def sync(self, campaign=None):
+        """Index whatever was added to the chat journals (or the campaign store) since the last sync.
+
+        With a campaign ID only that campaign is synced. Returns the number of turns added.
+        """
+        if campaign is not None:
+            return self.sync_campaign(campaign)
+        campaigns = set()
+        if os.path.isdir(self.saves_dir):
+            for dir_entry in os.scandir(self.saves_dir):
+                if dir_entry.name.endswith("_chat.jsonl") or (
+                        dir_entry.name.endswith("_chat.json")
+                        and not os.path.exists(journal_path(dir_entry.path))):
+                    campaigns.add(campaign_id_for(dir_entry.name))
+        store = get_store()
+        if store is not None:
+            campaigns.update(campaign["id"] for campaign in store.list_campaigns())
+        return sum(self.sync_campaign(campaign) for campaign in sorted(campaigns))
+
+    def sync_campaign(self, campaign):
+        chat_file = os.path.join(self.saves_dir, f"{campaign}_chat.json")
+        path = journal_path(chat_file)
+        store = get_store()
+        with self._write_lock:
+            db = self.connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                offset, last_id = self.source(campaign)
+                added = 0
+                if os.path.exists(path):
+                    size = os.path.getsize(path)
+                    if size < offset:  # The journal was replaced; index it again from scratch
+                        db.execute("DELETE FROM turns WHERE campaign = ?", (campaign,))
+                        offset, last_id = 0, 0
+                    if size > offset:
+                        reader = JournalReader(path, offset)
+                        last_id, added = self._insert(db, campaign, reader, last_id)
+                        offset = reader.offset
+                elif last_id == 0 and os.path.exists(chat_file):
+                    last_id, added = self._insert(db, campaign, iter_chat_history(chat_file), last_id)  # Old format
+                if store is not None and store.get_campaign(campaign) is not None:
+                    last_id, from_store = self._insert(db, campaign, store.iter_turns(campaign, after_id=last_id),
+                                                       last_id)
+                    added += from_store
+                db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (campaign, offset, last_id))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return added
+
+    def search(self, text, campaign=None, limit=50):
+        """Best matches first, as {"campaign", "turn_id", "snippet"} dicts."""
+        query = to_match_query(text)
+        if query is None:
+            return []
+        sql = ("SELECT campaign, turn_id, snippet(turns, -1, '[', ']', '…', 12) FROM turns "
+               "WHERE turns MATCH ?")
+        params = [query]
+        if campaign is not None:
+            sql += " AND campaign = ?"
+            params.append(campaign)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        try:
+            rows = self.connection().execute(sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            print(f"Search error for {query}: {e}")
+            return []
+        return [{"campaign": campaign_id, "turn_id": turn_id, "snippet": snippet.replace("\n", " ")}
+                for campaign_id, turn_id, snippet in rows]
+
+    def rank(self, match_query, campaign, before_id=None, limit=10):
+        """Turn IDs of a campaign matching an FTS5 query, best BM25 score first, optionally older than before_id."""
+        sql = "SELECT turn_id FROM turns WHERE turns MATCH ? AND campaign = ?"
+        params = [match_query, campaign]
+        if before_id is not None:
+            sql += " AND turn_id < ?"
+            params.append(before_id)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        try:
+            return [row[0] for row in self.connection().execute(sql, params)]
+        except sqlite3.OperationalError as e:
+            print(f"Search error for {match_query}: {e}")
+            return []
+
+
+_search = None
+_search_lock = threading.Lock()
+
+
+def get_history_search():
+    """The shared history index (DUNGEONGPT_SEARCH_INDEX, default cache/search/history.db) over saves/."""
+    global _search
+    with _search_lock:
+        if _search is None:
+            _search = HistorySearch(os.environ.get("DUNGEONGPT_SEARCH_INDEX", DEFAULT_INDEX_FILE))
+        return _search
@@ -0,0 +1,632 @@
+# llm_backends.py
+# Interchangeable LLM backends behind one interface:
+#   openai  - OpenAI's API
+#   local   - any OpenAI-compatible server (llama.cpp, vLLM, Ollama, LM Studio, ...)
+#   gemini  - Google Gemini
+#   fake    - deterministic in-process replies, for tests and load testing without an API key
+#
+# Every backend exposes complete() and stream(), plus astream() for asyncio callers. Calls have a per-request deadline, are retried with
+# jittered exponential backoff on 429/5xx/connection errors, and non-streaming calls can be hedged:
+# if the first attempt is slow, a second one is started and whichever finishes first wins.
+
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+import random
+import socket
+import threading
+import time
+
+from history_index import estimate_tokens
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# Shared pool for hedged requests
+_hedge_pool = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="LLMHedge")
+
+
+class StreamCancelled(Exception):
+    """Raised by LLMBackend.stream() once its CancelToken is set; the request has been aborted."""
+
+
+class CancelToken:
+    """A cancel flag (like threading.Event) that also runs abort callbacks when it is set.
+
+    Backends register a callback that aborts the HTTP response, so a stream blocked waiting for its
+    first byte or a slow chunk is interrupted at once instead of at the next chunk.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    def set(self):
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error aborting a request: {e}")
+
+    def on_cancel(self, callback):
+        """Call callback() when the token is set (at once if it already is)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+def shutdown_response(response):
+    """Abort a streaming httpx response from another thread.
+
+    Closing a socket does not wake a read blocked on it in another thread, so the socket (exposed
+    through the response's network_stream extension) is shut down; the blocked read then fails.
+    """
+    network_stream = response.extensions.get("network_stream")
+    sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # Already closed
+    response.close()
+
+
+def is_retryable(error):
+    """True for rate limits, server errors, timeouts and dropped connections."""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # openai.APIConnectionError / APITimeoutError, without importing openai here
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ServiceUnavailable", "DeadlineExceeded")
+
+
+def call_with_retries(func, deadline, max_attempts=4, base_delay=0.5, max_delay=8.0):
+    """Call func(timeout) until it succeeds, retrying retryable errors with full-jitter backoff.
+
+    timeout is the time left before deadline (a time.monotonic() value), so no attempt can outlive it.
+    """
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("LLM request deadline exceeded")
+        try:
+            return func(remaining)
+        except Exception as e:
+            attempt += 1
+            delay = retry_delay(e, attempt, deadline, max_attempts, base_delay, max_delay)
+            if delay is None:
+                raise
+            print(f"LLM request failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+async def async_call_with_retries(func, deadline, max_attempts=4, base_delay=0.5, max_delay=8.0):
+    """call_with_retries() for a coroutine function: await func(timeout) with the same retry policy."""
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("LLM request deadline exceeded")
+        try:
+            return await func(remaining)
+        except Exception as e:
+            attempt += 1
+            delay = retry_delay(e, attempt, deadline, max_attempts, base_delay, max_delay)
+            if delay is None:
+                raise
+            print(f"LLM request failed ({e}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+def retry_delay(error, attempt, deadline, max_attempts, base_delay, max_delay):
+    """Full-jitter backoff before the next attempt, or None if the error should be raised."""
+    if attempt >= max_attempts or not is_retryable(error):
+        return None
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    if time.monotonic() + delay >= deadline:
+        return None
+    return delay
+
+
+def hedged_call(func, hedge_after):
+    """Run func(); if it hasn't finished after hedge_after seconds, race a second copy against it."""
+    if not hedge_after:
+        return func()
+
+    first = _hedge_pool.submit(func)
+    try:
+        return first.result(timeout=hedge_after)
+    except concurrent.futures.TimeoutError:
+        pass
+
+    pending = {first, _hedge_pool.submit(func)}
+    error = None
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()  # The loser finishes in the background and is discarded
+            error = future.exception()
+    raise error
+
+
+class LLMBackend:
+    """Base class. Subclasses implement _complete() and _open_stream()."""
+
+    name = "base"
+    supports_json_schema = False
+
+    def __init__(self, timeout=None, max_attempts=4, hedge_after=None):
+        # Overall deadline per request, in seconds
+        self.timeout = timeout or float(os.environ.get("DUNGEONGPT_TIMEOUT", 120))
+        self.max_attempts = max_attempts  # including the first attempt
+        # Seconds before a hedged second request is started (non-streaming calls only); off by default
+        if hedge_after is None and os.environ.get("DUNGEONGPT_HEDGE_AFTER"):
+            hedge_after = float(os.environ["DUNGEONGPT_HEDGE_AFTER"])
+        self.hedge_after = hedge_after
+
+    def map_model(self, model):
+        return model
+
+    def complete(self, messages, model, max_tokens, temperature, on_usage=None, timeout=None, **options):
+        """Return the full response text."""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        model = self.map_model(model)
+
+        def attempt(remaining):
+            return hedged_call(
+                lambda: self._complete(messages, model, max_tokens, temperature, remaining, **options),
+                self.hedge_after,
+            )
+
+        content, usage = call_with_retries(attempt, deadline, max_attempts=self.max_attempts)
+        if on_usage and usage:
+            on_usage(usage)
+        return content
+
+    def stream(self, messages, model, max_tokens, temperature, on_usage=None, timeout=None, cancel=None,
+               **options):
+        """Yield text deltas. Connecting is retried; once text has been yielded, errors are raised.
+
+        Setting cancel (a CancelToken) aborts the request, even while it waits for data, and raises
+        StreamCancelled.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        model = self.map_model(model)
+
+        def cancelled():
+            return cancel is not None and cancel.is_set()
+
+        # Retry until the first delta arrives, so a failed attempt never leaves partial output behind
+        def connect(remaining):
+            if cancelled():
+                raise StreamCancelled()
+            chunks = self._open_stream(messages, model, max_tokens, temperature, remaining, cancel=cancel, **options)
+            try:
+                return chunks, next(chunks)
+            except StopIteration:
+                return chunks, None
+            except BaseException as e:
+                chunks.close()  # Release the failed attempt's HTTP response before retrying
+                if cancelled():
+                    raise StreamCancelled() from e
+                raise
+
+        chunks, first = call_with_retries(connect, deadline, max_attempts=self.max_attempts)
+        try:
+            item = first
+            while item is not None:
+                delta, usage = item
+                if usage and on_usage:
+                    on_usage(usage)
+                if delta:
+                    yield delta
+                if time.monotonic() > deadline:
+                    raise TimeoutError("LLM stream deadline exceeded")
+                try:
+                    item = next(chunks, None)
+                except Exception as e:
+                    if cancelled():
+                        raise StreamCancelled() from e  # The aborted response failed the read
+                    raise
+                if cancelled():
+                    raise StreamCancelled()
+        finally:
+            chunks.close()
+
+    async def astream(self, messages, model, max_tokens, temperature, on_usage=None, timeout=None, **options):
+        """Async version of stream(): an async generator of text deltas, for use on an event loop."""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        model = self.map_model(model)
+
+        async def connect(remaining):
+            chunks = self._open_astream(messages, model, max_tokens, temperature, remaining, **options)
+            try:
+                return chunks, await chunks.__anext__()
+            except StopAsyncIteration:
+                return chunks, None
+            except BaseException:
+                await chunks.aclose()  # Release the failed attempt's HTTP response before retrying
+                raise
+
+        chunks, first = await async_call_with_retries(connect, deadline, max_attempts=self.max_attempts)
+        try:
+            item = first
+            while item is not None:
+                delta, usage = item
+                if usage and on_usage:
+                    on_usage(usage)
+                if delta:
+                    yield delta
+                if time.monotonic() > deadline:
+                    raise TimeoutError("LLM stream deadline exceeded")
+                item = await anext(chunks, None)
+        finally:
+            await chunks.aclose()
+
+    def _complete(self, messages, model, max_tokens, temperature, timeout, **options):
+        """Return (content, usage dict or None)."""
+        raise NotImplementedError
+
+    def _open_stream(self, messages, model, max_tokens, temperature, timeout, cancel=None, **options):
+        """Return a generator of (delta, usage dict or None) pairs. It registers an abort with cancel if it can."""
+        raise NotImplementedError
+
+    async def _open_astream(self, messages, model, max_tokens, temperature, timeout, **options):
+        """Async generator of (delta, usage) pairs. By default the blocking stream runs on a thread."""
+        loop = asyncio.get_running_loop()
+        chunks = self._open_stream(messages, model, max_tokens, temperature, timeout, **options)
+        done = object()
+        try:
+            while True:
+                item = await loop.run_in_executor(None, next, chunks, done)
+                if item is done:
+                    return
+                yield item
+        finally:
+            try:
+                await loop.run_in_executor(None, chunks.close)
+            except ValueError:
+                pass  # Still running on the executor after a cancellation; it is dropped when it finishes
+
+
+def usage_to_dict(usage, model):
+    """Extract token counts from an OpenAI response's usage object."""
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "model": model,
+        "prompt_tokens": usage.prompt_tokens,
+        "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details else 0,
+        "completion_tokens": usage.completion_tokens,
+    }
+
+
+class OpenAIBackend(LLMBackend):
+    name = "openai"
+    supports_json_schema = True
+
+    def __init__(self, api_key=None, base_url=None, max_connections=20, **kwargs):
+        super().__init__(**kwargs)
+        import httpx
+        from openai import OpenAI
+
+        # One keep-alive connection pool shared by every call through this backend
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                                keepalive_expiry=60),
+            timeout=httpx.Timeout(self.timeout, connect=10.0),
+        )
+        self.client = OpenAI(
+            api_key=api_key or os.environ.get("OPENAI_API_KEY"),
+            base_url=base_url,
+            http_client=self.http_client,
+            max_retries=0,  # Retries are handled by call_with_retries
+        )
+        self.max_connections = max_connections
+        self._async_client = None  # Created on first astream(), on the event loop that uses it
+
+    def async_client(self):
+        """The AsyncOpenAI client, with its own keep-alive pool shared by every async call."""
+        if self._async_client is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections, keepalive_expiry=60),
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+            )
+            self._async_client = AsyncOpenAI(api_key=self.client.api_key, base_url=self.client.base_url,
+                                             http_client=http_client, max_retries=0)
+        return self._async_client
+
+    def _complete(self, messages, model, max_tokens, temperature, timeout, response_format=None):
+        extra = {"response_format": response_format} if response_format else {}
+        response = self.client.chat.completions.create(
+            messages=messages,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            timeout=timeout,
+            **extra,
+        )
+        return response.choices[0].message.content, usage_to_dict(response.usage, model)
+
+    def _open_stream(self, messages, model, max_tokens, temperature, timeout, response_format=None, cancel=None):
+        extra = {"response_format": response_format} if response_format else {}
+        stream = self.client.chat.completions.create(
+            messages=messages,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            timeout=timeout,
+            stream=True,
+            stream_options={"include_usage": True},  # The final chunk carries the token counts
+            **extra,
+        )
+        # Cancelling from another thread shuts the connection down, interrupting a blocked read
+        abort = lambda: shutdown_response(stream.response)
+        if cancel is not None:
+            cancel.on_cancel(abort)
+        try:
+            for chunk in stream:
+                usage = usage_to_dict(chunk.usage, model) if getattr(chunk, "usage", None) else None
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta or usage:
+                    yield delta, usage
+        finally:
+            if cancel is not None:
+                cancel.remove(abort)
+            stream.close()  # Closing early aborts the HTTP response
+
+    async def _open_astream(self, messages, model, max_tokens, temperature, timeout, response_format=None):
+        extra = {"response_format": response_format} if response_format else {}
+        stream = await self.async_client().chat.completions.create(
+            messages=messages,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            timeout=timeout,
+            stream=True,
+            stream_options={"include_usage": True},
+            **extra,
+        )
+        try:
+            async for chunk in stream:
+                usage = usage_to_dict(chunk.usage, model) if getattr(chunk, "usage", None) else None
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta or usage:
+                    yield delta, usage
+        finally:
+            await stream.close()
+
+
+class LocalBackend(OpenAIBackend):
+    """Any server that speaks the OpenAI chat completions API."""
+
+    name = "local"
+    supports_json_schema = False
+
+    def __init__(self, base_url=None, model=None, **kwargs):
+        super().__init__(
+            api_key=os.environ.get("DUNGEONGPT_LOCAL_API_KEY", "not-needed"),
+            base_url=base_url or os.environ.get("DUNGEONGPT_LOCAL_BASE_URL", "http://localhost:8000/v1"),
+            **kwargs,
+        )
+        self.model = model or os.environ.get("DUNGEONGPT_LOCAL_MODEL")
+
+    def map_model(self, model):
+        return self.model or model
+
+    def _complete(self, messages, model, max_tokens, temperature, timeout, response_format=None):
+        return super()._complete(messages, model, max_tokens, temperature, timeout)
+
+    def _open_stream(self, messages, model, max_tokens, temperature, timeout, response_format=None, cancel=None):
+        return super()._open_stream(messages, model, max_tokens, temperature, timeout, cancel=cancel)
+
+    def _open_astream(self, messages, model, max_tokens, temperature, timeout, response_format=None):
+        return super()._open_astream(messages, model, max_tokens, temperature, timeout)
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+    supports_json_schema = True
+
+    # The app asks for OpenAI model names; use the closest Gemini tier
+    MODEL_MAP = {"gpt-4o": "gemini-1.5-pro", "gpt-4o-mini": "gemini-1.5-flash"}
+
+    def __init__(self, api_key=None, **kwargs):
+        super().__init__(**kwargs)
+        import google.generativeai as genai
+
+        self.genai = genai
+        genai.configure(api_key=api_key or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY"))
+
+    def map_model(self, model):
+        return self.MODEL_MAP.get(model, model)
+
+    def _request(self, messages, model, max_tokens, temperature, response_format):
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        contents = [
+            {"role": "model" if m["role"] == "assistant" else "user", "parts": [m["content"]]}
+            for m in messages if m["role"] != "system"
+        ]
+        config = {"max_output_tokens": max_tokens, "temperature": temperature}
+        if response_format:
+            config["response_mime_type"] = "application/json"
+        gemini_model = self.genai.GenerativeModel(model, system_instruction=system or None)
+        return gemini_model, contents, config
+
+    @staticmethod
+    def _usage(response, model):
+        metadata = getattr(response, "usage_metadata", None)
+        if not metadata:
+            return None
+        return {
+            "model": model,
+            "prompt_tokens": metadata.prompt_token_count,
+            "cached_tokens": getattr(metadata, "cached_content_token_count", 0) or 0,
+            "completion_tokens": metadata.candidates_token_count,
+        }
+
+    def _complete(self, messages, model, max_tokens, temperature, timeout, response_format=None):
+        gemini_model, contents, config = self._request(messages, model, max_tokens, temperature, response_format)
+        response = gemini_model.generate_content(contents, generation_config=config,
+                                                 request_options={"timeout": timeout})
+        return response.text, self._usage(response, model)
+
+    def _open_stream(self, messages, model, max_tokens, temperature, timeout, response_format=None, cancel=None):
+        # The Gemini SDK has no handle on the connection; a cancelled stream stops at its next chunk
+        gemini_model, contents, config = self._request(messages, model, max_tokens, temperature, response_format)
+        response = gemini_model.generate_content(contents, generation_config=config, stream=True,
+                                                 request_options={"timeout": timeout})
+        for chunk in response:
+            try:
+                text = chunk.text
+            except (ValueError, IndexError):
+                continue  # Safety or finish-only chunks have no text parts
+            yield text, None
+        yield None, self._usage(response, model)
+
+
+class FakeBackend(LLMBackend):
+    """Deterministic replies generated from a hash of the messages. No network, no API key."""
+
+    name = "fake"
+    supports_json_schema = True
+
+    WORDS = ("the", "party", "torch", "shadow", "ancient", "door", "creaks", "goblin", "whispers", "gold",
+             "tavern", "road", "storm", "ruins", "a", "of", "and", "beneath", "glimmers", "dragon")
+
+    def __init__(self, reply_words=60, delay_per_token=0.0, first_token_delay=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.reply_words = reply_words
+        self.delay_per_token = delay_per_token      # simulate generation speed
+        self.first_token_delay = first_token_delay  # simulate time to first token
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def reply(self, messages, response_format=None):
+        digest = hashlib.sha256(repr(messages).encode("utf-8")).digest()
+        rng = random.Random(digest)
+        if response_format and response_format.get("type") == "json_schema":
+            return json.dumps(self.fake_json(response_format["json_schema"]["schema"], rng))
+        words = [rng.choice(self.WORDS) for _ in range(self.reply_words)]
+        return "The Dungeon Master says: " + " ".join(words) + "."
+
+    def fake_json(self, schema, rng):
+        """A value matching a (simple) JSON schema."""
+        if "enum" in schema:
+            return rng.choice(schema["enum"])
+        kind = schema.get("type")
+        if kind == "object":
+            return {key: self.fake_json(value, rng) for key, value in schema.get("properties", {}).items()}
+        if kind == "array":
+            return [self.fake_json(schema.get("items", {}), rng) for _ in range(3)]
+        if kind == "integer":
+            return rng.randint(1, 20)
+        if kind == "number":
+            return rng.uniform(1, 20)
+        if kind == "boolean":
+            return rng.random() < 0.5
+        return " ".join(rng.choice(self.WORDS) for _ in range(3)).title()
+
+    def _usage(self, messages, content, model):
+        return {
+            "model": model,
+            "prompt_tokens": sum(estimate_tokens(m["content"]) for m in messages),
+            "cached_tokens": 0,
+            "completion_tokens": estimate_tokens(content),
+        }
+
+    def _complete(self, messages, model, max_tokens, temperature, timeout, response_format=None):
+        with self._lock:
+            self.calls += 1
+        content = self.reply(messages, response_format)
+        time.sleep(self.first_token_delay + self.delay_per_token * self.reply_words)
+        return content, self._usage(messages, content, model)
+
+    def _open_stream(self, messages, model, max_tokens, temperature, timeout, response_format=None, cancel=None):
+        with self._lock:
+            self.calls += 1
+        content = self.reply(messages, response_format)
+        self._pause(self.first_token_delay, cancel)
+        for i, word in enumerate(content.split(" ")):
+            self._pause(self.delay_per_token, cancel)
+            yield (word if i == 0 else " " + word), None
+        yield None, self._usage(messages, content, model)
+
+    @staticmethod
+    def _pause(seconds, cancel):
+        """Simulated network wait; a cancel interrupts it like an aborted connection."""
+        if cancel is None:
+            time.sleep(seconds)
+        elif cancel.wait(seconds):
+            raise ConnectionError("Connection aborted")
+
+    async def _open_astream(self, messages, model, max_tokens, temperature, timeout, response_format=None):
+        with self._lock:
+            self.calls += 1
+        content = self.reply(messages, response_format)
+        await asyncio.sleep(self.first_token_delay)
+        for i, word in enumerate(content.split(" ")):
+            await asyncio.sleep(self.delay_per_token)
+            yield (word if i == 0 else " " + word), None
+        yield None, self._usage(messages, content, model)
+
+
+BACKEND_CLASSES = {
+    "openai": OpenAIBackend,
+    "local": LocalBackend,
+    "gemini": GeminiBackend,
+    "fake": FakeBackend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(backend=None):
+    """Return a shared backend instance by name (or pass an instance through).
+
+    The default comes from DUNGEONGPT_BACKEND, falling back to "openai". Instances are created on
+    first use and reused, so their connection pools are shared across calls.
+    """
+    if isinstance(backend, LLMBackend):
+        return backend
+    name = backend or os.environ.get("DUNGEONGPT_BACKEND", "openai")
+    with _backends_lock:
+        if name not in _backends:
+            if name not in BACKEND_CLASSES:
+                raise ValueError(f"Unknown LLM backend '{name}'. Choose from: {', '.join(BACKEND_CLASSES)}")
+            _backends[name] = BACKEND_CLASSES[name]()
+        return _backends[name]
+
+
+def register_backend(name, backend):
+    """Make a configured backend instance available by name (e.g. a FakeBackend with delays)."""
+    with _backends_lock:
+        _backends[name] = backend
@@ -1,20 +1,29 @@
+import time
+STARTUP_T0 = time.perf_counter()
+
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import ttk, messagebox
-import json
 import os
-from PIL import Image, ImageTk
-from character_creation import CharacterCreatorUI
-from party_selection import PartySelectionUI
-from chat_interface import ChatInterfaceUI
-from settings_tab import SettingsUI
+import sys
+from task_runner import get_task_runner
+from asset_cache import get_asset_cache
+from startup_timer import PhaseTimer
+
+# The tab modules (and through them openai, PIL, ...) are imported when a tab is first built
+IMPORTS_DONE = time.perf_counter()
 
 class DungeonGPT:
-    def __init__(self, root):
+    def __init__(self, root, eager=False, timer=None):
         self.root = root
+        self.timer = timer or PhaseTimer()
+        t0 = time.perf_counter()
         self.root.title("DungeonGPT")
         self.root.geometry("1220x1200")   # width x length
 
+        # Shared background worker pool for network and disk work
+        self.task_runner = get_task_runner(self.root)
+
         # Configure the root window to expand
         self.root.grid_rowconfigure(0, weight=1)
         self.root.grid_columnconfigure(0, weight=1)
@@ -42,46 +51,124 @@ class DungeonGPT:
         self.notebook = ttk.Notebook(scrollable_frame)
         self.notebook.pack(expand=True, fill="both")
 
+        self.timer.record("main window", time.perf_counter() - t0)
+
         # Tab 0: Start Game
-        self.start_frame = ttk.Frame(self.notebook)
-        self.notebook.add(self.start_frame, text="Start Game")
-        self.add_start_menu_options()
+        with self.timer.phase("start tab"):
+            self.start_frame = ttk.Frame(self.notebook)
+            self.notebook.add(self.start_frame, text="Start Game")
+            self.add_start_menu_options()
 
+        # Tabs 1-4 start empty and are built the first time they are selected
         # Tab 1: Character Creation
         self.create_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.create_frame, text="Character Creation")
-        self.create_ui = CharacterCreatorUI(self.create_frame, update_party_callback=self.update_party_tab)
+        self.create_ui = None
 
         # Tab 2: Select Party
         self.party_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.party_frame, text="Select Party")
-        self.party_ui = PartySelectionUI(self.party_frame, on_party_selected=self.open_settings_tab)
+        self.party_ui = None
 
         # Tab 3: Settings
         self.settings_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.settings_frame, text="Settings")
-        self.settings_ui = SettingsUI(self.settings_frame, party_members=[], on_settings_saved=self.initialize_chat_tab)
+        self.settings_ui = None
 
         # Tab 4: Chat Interface
         self.chat_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.chat_frame, text="Chat Interface")
         self.chat_interface_ui = None
 
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+
+        if eager:
+            self.build_create_tab()
+            self.build_party_tab()
+            self.build_settings_tab()
+
+    def on_tab_changed(self, event=None):
+        """Build a tab the first time it is shown."""
+        selected = self.notebook.nametowidget(self.notebook.select())
+        if selected is self.create_frame:
+            self.build_create_tab()
+        elif selected is self.party_frame:
+            self.build_party_tab()
+        elif selected is self.settings_frame:
+            self.build_settings_tab()
+
+    def build_create_tab(self):
+        if self.create_ui is None:
+            with self.timer.phase("character creation tab"):
+                from character_creation import CharacterCreatorUI
+                self.create_ui = CharacterCreatorUI(self.create_frame, update_party_callback=self.update_party_tab)
+        return self.create_ui
+
+    def build_party_tab(self):
+        if self.party_ui is None:
+            with self.timer.phase("party selection tab"):
+                from party_selection import PartySelectionUI
+                self.party_ui = PartySelectionUI(self.party_frame, on_party_selected=self.open_settings_tab)
+        return self.party_ui
+
+    def build_settings_tab(self):
+        if self.settings_ui is None:
+            with self.timer.phase("settings tab"):
+                from settings_tab import SettingsUI
+                self.settings_ui = SettingsUI(self.settings_frame, party_members=[], on_settings_saved=self.initialize_chat_tab)
+        return self.settings_ui
+
+    def create_chat_interface(self, party_members, settings, chat_file):
+        """Build the chat interface for a game (the module is imported on first use), replacing any open game."""
+        previous_engine = self.close_chat_interface()
+        if previous_engine is not None:
+            self.task_runner.submit(self.close_engine, previous_engine)
+        from chat_interface import ChatInterfaceUI
+        self.chat_interface_ui = ChatInterfaceUI(
+            self.chat_frame, party_members=party_members, settings=settings, chat_file=chat_file,
+            open_campaign=self.open_campaign_at,
+        )
+        return self.chat_interface_ui
+
+    def close_chat_interface(self):
+        """Cancel the open game's turn and remove its chat interface; returns its engine (still to be closed)."""
+        chat_ui, self.chat_interface_ui = self.chat_interface_ui, None
+        if chat_ui is None:
+            return None
+        chat_ui.close()
+        return chat_ui.engine
+
+    @staticmethod
+    def close_engine(engine):
+        """Save any turns still pending and close a game's engine (runs on a worker thread)."""
+        engine.save_chat_history()
+        engine.close()
+
+    def open_campaign_at(self, campaign_id, turn_id):
+        """Load another saved game (from a history search result) and jump to one of its turns."""
+        save_file = os.path.join("saves", f"{campaign_id}.json")
+        previous_engine = self.close_chat_interface()
+
+        def on_loaded(loaded):
+            self.open_saved_game(loaded)
+            if self.chat_interface_ui is not None:
+                self.chat_interface_ui.jump_to_turn(turn_id)
+
+        self.task_runner.submit(
+            self.read_saved_game, save_file, previous_engine,
+            on_done=on_loaded,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to load the game: {e}"),
+        )
+
     def add_start_menu_options(self):
         """Add New Game and Load Game options to the Start Game tab."""
-        # Add an image at the top of the tab
-        try:
-            image_path = "pictures/through_the_forest.webp"  # Update this with your image path
-            img = Image.open(image_path)
-            img = img.resize((600, 600))  # Resize as needed
-            photo = ImageTk.PhotoImage(img)
-
-            image_label = ttk.Label(self.start_frame, image=photo)
-            image_label.image = photo  # Keep a reference to avoid garbage collection
-            image_label.pack(pady=10)
-        except Exception as e:
-            print(f"Error loading image: {e}")
-
+        # Add an image at the top of the tab. It is decoded on a worker thread (and cached as a
+        # thumbnail on disk) so the window appears first.
+        image_label = ttk.Label(self.start_frame)
+        image_label.pack(pady=10)
+        image_path = "pictures/through_the_forest.webp"  # Update this with your image path
+        get_asset_cache(self.root).get_photo(image_path, (600, 600),  # Resize as needed
+                                             lambda photo: self.show_banner(image_label, photo))
 
         start_label = ttk.Label(self.start_frame, text="Welcome to DungeonGPT!", font=("Helvetica", 16))
         start_label.pack(pady=20)
@@ -92,6 +179,13 @@ class DungeonGPT:
         load_game_button = ttk.Button(self.start_frame, text="Load Game", command=self.load_existing_game)
         load_game_button.pack(pady=10)
 
+    def show_banner(self, image_label, photo):
+        """Show the decoded banner image."""
+        if photo is None:
+            return
+        image_label.configure(image=photo)
+        image_label.image = photo  # Keep a reference to avoid garbage collection
+
     def start_new_game(self):
         """Navigate to the character creation tab."""
         self.notebook.select(self.create_frame)
@@ -108,36 +202,53 @@ class DungeonGPT:
         if not file_path:
             return  # User canceled
 
-        # Load the saved game
-        try:
-            with open(file_path, "r") as f:
-                saved_game = json.load(f)
+        # Close the open game, then read the save and chat files on a worker thread
+        previous_engine = self.close_chat_interface()
+        self.task_runner.submit(
+            self.read_saved_game, file_path, previous_engine,
+            on_done=self.open_saved_game,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to load the game: {e}"),
+        )
+
+    def read_saved_game(self, file_path, previous_engine=None):
+        """Read a save file and its chat history from disk (runs on a worker thread).
+
+        The previously open game's engine is closed first, so reopening the same game sees all its turns.
+        """
+        if previous_engine is not None:
+            self.close_engine(previous_engine)
+        from persistence import load_json
+        saved_game = load_json(file_path)  # Falls back to the newest valid checkpoint
+
+        # print("Loaded party members and settings.")
+        chat_file = saved_game.get("chat_file", None)
+        # print(f"The chat file is: {chat_file}")
+        # print(f"Chat file exists? {os.path.exists(chat_file)}")
+
+        # Load chat history if chat file exists, streaming the turns from the journal (or the campaign store)
+        chat_history = []
+        if chat_file:
+            from campaign_engine import iter_campaign_history
+            chat_history = list(iter_campaign_history(chat_file))
 
+        # print("Chat history loaded")
+        # print(chat_history)
+        return saved_game, chat_history
+
+    def open_saved_game(self, loaded):
+        """Build the chat interface for a loaded game (runs on the Tk thread)."""
+        saved_game, chat_history = loaded
+        try:
             # Assume saved_game includes characters, settings, and conversation history
             party_members = saved_game.get("party_members", [])
             settings = saved_game.get("settings", {})
-
-            # print("Loaded party members and settings.")
             chat_file = saved_game.get("chat_file", None)
-            # print(f"The chat file is: {chat_file}")
-            # print(f"Chat file exists? {os.path.exists(chat_file)}")
 
             # Pass data to the chat interface
-            self.chat_interface_ui = ChatInterfaceUI(
-                self.chat_frame, party_members=party_members, settings=settings, chat_file=chat_file
-            )
+            self.create_chat_interface(party_members, settings, chat_file)
 
             # print("Chat interface UI created")
 
-            # Load chat history if chat file exists
-            chat_history = []
-            if chat_file and os.path.exists(chat_file):
-                with open(chat_file, "r") as f:
-                    chat_history = json.load(f)
-
-            # print("Chat history loaded")
-            # print(chat_history)
-
             self.chat_interface_ui.load_conversation(chat_history)
 
             # Navigate to the chat interface tab
@@ -147,18 +258,20 @@ class DungeonGPT:
 
     def update_party_tab(self):
         """Update the party selection tab."""
-        self.party_ui.update_characters()
+        if self.party_ui is not None:  # Otherwise it reads the latest characters when first built
+            self.party_ui.update_characters()
 
     def open_settings_tab(self, selected_party=None):
         """Open the settings tab with the selected party."""
+        self.build_settings_tab()
         self.notebook.select(self.settings_frame)
         self.settings_ui.party_members = selected_party        # Pass the selected party to the chat interface
 
     def initialize_chat_tab(self, save_file):
         """Initialize the chat interface after settings are saved."""
         # Load settings and party members from the save file
-        with open(save_file, "r") as f:
-            save_data = json.load(f)
+        from persistence import load_json
+        save_data = load_json(save_file)
 
         print("opened saved party file:")
         print(save_file)
@@ -169,7 +282,7 @@ class DungeonGPT:
         # print(f"The chat file is: {chat_file}")
 
         # Initialize the chat interface with both settings and party
-        self.chat_interface_ui = ChatInterfaceUI(self.chat_frame, party_members, settings, chat_file)
+        self.create_chat_interface(party_members, settings, chat_file)
 
         # Switch to the chat tab
         self.notebook.select(self.chat_frame)
@@ -182,8 +295,23 @@ class DungeonGPT:
 
 
 def main():
-    root = tk.Tk()
-    app = DungeonGPT(root)
+    # --eager builds every tab up front instead of on first use
+    eager = "--eager" in sys.argv or os.environ.get("DUNGEONGPT_EAGER_TABS") == "1"
+
+    timer = PhaseTimer(start=STARTUP_T0)
+    timer.record("imports", IMPORTS_DONE - STARTUP_T0)
+    with timer.phase("tk root"):
+        root = tk.Tk()
+    app = DungeonGPT(root, eager=eager, timer=timer)
+    built = time.perf_counter()
+
+    def report_startup():
+        root.update_idletasks()
+        timer.record("first frame", time.perf_counter() - built)
+        print(timer.report("Startup time (eager)" if eager else "Startup time"))
+        timer.reported = True  # Tabs built later are reported as they are built
+    root.after_idle(report_startup)
+
     root.mainloop()
 
 if __name__ == "__main__":
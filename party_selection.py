@@ -1,22 +1,67 @@
 import os
-import json
 import tkinter as tk
 from tkinter import ttk, messagebox
+from task_runner import get_task_runner
+from campaign_store import get_store
+from character_catalogue import CharacterCatalogue
+from asset_cache import get_asset_cache
 
 class PartySelectionUI:
+    THUMBNAIL_SIZE = (159, 198)  # Half the size of the profile pictures
+    MAX_COLUMNS = 4
+    CELL_WIDTH = 190
+    CELL_HEIGHT = 270
+    VIEW_HEIGHT = 800
+
     def __init__(self, parent_frame, char_path="characters/", on_party_selected=None):
         self.char_path = char_path
         self.parent_frame = parent_frame
         self.on_party_selected = on_party_selected
-        self.character_grid = ttk.Frame(parent_frame)
-        self.character_grid.grid(row=0, column=0, padx=10, pady=10)
+        self.task_runner = get_task_runner(parent_frame)
+        self.catalogue = CharacterCatalogue(char_path, store=get_store())
+        self.assets = get_asset_cache(parent_frame)
 
-        self.party_selection = []
+        self.party_selection = {}  # character ID -> BooleanVar; survives scrolling and filtering
         self.selected_party = []
 
+        # Search index: character ID -> lower-case "name race class level N alignment"
+        self.search_text = {}
+        self.ordered_ids = []    # every character ID in display order
+        self.filtered_ids = []   # IDs matching the current filter, in display order
+        self.last_query = None   # query filtered_ids was built for; None forces a full refilter
+        self.shown_query = None  # query the grid is scrolled for
+
+        # Search bar
+        search_frame = ttk.Frame(parent_frame)
+        search_frame.grid(row=0, column=0, padx=10, pady=(10, 0), sticky="ew")
+        ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        ttk.Entry(search_frame, textvariable=self.search_var, width=40).pack(side=tk.LEFT, padx=5)
+        self.count_label = ttk.Label(search_frame, text="")
+        self.count_label.pack(side=tk.LEFT, padx=5)
+        self.search_var.trace_add("write", lambda *args: self.apply_filter())
+
+        # Virtualised grid: only the rows in view have widgets, which are reused as the view scrolls
+        grid_frame = ttk.Frame(parent_frame)
+        grid_frame.grid(row=1, column=0, padx=10, pady=10)
+        self.character_grid = tk.Canvas(grid_frame, width=self.CELL_WIDTH * self.MAX_COLUMNS,
+                                        height=self.VIEW_HEIGHT, highlightthickness=0,
+                                        yscrollincrement=self.CELL_HEIGHT // 4)
+        self.scrollbar = ttk.Scrollbar(grid_frame, orient="vertical", command=self.character_grid.yview)
+        self.character_grid.configure(yscrollcommand=self.on_grid_scroll)
+        self.character_grid.grid(row=0, column=0)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.character_grid.bind("<Configure>", lambda e: self.schedule_redraw())
+        self.character_grid.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.character_grid.bind("<Button-4>", lambda e: self.character_grid.yview_scroll(-1, "units"))
+        self.character_grid.bind("<Button-5>", lambda e: self.character_grid.yview_scroll(1, "units"))
+
+        self.cells = []  # pooled cell widgets
+        self.redraw_scheduled = False
+
         # Add a button to confirm selection
         confirm_btn = ttk.Button(parent_frame, text="Confirm Party", command=self.confirm_party)
-        confirm_btn.grid(row=1, column=0, pady=10)
+        confirm_btn.grid(row=2, column=0, pady=10)
 
         self.load_characters_to_grid()
 
@@ -25,70 +70,158 @@ class PartySelectionUI:
         self.load_characters_to_grid()
 
     def load_characters_to_grid(self):
-        """Load and display characters in the grid."""
-        # Clear previous grid
-        for widget in self.character_grid.winfo_children():
-            widget.destroy()
-
-        files = [f for f in os.listdir(self.char_path) if f.endswith(".json")]
-
-        row, col = 0, 0
-        max_columns = 4  # Adjust as needed
-
-        for file in files:
-            try:
-                with open(os.path.join(self.char_path, file), "r") as f:
-                    character = json.load(f)
-
-                # Create a frame for each character
-                char_frame = ttk.Frame(self.character_grid, relief="ridge", padding=5)
-                char_frame.grid(row=row, column=col, padx=5, pady=5, sticky=tk.NSEW)
-
-                # Load and display picture
-                profile_pic_path = character.get("profile_pic")
-                if profile_pic_path and os.path.exists(profile_pic_path):
-                    try:
-                        img = tk.PhotoImage(file=profile_pic_path)
-                        # Resize the image if needed
-                        img = img.subsample(2, 2)  # Adjust scaling factor as required
-                        pic_label = ttk.Label(char_frame, image=img)
-                        pic_label.image = img  # Keep a reference to avoid garbage collection
-                        pic_label.grid(row=0, column=0)
-                    except Exception as e:
-                        print(f"Error loading image {profile_pic_path}: {e}")
-                        ttk.Label(char_frame, text="No Image").grid(row=0, column=0)
-                else:
-                    ttk.Label(char_frame, text="No Image").grid(row=0, column=0)
-
-
-
-                # Display name
-                name_label = ttk.Label(char_frame, text=character["name"])
-                name_label.grid(row=1, column=0)
-
-                # Add a checkbox for selection
-                selected_var = tk.BooleanVar()
-                checkbox = ttk.Checkbutton(char_frame, variable=selected_var)
-                checkbox.grid(row=2, column=0)
-
-                # Track the selection state
-                self.party_selection.append((character, selected_var))
-
-                # Manage grid layout
-                col += 1
-                if col >= max_columns:
-                    col = 0
-                    row += 1
-            except Exception as e:
-                print(f"Error loading character from {file}: {e}")
+        """Refresh the catalogue in the background (only changed files are read), then update the grid."""
+        self.task_runner.submit(self.catalogue.scan, on_done=self.apply_changes)
+
+    def apply_changes(self, result):
+        """Adopt the refreshed catalogue, update the search index for changed characters, then refilter and redraw."""
+        entries, (added, changed, removed) = result
+        self.catalogue.entries = entries  # Swapped in on the Tk thread, which is the only reader
+
+        for char_id in removed:
+            self.search_text.pop(char_id, None)
+            self.party_selection.pop(char_id, None)
+
+        # Changed characters, plus everything already in the persisted index on the first load
+        changed = set(changed)
+        for char_id in list(self.catalogue.entries):
+            if char_id in changed or char_id not in self.search_text:
+                entry = self.catalogue.get(char_id)
+                self.search_text[char_id] = " ".join([
+                    str(entry.get("name") or ""), str(entry.get("race") or ""), str(entry.get("class") or ""),
+                    f"level {entry.get('level')}", str(entry.get("alignment") or ""),
+                ]).lower()
+
+        # Cells showing a changed character must be redrawn
+        for cell in self.cells:
+            if cell["char_id"] in changed:
+                cell["char_id"] = None
+
+        self.ordered_ids = self.catalogue.sorted_ids()
+        self.last_query = None  # Force a full refilter
+        self.apply_filter()
+
+    def apply_filter(self):
+        """Filter characters by every word in the search box (name, race, class, level, alignment)."""
+        query = self.search_var.get().strip().lower()
+        terms = query.split()
+
+        # Typing more characters can only narrow the results, so filter the previous matches
+        if self.last_query is not None and query.startswith(self.last_query):
+            candidates = self.filtered_ids
+        else:
+            candidates = self.ordered_ids
+        search_text = self.search_text
+        self.filtered_ids = [char_id for char_id in candidates
+                             if char_id in search_text and all(t in search_text[char_id] for t in terms)]
+        self.last_query = query
+
+        self.count_label.configure(text=f"{len(self.filtered_ids)} of {len(search_text)} characters")
+        rows = (len(self.filtered_ids) + self.MAX_COLUMNS - 1) // self.MAX_COLUMNS
+        self.character_grid.configure(scrollregion=(0, 0, self.CELL_WIDTH * self.MAX_COLUMNS,
+                                                    max(rows * self.CELL_HEIGHT, 1)))
+        # Only a new search jumps back to the top; a refresh of the catalogue keeps the scroll position
+        if query != self.shown_query:
+            self.shown_query = query
+            self.character_grid.yview_moveto(0)
+        self.redraw()
+
+    def on_grid_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.schedule_redraw()
+
+    def on_mouse_wheel(self, event):
+        self.character_grid.yview_scroll(-1 if event.delta > 0 else 1, "units")
+
+    def schedule_redraw(self):
+        if not self.redraw_scheduled:
+            self.redraw_scheduled = True
+            self.character_grid.after_idle(self.redraw)
+
+    def redraw(self):
+        """Show the characters in the visible rows, reusing pooled cells."""
+        self.redraw_scheduled = False
+        top = self.character_grid.canvasy(0)
+        height = max(self.character_grid.winfo_height(), self.VIEW_HEIGHT)
+        first_row = int(top // self.CELL_HEIGHT)
+        last_row = int((top + height) // self.CELL_HEIGHT) + 1
+
+        first = first_row * self.MAX_COLUMNS
+        visible = self.filtered_ids[first:last_row * self.MAX_COLUMNS]
+
+        while len(self.cells) < len(visible):
+            self.cells.append(self.create_cell())
+
+        for i, cell in enumerate(self.cells):
+            if i < len(visible):
+                position = first + i
+                x = (position % self.MAX_COLUMNS) * self.CELL_WIDTH
+                y = (position // self.MAX_COLUMNS) * self.CELL_HEIGHT
+                self.character_grid.coords(cell["window"], x, y)
+                self.character_grid.itemconfigure(cell["window"], state="normal")
+                self.show_in_cell(cell, visible[i])
+            else:
+                self.character_grid.itemconfigure(cell["window"], state="hidden")
+
+    def create_cell(self):
+        """Create one reusable cell: picture, name, details and a selection checkbox."""
+        char_frame = ttk.Frame(self.character_grid, relief="ridge", padding=5,
+                               width=self.CELL_WIDTH - 10, height=self.CELL_HEIGHT - 10)
+        char_frame.grid_propagate(False)
+        char_frame.grid_columnconfigure(0, weight=1)
+
+        pic_label = ttk.Label(char_frame, text="No Image")
+        pic_label.grid(row=0, column=0)
+
+        # Display name
+        name_label = ttk.Label(char_frame)
+        name_label.grid(row=1, column=0)
+        details_label = ttk.Label(char_frame)
+        details_label.grid(row=2, column=0)
+
+        # Add a checkbox for selection
+        checkbox = ttk.Checkbutton(char_frame)
+        checkbox.grid(row=3, column=0)
+
+        window = self.character_grid.create_window(0, 0, window=char_frame, anchor="nw")
+        return {"window": window, "frame": char_frame, "pic": pic_label, "name": name_label,
+                "details": details_label, "checkbox": checkbox, "char_id": None}
+
+    def show_in_cell(self, cell, char_id):
+        """Point a pooled cell at a character."""
+        if cell["char_id"] == char_id:
+            return
+        cell["char_id"] = char_id
+        character = self.catalogue.get(char_id)
+        cell["name"].configure(text=character["name"])
+        cell["details"].configure(text=f"Level {character.get('level')} {character.get('race') or ''} "
+                                       f"{character.get('class') or ''}")
+
+        # Selection lives in party_selection, not in the widget, so it survives reuse
+        if char_id not in self.party_selection:
+            self.party_selection[char_id] = tk.BooleanVar()
+        cell["checkbox"].configure(variable=self.party_selection[char_id])
+
+        # Load and display picture (decoded once, in the background, and shared with the other tabs)
+        cell["pic"].configure(image="", text="No Image")
+        cell["pic"].image = None
+        profile_pic_path = character.get("profile_pic")
+        if profile_pic_path and os.path.exists(profile_pic_path):
+            self.assets.get_photo(profile_pic_path, self.THUMBNAIL_SIZE,
+                                  lambda img: self.set_cell_image(cell, char_id, img))
+
+    def set_cell_image(self, cell, char_id, img):
+        """Show a decoded thumbnail, unless the cell has since been reused for another character."""
+        if cell["char_id"] != char_id or img is None:
+            return
+        cell["pic"].configure(image=img, text="")
+        cell["pic"].image = img  # Keep a reference to avoid garbage collection
 
     def confirm_party(self):
-         # Get selected characters
-        selected_files = [os.path.join(self.char_path, f"{char['name']}_Level_{char['level']}_{char['class']}.json")
-                                       #char["name"] + "_Level_" + char["level"] + "_" + char["class"] + ".json")
-                          for char, var in self.party_selection if var.get()]
-
-       #  "{char_path}{name}_Level_{level}_{char_class}.json"
+         # Get selected characters, using the real file path of each one
+        selected_files = [self.catalogue.path(char_id)
+                          for char_id, var in self.party_selection.items()
+                          if var.get() and self.catalogue.get(char_id)]
 
         if len(selected_files) != 4:
             messagebox.showwarning("Selection Error", "Please select exactly 4 characters.")
@@ -104,4 +237,4 @@ class PartySelectionUI:
 
         # Invoke the callback only if it is set
         if self.on_party_selected is not None:
-            self.on_party_selected(self.selected_party)
\ No newline at end of file
+            self.on_party_selected(self.selected_party)
@@ -0,0 +1,215 @@
+# persistence.py
+# Crash-safe file writes. Files are written to a temp file in the same directory, fsynced and renamed
+# over the target, so a crash leaves either the old or the new version, never a truncated one.
+# Important files also keep a small ring of previous versions ("<file>.ckpt1" is the newest), and
+# load_json() falls back to the newest checkpoint that still parses.
+#
+# WriteBehind queues writes to a background thread. It coalesces bursts (only the latest content
+# for a path is written) so disk latency stays off the UI thread and the turn loop.
+
+import atexit
+import json
+import os
+import shutil
+import threading
+import time
+
+CHECKPOINTS = 3  # Previous versions kept for save files and summaries
+
+
+def checkpoint_path(path, n):
+    return f"{path}.ckpt{n}"
+
+
+def fsync_directory(directory):
+    """Make a rename durable (not supported on Windows, where it is a no-op)."""
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def commit_file(tmp_path, path, checkpoints=0):
+    """Atomically move a fully written, fsynced temp file over path, keeping the old version in the ring."""
+    if checkpoints and os.path.exists(path):
+        for n in range(checkpoints, 1, -1):
+            if os.path.exists(checkpoint_path(path, n - 1)):
+                os.replace(checkpoint_path(path, n - 1), checkpoint_path(path, n))
+        try:
+            os.link(path, checkpoint_path(path, 1))  # path stays in place until the replace below
+        except OSError:
+            shutil.copy2(path, checkpoint_path(path, 1))
+    os.replace(tmp_path, path)
+    fsync_directory(os.path.dirname(path))
+
+
+def write_temp(path, data):
+    """Write text or bytes to a fsynced temp file next to path; returns the temp file's path."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    mode = "wb" if isinstance(data, bytes) else "w"
+    try:
+        with open(tmp_path, mode, **({} if mode == "wb" else {"encoding": "utf-8"})) as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+def atomic_write(path, data, checkpoints=0):
+    """Write text or bytes to path crash-safely (temp file, fsync, rename)."""
+    tmp_path = write_temp(path, data)
+    try:
+        commit_file(tmp_path, path, checkpoints)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def create_unique(paths, data):
+    """Write data crash-safely to the first of paths that doesn't exist yet and return that path.
+
+    The data goes to a fsynced temp file, which is hard-linked to each name in turn. Linking fails if
+    the name exists, so an existing file is never replaced and concurrent writers never pick the same
+    name.
+    """
+    paths = iter(paths)
+    path = next(paths)
+    tmp_path = write_temp(path, data)
+    try:
+        while True:
+            try:
+                os.link(tmp_path, path)
+                break
+            except FileExistsError:
+                path = next(paths)
+    finally:
+        os.remove(tmp_path)
+    fsync_directory(os.path.dirname(path))
+    return path
+
+
+def write_json(path, obj, checkpoints=0, indent=4):
+    atomic_write(path, json.dumps(obj, indent=indent), checkpoints)
+
+
+def load_json(path, checkpoints=CHECKPOINTS, validate=None):
+    """Read a JSON file, falling back to its newest valid checkpoint if it is missing or damaged.
+
+    validate(data) may reject a document that parses but is unusable. Raises the original error
+    if no version can be read.
+    """
+    first_error = None
+    for n, candidate in enumerate([path] + [checkpoint_path(path, n) for n in range(1, checkpoints + 1)]):
+        try:
+            with open(candidate, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if validate is not None and not validate(data):
+                raise ValueError(f"{candidate} is not a valid document")
+        except (OSError, ValueError) as e:
+            if first_error is None:
+                first_error = e
+            continue
+        if n:
+            print(f"Recovered {path} from checkpoint {candidate}")
+        return data
+    raise first_error
+
+
+class WriteBehind:
+    """Background writer. A path's pending write is replaced by a newer one until it is written."""
+
+    def __init__(self, delay=0.25):
+        self.delay = delay   # seconds to wait for more writes to the same path before writing
+        self.pending = {}    # path -> (produce, checkpoints, callbacks, first queued time)
+        self._condition = threading.Condition()
+        self._writing = 0
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, path, produce, checkpoints=0, on_done=None, on_error=None):
+        """Queue a write. produce() returns the text (or bytes) and runs on the writer thread.
+
+        on_done() / on_error(e) are called on the writer thread once this or a later write to the
+        same path has finished.
+        """
+        with self._condition:
+            previous = self.pending.get(path)
+            callbacks = previous[2] if previous else []
+            callbacks.append((on_done, on_error))
+            self.pending[path] = (produce, checkpoints, callbacks, previous[3] if previous else time.monotonic())
+            self._condition.notify()
+
+    def write_json(self, path, obj, checkpoints=0, indent=4, on_done=None, on_error=None):
+        """Queue obj to be written as JSON (it is serialised when written, so pass a snapshot)."""
+        self.submit(path, lambda: json.dumps(obj, indent=indent), checkpoints, on_done, on_error)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self.pending:
+                    self._condition.wait()
+                path, (produce, checkpoints, callbacks, queued) = min(self.pending.items(),
+                                                                      key=lambda item: item[1][3])
+                wait = queued + self.delay - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)  # Let a burst of writes to this path coalesce
+                    continue
+                del self.pending[path]
+                self._writing += 1
+            try:
+                atomic_write(path, produce(), checkpoints)
+                error = None
+            except Exception as e:
+                print(f"Error writing {path}: {e}")
+                error = e
+            for on_done, on_error in callbacks:
+                try:
+                    if error is None and on_done:
+                        on_done()
+                    elif error is not None and on_error:
+                        on_error(error)
+                except Exception as e:
+                    print(f"Error in write callback for {path}: {e}")
+            with self._condition:
+                self._writing -= 1
+                self._condition.notify_all()
+
+    def flush(self, timeout=10.0):
+        """Write everything queued now, waiting up to timeout seconds. Returns True when done."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            for path, (produce, checkpoints, callbacks, _) in self.pending.items():
+                self.pending[path] = (produce, checkpoints, callbacks, 0.0)  # Due immediately
+            self._condition.notify_all()
+            while self.pending or self._writing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+
+_write_behind = None
+_write_behind_lock = threading.Lock()
+
+
+def get_write_behind():
+    """The shared background writer; anything still queued is written at exit."""
+    global _write_behind
+    with _write_behind_lock:
+        if _write_behind is None:
+            _write_behind = WriteBehind()
+            atexit.register(_write_behind.flush)
+        return _write_behind
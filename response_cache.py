@@ -0,0 +1,119 @@
+# response_cache.py
+# Opt-in on-disk cache of LLM responses, keyed by a hash of everything that determines the output
+# (messages, model, temperature, max_tokens). Entries expire after a TTL and the cache is kept under
+# a size limit by evicting the least recently used entries.
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class ResponseCache:
+    def __init__(self, directory="cache/responses", max_bytes=200 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl  # seconds; None keeps entries until they are evicted
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        # key -> [size, last_access]; the file's mtime doubles as its last access time
+        self._index = {}
+        self._total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                self._index[entry.name[:-5]] = [stat.st_size, stat.st_mtime]
+                self._total_bytes += stat.st_size
+
+    @staticmethod
+    def make_key(messages, model, temperature, max_tokens, **extra):
+        """Hash the request parameters that determine the response."""
+        payload = json.dumps(
+            {"messages": messages, "model": model, "temperature": temperature, "max_tokens": max_tokens, **extra},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        """Return the cached response text, or None on a miss."""
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            if self.ttl is not None and time.time() - data.get("created", 0) > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            now = time.time()
+            os.utime(path, (now, now))
+            self._index[key][1] = now
+            self.hits += 1
+            return data["content"]
+
+    def put(self, key, content, model=None):
+        """Store a response and evict old entries if the cache is over its size limit."""
+        data = json.dumps({"created": time.time(), "model": model, "content": content})
+        with self._lock:
+            path = self._path(key)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+            if key in self._index:
+                self._total_bytes -= self._index[key][0]
+            size = os.path.getsize(path)
+            self._index[key] = [size, time.time()]
+            self._total_bytes += size
+            self._evict()
+
+    def _remove(self, key):
+        size, _ = self._index.pop(key)
+        self._total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._index):
+                self._remove(key)
+
+    def stats(self):
+        """Return hit/miss counters and the current cache size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+            }
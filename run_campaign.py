@@ -0,0 +1,99 @@
+# run_campaign.py
+# Play a campaign from the command line, without a display. Player inputs come from a script file
+# (one per line), and every turn is written to the usual save and chat files, so the campaign can
+# later be opened in the app.
+#
+#   python run_campaign.py --party characters/a.json characters/b.json --script inputs.txt --backend fake
+#   python run_campaign.py --save saves/game_2025-01-01_12-00-00.json --script more_inputs.txt
+
+import argparse
+import sys
+import time
+
+from campaign_engine import DEFAULT_SETTINGS, CampaignEngine, create_save_file
+from history_search import get_history_search
+from turn_metrics import STAGES, MetricsLog, format_ms
+
+
+def read_script(path):
+    """Player inputs from a script file ("-" for stdin). Blank lines and lines starting with # are skipped."""
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def parse_setting(text):
+    """"key=value" -> (key, value), with true/false turned into booleans."""
+    key, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Expected key=value, got '{text}'")
+    if value.lower() in ("true", "false"):
+        value = value.lower() == "true"
+    return key.strip(), value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a DungeonGPT campaign from a script of player inputs.")
+    game = parser.add_mutually_exclusive_group(required=True)
+    game.add_argument("--save", help="continue the saved game in this save file")
+    game.add_argument("--party", nargs="+", metavar="CHARACTER_FILE", help="start a new game with these characters")
+    parser.add_argument("--script", required=True, help="file with one player input per line (- for stdin)")
+    parser.add_argument("--setting", action="append", type=parse_setting, default=[], metavar="KEY=VALUE",
+                        help="game setting for a new game, e.g. difficulty=Hard (repeatable)")
+    parser.add_argument("--backend", help="LLM backend (openai, gemini, local, fake); defaults to the game's setting")
+    parser.add_argument("--saves-dir", default="saves", help="where new games are saved (default: saves)")
+    parser.add_argument("--metrics", metavar="FILE", help="append per-turn latency records (JSON lines) to FILE")
+    parser.add_argument("--no-retrieval", action="store_true",
+                        help="don't index turns for search or pull relevant older turns into the prompt")
+    parser.add_argument("--quiet", action="store_true", help="don't print the transcript")
+    args = parser.parse_args(argv)
+
+    inputs = read_script(args.script)
+
+    if args.save:
+        save_file = args.save
+    else:
+        settings = dict(DEFAULT_SETTINGS)
+        settings.update(args.setting)
+        if args.backend:
+            settings["backend"] = args.backend
+        save_file = create_save_file(args.party, settings, args.saves_dir)
+        print(f"New game saved to {save_file}")
+
+    engine = CampaignEngine.from_save_file(save_file, backend=args.backend)
+    if args.metrics:
+        engine.metrics = MetricsLog(args.metrics)
+    if not args.no_retrieval:
+        engine.search_index = get_history_search()
+        engine.index_turns()
+    print(f"Playing {len(inputs)} turns ({len(engine.conversation_history)} already played)")
+
+    def print_delta(delta):
+        sys.stdout.write(delta)
+        sys.stdout.flush()
+
+    started = time.perf_counter()
+    try:
+        for message in inputs:
+            if not args.quiet:
+                print(f"\nYou:\n    {message}\nDungeon Master:")
+            engine.play_turn(message, on_delta=None if args.quiet else print_delta)
+            if not args.quiet:
+                print()
+    finally:
+        engine.close()
+
+    print(f"\nPlayed {len(inputs)} turns in {time.perf_counter() - started:.1f}s; "
+          f"chat saved to {engine.chat_file}")
+    for name in STAGES + ("total",):
+        summary = engine.latency.summary(name)
+        if summary:
+            print(f"  {name:<10} p50 {format_ms(summary[0]):>7}  p95 {format_ms(summary[1]):>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,19 @@
 from datetime import datetime
 import os
-import json
 import tkinter as tk
 from tkinter import ttk, messagebox
+from task_runner import get_task_runner
+from llm_backends import BACKEND_CLASSES
+from usage_ledger import parse_budget
+from campaign_engine import register_campaign
+from persistence import CHECKPOINTS, get_write_behind, load_json
 
 class SettingsUI:
     def __init__(self, parent_frame, party_members, on_settings_saved=None):
         self.parent_frame = parent_frame
         self.party_members = party_members
         self.on_settings_saved = on_settings_saved  # Callback for when settings are saved
+        self.task_runner = get_task_runner(parent_frame)
 
         # Game Parameters
         self.difficulty_var = tk.StringVar(value="Medium")
@@ -19,6 +24,13 @@ class SettingsUI:
         self.narrative_style_var = tk.StringVar(value="Balanced")
         self.interaction_level_var = tk.StringVar(value="Balanced")
 
+        # AI backend (openai, gemini, a local OpenAI-compatible server, or the offline fake)
+        self.backend_var = tk.StringVar(value=os.environ.get("DUNGEONGPT_BACKEND", "openai"))
+
+        # Spending limits in USD (blank = no limit)
+        self.turn_budget_var = tk.StringVar(value=os.environ.get("DUNGEONGPT_TURN_BUDGET", ""))
+        self.campaign_budget_var = tk.StringVar(value=os.environ.get("DUNGEONGPT_CAMPAIGN_BUDGET", ""))
+
         # Create the UI
         self.create_ui()
 
@@ -46,9 +58,22 @@ class SettingsUI:
         ttk.Label(dm_style_frame, text="Interaction Level:").grid(row=1, column=0, sticky="w")
         ttk.Combobox(dm_style_frame, textvariable=self.interaction_level_var, values=["Minimal", "Balanced", "Story-Driven"]).grid(row=1, column=1, padx=5)
 
+        ttk.Label(dm_style_frame, text="AI Backend:").grid(row=2, column=0, sticky="w")
+        ttk.Combobox(dm_style_frame, textvariable=self.backend_var, values=list(BACKEND_CLASSES)).grid(row=2, column=1, padx=5)
+
+        # Budgets
+        budget_frame = ttk.LabelFrame(self.parent_frame, text="Budget (USD, blank for no limit)")
+        budget_frame.grid(row=2, column=0, padx=10, pady=10, sticky="nsew")
+
+        ttk.Label(budget_frame, text="Per Turn:").grid(row=0, column=0, sticky="w")
+        ttk.Entry(budget_frame, textvariable=self.turn_budget_var, width=10).grid(row=0, column=1, padx=5, sticky="w")
+
+        ttk.Label(budget_frame, text="Per Campaign:").grid(row=1, column=0, sticky="w")
+        ttk.Entry(budget_frame, textvariable=self.campaign_budget_var, width=10).grid(row=1, column=1, padx=5, sticky="w")
+
         # Save/Load Buttons
         buttons_frame = ttk.Frame(self.parent_frame)
-        buttons_frame.grid(row=2, column=0, padx=10, pady=10, sticky="nsew")
+        buttons_frame.grid(row=3, column=0, padx=10, pady=10, sticky="nsew")
 
         # Save settings
         save_button = ttk.Button(buttons_frame, text="Save & Proceed", command=self.save_game)
@@ -60,6 +85,12 @@ class SettingsUI:
 
     def save_game(self):
         """Save the current game settings and party."""
+        try:
+            turn_budget = parse_budget(self.turn_budget_var.get())
+            campaign_budget = parse_budget(self.campaign_budget_var.get())
+        except ValueError:
+            messagebox.showerror("Error", "Budgets must be amounts in USD, e.g. 0.05 or 10")
+            return
 
         # Generate a unique filename using a timestamp
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -82,6 +113,9 @@ class SettingsUI:
                 "permadeath": self.permadeath_var.get(),
                 "narrative_style": self.narrative_style_var.get(),
                 "interaction_level": self.interaction_level_var.get(),
+                "backend": self.backend_var.get(),
+                "turn_budget": turn_budget,
+                "campaign_budget": campaign_budget,
             },
             "chat_file": chat_file,
         }
@@ -91,18 +125,21 @@ class SettingsUI:
         # print("Chat file will go here : ")
         # print(save_data["chat_file"])
         # print("Now saving the settings....")
-        # Ensure save directory exists
-        os.makedirs("saves", exist_ok=True)
-
-        try:
-            with open(save_file, "w") as save_settings_file:
-                json.dump(save_data, save_settings_file, indent=4)
-
-
-            messagebox.showinfo("Success", f"Game settings saved successfully as {save_file}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save the game: {e}")
-
+        # Written crash-safely in the background; the callback fires once the file is on disk
+        get_write_behind().write_json(
+            save_file, save_data, checkpoints=CHECKPOINTS,
+            on_done=lambda: self.on_save_written(save_file, save_data),
+            on_error=lambda e: self.task_runner.call_soon(messagebox.showerror, "Error", f"Failed to save the game: {e}"),
+        )
+
+    def on_save_written(self, save_file, save_data):
+        """Register the new save with the campaign store, if any (runs on the writer thread)."""
+        register_campaign(save_file, save_data)
+        self.task_runner.call_soon(self.on_game_saved, save_file)
+
+    def on_game_saved(self, save_file):
+        """Confirm the save and move on to the chat tab."""
+        messagebox.showinfo("Success", f"Game settings saved successfully as {save_file}")
 
         # Save to file
         #with open(save_file, "w") as f:
@@ -126,8 +163,7 @@ class SettingsUI:
 
         # Load data
         try:
-            with open(save_file, "r") as f:
-                save_data = json.load(f)
+            save_data = load_json(save_file)
 
             # Apply settings
             settings = save_data.get("settings", {})
@@ -136,6 +172,9 @@ class SettingsUI:
             self.permadeath_var.set(settings.get("permadeath", False))
             self.narrative_style_var.set(settings.get("narrative_style", "Balanced"))
             self.interaction_level_var.set(settings.get("interaction_level", "Balanced"))
+            self.backend_var.set(settings.get("backend", os.environ.get("DUNGEONGPT_BACKEND", "openai")))
+            self.turn_budget_var.set(settings.get("turn_budget") or "")
+            self.campaign_budget_var.set(settings.get("campaign_budget") or "")
 
             # Update party members (Optional: Display in the UI)
             self.party_members = save_data.get("party_members", [])
@@ -0,0 +1,36 @@
+# startup_timer.py
+# Records how long each phase of application startup takes and prints a breakdown.
+
+import time
+from contextlib import contextmanager
+
+
+class PhaseTimer:
+    def __init__(self, start=None):
+        self.start = start if start is not None else time.perf_counter()
+        self.phases = []  # (name, seconds)
+        self.reported = False
+
+    def record(self, name, seconds):
+        self.phases.append((name, seconds))
+        if self.reported:
+            print(f"{name}: {seconds * 1000:.1f} ms")
+
+    @contextmanager
+    def phase(self, name):
+        """Time the body of a with-block as one phase."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0)
+
+    def report(self, title="Startup time"):
+        """Return the per-phase breakdown and the total since start as text."""
+        total = time.perf_counter() - self.start
+        width = max([len(name) for name, _ in self.phases] + [5])
+        lines = [f"{title}:"]
+        for name, seconds in self.phases:
+            lines.append(f"  {name:<{width}}  {seconds * 1000:8.1f} ms")
+        lines.append(f"  {'total':<{width}}  {total * 1000:8.1f} ms")
+        return "\n".join(lines)
@@ -0,0 +1,76 @@
+# task_runner.py
+# Runs slow work (network calls, disk I/O) on background threads so the Tk mainloop stays responsive.
+# Results are handed back through a thread-safe queue that is drained on the Tk thread via root.after().
+
+import queue
+import threading
+import traceback
+
+
+class TaskRunner:
+    def __init__(self, root, num_workers=4, poll_ms=30):
+        self.root = root
+        self.poll_ms = poll_ms
+
+        self._tasks = queue.Queue()    # work waiting for a worker thread
+        self._results = queue.Queue()  # (callback, args) waiting for the Tk thread
+
+        # Worker threads are daemons so a hung network call never blocks closing the window
+        self._workers = []
+        for i in range(num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"TaskRunner-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+        self._poll()
+
+    def submit(self, func, *args, on_done=None, on_error=None, **kwargs):
+        """Run func(*args, **kwargs) on a worker thread; callbacks are invoked on the Tk thread."""
+        self._tasks.put((func, args, kwargs, on_done, on_error))
+
+    def call_soon(self, callback, *args):
+        """Schedule callback(*args) on the Tk thread. Safe to call from any thread."""
+        self._results.put((callback, args))
+
+    def _worker_loop(self):
+        while True:
+            func, args, kwargs, on_done, on_error = self._tasks.get()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if on_error:
+                    self._results.put((on_error, (e,)))
+                else:
+                    print(f"Background task {getattr(func, '__name__', func)} failed: {e}")
+                    traceback.print_exc()
+            else:
+                if on_done:
+                    self._results.put((on_done, (result,)))
+
+    def _poll(self):
+        """Drain finished results on the Tk thread, then reschedule."""
+        while True:
+            try:
+                callback, args = self._results.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error in task callback: {e}")
+                traceback.print_exc()
+
+        try:
+            self.root.after(self.poll_ms, self._poll)
+        except Exception:
+            pass  # The window has been destroyed
+
+
+def get_task_runner(widget):
+    """Return the TaskRunner shared by every tab under widget's toplevel window."""
+    root = widget.winfo_toplevel()
+    runner = getattr(root, "_task_runner", None)
+    if runner is None:
+        runner = TaskRunner(root)
+        root._task_runner = runner
+    return runner
@@ -0,0 +1,138 @@
+# turn_metrics.py
+# Per-turn latency tracing. A TurnTrace collects how long each stage of a turn took (prompt building,
+# time to first token, generation, rendering, saving) plus the token counts from the response usage.
+# Finished traces are appended as JSON lines to a rotating metrics file and summarised as p50/p95
+# over the session for the chat tab's HUD.
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+# Stages in the order they happen in a turn
+STAGES = ("prompt", "ttft", "generation", "render", "save")
+
+DEFAULT_METRICS_FILE = "cache/metrics/turns.jsonl"
+
+
+class TurnTrace:
+    def __init__(self, session=None, turn_id=None):
+        self.session = session
+        self.turn_id = turn_id
+        self.started = time.perf_counter()
+        self.timestamp = time.time()
+        self.spans = {}  # stage -> seconds (repeated spans of a stage add up)
+        self.usage = {}
+        self._lock = threading.Lock()  # Spans are added from both the Tk thread and worker threads
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    @contextmanager
+    def span(self, name):
+        """Time the body of a with-block as (part of) a stage."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def finish(self, status="ok"):
+        """Return the trace as a JSON-ready record."""
+        with self._lock:
+            spans = {name: round(seconds * 1000, 2) for name, seconds in self.spans.items()}
+        record = {
+            "ts": round(self.timestamp, 3),
+            "session": self.session,
+            "turn": self.turn_id,
+            "status": status,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "spans_ms": spans,
+        }
+        if self.usage:
+            record["tokens"] = {key: self.usage.get(key, 0)
+                                for key in ("prompt_tokens", "cached_tokens", "completion_tokens")}
+            record["model"] = self.usage.get("model")
+        return record
+
+
+class MetricsLog:
+    """Appends turn records as JSON lines, rotating the file at max_bytes and keeping `backups` old files."""
+
+    def __init__(self, path=DEFAULT_METRICS_FILE, max_bytes=5 * 1024 * 1024, backups=3):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.logger = logging.getLogger(f"dungeongpt.metrics.{os.path.abspath(path)}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.handlers = [handler]
+
+    def write(self, record):
+        self.logger.info(json.dumps(record))
+
+
+_metrics_log = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics_log():
+    """The shared metrics log (DUNGEONGPT_METRICS_FILE, default cache/metrics/turns.jsonl)."""
+    global _metrics_log
+    with _metrics_lock:
+        if _metrics_log is None:
+            _metrics_log = MetricsLog(os.environ.get("DUNGEONGPT_METRICS_FILE", DEFAULT_METRICS_FILE))
+        return _metrics_log
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class LatencyStats:
+    """Per-stage latencies over a session, for p50/p95."""
+
+    def __init__(self):
+        self.samples = {}  # stage (or "total") -> list of ms
+
+    def add(self, record):
+        for name, ms in record["spans_ms"].items():
+            self.samples.setdefault(name, []).append(ms)
+        self.samples.setdefault("total", []).append(record["total_ms"])
+
+    def summary(self, name):
+        """(p50, p95) in ms for a stage, or None if there are no samples."""
+        values = self.samples.get(name)
+        if not values:
+            return None
+        return percentile(values, 0.5), percentile(values, 0.95)
+
+
+def format_ms(ms):
+    return f"{ms / 1000:.1f}s" if ms >= 1000 else f"{ms:.0f}ms"
+
+
+def format_hud(record, stats):
+    """Two lines for the HUD: the last turn's breakdown, then session p50/p95 per stage."""
+    spans = record["spans_ms"]
+    last = " · ".join(f"{name} {format_ms(spans[name])}" for name in STAGES if name in spans)
+    last = f"Last turn {format_ms(record['total_ms'])}: {last}"
+    tokens = record.get("tokens")
+    if tokens:
+        last += (f" | tokens {tokens['prompt_tokens']} in ({tokens['cached_tokens']} cached), "
+                 f"{tokens['completion_tokens']} out")
+
+    parts = []
+    for name in STAGES + ("total",):
+        summary = stats.summary(name)
+        if summary:
+            parts.append(f"{name} {format_ms(summary[0])}/{format_ms(summary[1])}")
+    return last + "\n" + f"p50/p95 over {len(stats.samples.get('total', []))} turns: " + " · ".join(parts)
@@ -0,0 +1,84 @@
+# turn_retrieval.py
+# Pulls older turns that matter for the new player message back into the prompt. The player's
+# message and the last turn are turned into a keyword query. That query is ranked with BM25 over the
+# campaign's full-text index (history_search), limited to turns older than the history window.
+# The best matches that fit a small token budget are added to the prompt in story order.
+
+import re
+from bisect import bisect_left
+
+from history_index import render_entry
+
+# Words too common to say anything about which turn is relevant
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers herself him himself his how i if in into is it its itself just let me more
+most my myself no nor not now of off on once only or other our ours ourselves out over own same she
+should so some such than that the their theirs them themselves then there these they this those
+through to too under until up very was we were what when where which while who whom why will with
+would you your yours yourself yourselves us shall may might must also yes okay ok go goes going went
+get gets got take takes took look looks see sees saw say says said tell told ask asks asked try tries
+""".split())
+
+WORD_RE = re.compile(r"[a-z0-9][a-z0-9']*")
+
+
+def keywords(text, limit=None):
+    """Distinct non-stopword words of text, in order of first appearance."""
+    words = []
+    seen = set()
+    for word in WORD_RE.findall(text.lower()):
+        word = word.strip("'")
+        if len(word) < 3 or word in STOPWORDS or word in seen:
+            continue
+        seen.add(word)
+        words.append(word)
+        if limit and len(words) >= limit:
+            break
+    return words
+
+
+def build_query(message, context="", max_terms=16):
+    """An FTS5 OR-query over the message's keywords, topped up with keywords from the recent context."""
+    terms = keywords(message, max_terms)
+    for word in keywords(context, max_terms):
+        if len(terms) >= max_terms:
+            break
+        if word not in terms:
+            terms.append(word)
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def retrieve_turns(search_index, campaign, history_index, message, window_start, max_tokens=1000, k=4):
+    """The top-k turns before history_index.entries[window_start] that fit in max_tokens, oldest first."""
+    entries = history_index.entries
+    if window_start <= 0 or not entries:
+        return []
+    context = render_entry(entries[-1])
+    query = build_query(message, context)
+    if query is None:
+        return []
+
+    chosen = []
+    used = 0
+    before_id = entries[window_start]["id"] if window_start < len(entries) else entries[-1]["id"] + 1
+    for turn_id in search_index.rank(query, campaign, before_id=before_id, limit=k * 3):
+        index = bisect_left(entries, turn_id, hi=window_start, key=lambda entry: entry["id"])
+        if index >= window_start or entries[index]["id"] != turn_id:
+            continue  # Indexed but not in this session's history
+        cost = history_index.token_prefix[index + 1] - history_index.token_prefix[index]
+        if used + cost > max_tokens:
+            continue
+        chosen.append(index)
+        used += cost
+        if len(chosen) >= k:
+            break
+    return [entries[index] for index in sorted(chosen)]
+
+
+def render_retrieved(entries):
+    """The prompt section for retrieved turns."""
+    return "Earlier turns that may be relevant now:\n\n" + "\n".join(render_entry(entry) for entry in entries)
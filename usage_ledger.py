@@ -0,0 +1,210 @@
+# usage_ledger.py
+# Token and cost accounting for a campaign. Every call made for a campaign (Dungeon Master turns and
+# chapter summaries) reports its prompt, cached and completion tokens to a UsageLedger, which prices
+# them and keeps running totals by model and by purpose in <chat file>_usage.json next to the save.
+# A Budget turns the per-turn and per-campaign limits from the game settings into a plan for the next
+# turn: a smaller history window, a shorter reply cap or a cheaper model as the limits are approached.
+
+import json
+import os
+import threading
+from collections import namedtuple
+
+from persistence import get_write_behind, load_json
+
+# USD per million tokens: (input, cached input, output). Models not listed (local ones) cost nothing.
+PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gemini-1.5-pro": (1.25, 0.3125, 5.00),
+    "gemini-1.5-flash": (0.075, 0.01875, 0.30),
+}
+
+# The cheaper model a budget falls back to
+DOWNGRADES = {"gpt-4o": "gpt-4o-mini", "gemini-1.5-pro": "gemini-1.5-flash"}
+
+TOKEN_FIELDS = ("prompt_tokens", "cached_tokens", "completion_tokens")
+
+
+def price_for(model):
+    """Prices for a model, matching dated variants (gpt-4o-2024-08-06) by the longest known prefix."""
+    if not model:
+        return None
+    if model in PRICES:
+        return PRICES[model]
+    matches = [name for name in PRICES if model.startswith(name)]
+    return PRICES[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    """Cost in USD of a call with these token counts (0 for unpriced models)."""
+    prices = price_for(model)
+    if not prices:
+        return 0.0
+    input_price, cached_price, output_price = prices
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+
+def usage_cost(usage):
+    """Cost in USD of one call's usage dict (see llm_backends.usage_to_dict)."""
+    return estimate_cost(usage.get("model"), usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0),
+                         usage.get("cached_tokens", 0))
+
+
+def usage_path(chat_file):
+    """Return the usage path for a chat file, e.g. saves/game_x_chat.json -> saves/game_x_chat_usage.json."""
+    base, _ = os.path.splitext(chat_file)
+    return base + "_usage.json"
+
+
+def empty_totals():
+    return {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+
+
+def add_to(totals, usage, cost):
+    totals["calls"] += 1
+    for field in TOKEN_FIELDS:
+        totals[field] += usage.get(field, 0) or 0
+    totals["cost"] += cost
+
+
+class UsageLedger:
+    """Running token and cost totals for one campaign. Calls are recorded from worker threads."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.totals = empty_totals()
+        self.by_model = {}    # model -> totals
+        self.by_purpose = {}  # "turn", "summary", ... -> totals
+        self.dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    @property
+    def cost(self):
+        return self.totals["cost"]
+
+    def record(self, usage, purpose="turn"):
+        """Add one call's usage; returns its cost."""
+        cost = usage_cost(usage)
+        with self._lock:
+            add_to(self.totals, usage, cost)
+            add_to(self.by_model.setdefault(usage.get("model") or "unknown", empty_totals()), usage, cost)
+            add_to(self.by_purpose.setdefault(purpose, empty_totals()), usage, cost)
+            self.dirty = True
+        return cost
+
+    def average_completion(self, purpose="turn", default=800):
+        """Average completion tokens per call for a purpose, for estimating the next call."""
+        totals = self.by_purpose.get(purpose)
+        if not totals or not totals["calls"]:
+            return default
+        return totals["completion_tokens"] / totals["calls"]
+
+    def summary(self):
+        totals = self.totals
+        return (f"${totals['cost']:.2f} over {totals['calls']} calls "
+                f"({totals['prompt_tokens']:,} tokens in, {totals['completion_tokens']:,} out)")
+
+    def load(self):
+        if self.path and os.path.exists(self.path):
+            try:
+                data = load_json(self.path, checkpoints=0)
+                self.totals.update(data.get("totals", {}))
+                self.by_model = data.get("by_model", {})
+                self.by_purpose = data.get("by_purpose", {})
+            except Exception as e:
+                print(f"Error loading usage ledger: {e}")
+
+    def save(self):
+        """Queue the ledger for writing if anything was recorded since the last save (write-behind)."""
+        if not self.path or not self.dirty:
+            return
+        get_write_behind().submit(self.path, self.dumps)
+
+    def dumps(self):
+        with self._lock:
+            self.dirty = False
+            return json.dumps({"totals": self.totals, "by_model": self.by_model, "by_purpose": self.by_purpose},
+                              indent=4)
+
+
+def parse_budget(value):
+    """A budget setting ("", None, "2.5", 2.5) as a positive float, or None for no limit."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    budget = float(value)
+    if budget < 0:
+        raise ValueError(f"Budget must not be negative, got {value}")
+    return budget or None
+
+
+# How a turn should be made: which model, how much history and how long a reply
+TurnPlan = namedtuple("TurnPlan", "model history_tokens max_tokens notes")
+
+
+class Budget:
+    WARN_FRACTION = 0.8       # Start saving once this much of a budget is used
+    MIN_HISTORY_TOKENS = 2000  # The history window never shrinks below this
+    MIN_REPLY_TOKENS = 512     # ...nor the reply cap below this
+
+    def __init__(self, per_turn=None, per_campaign=None):
+        self.per_turn = per_turn          # USD per turn, or None
+        self.per_campaign = per_campaign  # USD over the whole campaign, or None
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Budgets from the game settings, falling back to DUNGEONGPT_TURN_BUDGET / DUNGEONGPT_CAMPAIGN_BUDGET."""
+        return cls(
+            per_turn=parse_budget(settings.get("turn_budget", os.environ.get("DUNGEONGPT_TURN_BUDGET"))),
+            per_campaign=parse_budget(settings.get("campaign_budget", os.environ.get("DUNGEONGPT_CAMPAIGN_BUDGET"))),
+        )
+
+    def plan(self, ledger, model, history_tokens, max_tokens, fixed_tokens=0):
+        """Plan the next turn.
+
+        history_tokens is the history the prompt would carry and fixed_tokens the rest of the prompt
+        (system block, summaries, the new message). Near the campaign budget the model is downgraded,
+        and past it the history and reply are cut to the minimum. With a per-turn budget the reply is
+        capped at half of it, then the history window shrinks and finally the model is downgraded
+        until the expected cost fits.
+        """
+        notes = []
+
+        if self.per_campaign:
+            spent = ledger.cost
+            if spent >= self.per_campaign * self.WARN_FRACTION and model in DOWNGRADES:
+                model = DOWNGRADES[model]
+                notes.append(f"campaign budget {spent / self.per_campaign:.0%} used, using {model}")
+            if spent >= self.per_campaign:
+                history_tokens = min(history_tokens, self.MIN_HISTORY_TOKENS)
+                max_tokens = min(max_tokens, self.MIN_REPLY_TOKENS)
+                notes.append("campaign budget exceeded, minimal history")
+
+        if self.per_turn:
+            limit = self.per_turn * self.WARN_FRACTION
+            expected = ledger.average_completion()
+
+            def turn_cost(model, history_tokens, max_tokens):
+                return estimate_cost(model, fixed_tokens + history_tokens, min(expected, max_tokens))
+
+            prices = price_for(model)
+            if prices:
+                reply_cap = int(self.per_turn / 2 / prices[2] * 1_000_000)
+                if reply_cap < max_tokens:
+                    max_tokens = max(self.MIN_REPLY_TOKENS, reply_cap)
+
+            if turn_cost(model, history_tokens, max_tokens) > limit and prices:
+                output_cost = estimate_cost(model, 0, min(expected, max_tokens))
+                affordable = int((limit - output_cost) / prices[0] * 1_000_000) - fixed_tokens
+                shrunk = max(self.MIN_HISTORY_TOKENS, min(history_tokens, affordable))
+                if shrunk < history_tokens:
+                    history_tokens = shrunk
+                    notes.append(f"history window cut to {history_tokens} tokens")
+
+            if turn_cost(model, history_tokens, max_tokens) > limit and model in DOWNGRADES:
+                model = DOWNGRADES[model]
+                notes.append(f"turn budget, using {model}")
+
+        return TurnPlan(model, history_tokens, max_tokens, notes)